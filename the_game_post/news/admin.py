@@ -1,5 +1,95 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from .models import Article, ArticleBlock, Tag, Comment, Category
+from . import comments, search
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков админки без COUNT(*) по большим таблицам. Без фильтров
+    число строк берется из статистики PostgreSQL (на других СУБД - по
+    наибольшему id), с фильтрами считается не больше NEWS_ADMIN_COUNT_LIMIT
+    строк. Небольшие таблицы считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'NEWS_ADMIN_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self._estimate(queryset)
+            if estimate > limit:
+                return estimate
+        # COUNT по подзапросу с LIMIT: читается не больше limit + 1 строк
+        return queryset.order_by()[:limit + 1].count()
+
+    @staticmethod
+    def _estimate(queryset):
+        model = queryset.model
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+                row = cursor.fetchone()
+            # -1 - таблица еще не анализировалась
+            if row and row[0] >= 0:
+                return int(row[0])
+        return model._default_manager.using(queryset.db).aggregate(last=Max('pk'))['last'] or 0
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по внешнему ключу с полем автодополнения вместо списка всех
+    значений. Варианты подгружает стандартный autocomplete админки, поэтому
+    у админки связанной модели должны быть search_fields.
+    """
+    template = 'admin/news/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.admin_site = model_admin.admin_site
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def choices(self, changelist):
+        value = self.used_parameters.get(self.lookup_kwarg)
+        widget = AutocompleteSelect(self.field, self.admin_site, attrs={
+            'class': 'news-autocomplete-filter',
+            'data-query-string': changelist.get_query_string(remove=[self.lookup_kwarg, 'p']),
+        })
+        field = forms.ModelChoiceField(
+            self.field.remote_field.model._default_manager.all(), widget=widget, required=False,
+            to_field_name=self.field.target_field.name,
+        )
+        yield {
+            'widget': field.widget.render(self.lookup_kwarg, value[-1] if value else None),
+            'reset_query_string': changelist.get_query_string(remove=[self.lookup_kwarg, 'p']),
+            'selected': value is not None,
+        }
+
+
+class FastChangeListMixin:
+    """Список без COUNT(*) по всей таблице и скрипты фильтров с автодополнением"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, None).media
+
 
 class ArticleBlockInline(admin.TabularInline):
     model = ArticleBlock
@@ -8,12 +98,28 @@ class ArticleBlockInline(admin.TabularInline):
     ordering = ('order',)
 
 class CommentInline(admin.TabularInline):
+    """Последние NEWS_ADMIN_INLINE_COMMENTS комментариев; остальные - в списке комментариев"""
     model = Comment
     extra = 0
     fields = ('author', 'content', 'is_approved', 'created_at')
     readonly_fields = ('created_at',)
+    autocomplete_fields = ('author',)
     can_delete = True
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
+
+    def limit_queryset(self, request, queryset, article, prefix):
+        if request.method == 'POST':
+            # Те же комментарии, что были на форме, даже если с тех пор появились новые
+            total = int(request.POST.get(f'{prefix}-INITIAL_FORMS') or 0)
+            ids = [request.POST.get(f'{prefix}-{i}-id') for i in range(total)]
+            return queryset.filter(pk__in=[pk for pk in ids if pk and pk.isdigit()])
+        limit = getattr(settings, 'NEWS_ADMIN_INLINE_COMMENTS', 20)
+        latest = Comment.objects.filter(article=article).order_by('-created_at', '-id') \
+            .values_list('pk', flat=True)[:limit]
+        return queryset.filter(pk__in=list(latest))
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
@@ -21,25 +127,44 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'color', 'article_count')
-    list_filter = ('name',)
+    list_display = ('name', 'slug', 'color', 'published_article_count')
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
-    
-    def article_count(self, obj):
-        return obj.articles.count()
-    article_count.short_description = 'Количество статей'
 
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
+class ArticleAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'created_at', 'views', 'is_published', 'comments_enabled', 'display_tags')
-    list_filter = ('is_published', 'created_at', 'author', 'tags', 'comments_enabled')
-    search_fields = ('title', 'content')
+    list_filter = ('is_published', 'created_at', ('author', AutocompleteFilter), 'tags', 'comments_enabled')
+    search_fields = ('title',)
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ArticleBlockInline, CommentInline]
-    readonly_fields = ('views',)
+    readonly_fields = ('views', 'all_comments')
+    autocomplete_fields = ('author',)
     filter_horizontal = ('tags',)
 
+    def get_queryset(self, request):
+        # Автор и теги для display_tags - одним запросом на страницу, а не на строку
+        return super().get_queryset(request).select_related('author').prefetch_related('tags')
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if isinstance(inline, CommentInline) and obj is not None and obj.pk:
+            kwargs['queryset'] = inline.limit_queryset(request, kwargs['queryset'], obj, prefix)
+        return kwargs
+
+    def all_comments(self, obj):
+        if not obj.pk:
+            return '-'
+        url = reverse('admin:news_comment_changelist') + f'?article__id__exact={obj.pk}'
+        return format_html('<a href="{}">Все комментарии статьи</a>', url)
+    all_comments.short_description = 'Комментарии'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по заголовку и тексту блоков через полнотекстовый индекс"""
+        if not search.is_available() or not search.build_match_query(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.matching_ids_sql(search_term)), False
+
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         form.base_fields['category'].required = True
@@ -50,7 +175,7 @@ class ArticleAdmin(admin.ModelAdmin):
             'fields': ('title', 'slug', 'category', 'thumbnail', 'author', 'is_published')
         }),
         ('Комментарии', {
-            'fields': ('comments_enabled',)
+            'fields': ('comments_enabled', 'all_comments')
         }),
         ('Теги', {
             'fields': ('tags',)
@@ -66,27 +191,36 @@ class ArticleAdmin(admin.ModelAdmin):
     display_tags.short_description = 'Теги'
 
 @admin.register(ArticleBlock)
-class ArticleBlockAdmin(admin.ModelAdmin):
+class ArticleBlockAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('article', 'block_type', 'order')
-    list_filter = ('block_type', 'article')
+    list_filter = ('block_type', ('article', AutocompleteFilter))
     ordering = ('article', 'order')
+    autocomplete_fields = ('article',)
+    list_select_related = ('article',)
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('author', 'article', 'content_preview', 'created_at', 'is_approved', 'parent')
-    list_filter = ('is_approved', 'created_at', 'article')
+    list_filter = ('is_approved', 'created_at', ('article', AutocompleteFilter), ('author', AutocompleteFilter))
     search_fields = ('content', 'author__username', 'article__title')
     list_editable = ('is_approved',)
     actions = ['approve_comments', 'disapprove_comments']
+    autocomplete_fields = ('article', 'author', 'parent')
+    # Сортировка по первичному ключу не требует сортировки всей таблицы
+    ordering = ('-id',)
+    # __str__ родительского комментария обращается к его автору и статье
+    list_select_related = ('author', 'article', 'parent__author', 'parent__article')
     
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Текст комментария'
     
     def approve_comments(self, request, queryset):
-        queryset.update(is_approved=True)
+        changed = comments.moderate(queryset, 'approve')
+        self.message_user(request, f'Одобрено комментариев: {changed}')
     approve_comments.short_description = "Одобрить выбранные комментарии"
     
     def disapprove_comments(self, request, queryset):
-        queryset.update(is_approved=False)
+        changed = comments.moderate(queryset, 'disapprove')
+        self.message_user(request, f'Снято одобрение с комментариев: {changed}')
     disapprove_comments.short_description = "Снять одобрение с выбранных комментариев"
\ No newline at end of file
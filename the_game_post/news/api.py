@@ -0,0 +1,273 @@
+"""
+JSON API только для чтения (мобильное приложение, виджеты партнеров).
+
+    GET api/v1/articles/                  статьи (?category=, ?tag=, ?cursor=, ?limit=)
+    GET api/v1/articles/<slug>/           статья с блоками
+    GET api/v1/articles/<slug>/comments/  дерево одобренных комментариев
+    GET api/v1/tags/                      теги
+
+?fields=a,b,c оставляет в объектах только перечисленные поля, неизвестное
+поле - ошибка 400. Строки читаются через .values() и сериализуются как
+словари, без создания моделей; теги статей страницы - одним запросом.
+Списки статей листаются курсором (pagination.py). Ответы кэшируются и
+получают ETag/Last-Modified так же, как страницы (caching.py). Если
+установлен orjson, JSON кодируется им.
+"""
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from . import caching, taxonomy
+from .models import Article, ArticleBlock, Comment
+from .pagination import CursorPaginator
+from .routers import read_from_replicas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_TYPE = 'application/json'
+
+# Поле API -> поле для .values()
+ARTICLE_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'excerpt': 'excerpt',
+    'body_html': 'body_html',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'views': 'views',
+    'comment_count': 'approved_comment_count',
+    'comments_enabled': 'comments_enabled',
+    'category': 'category__slug',
+    'category_name': 'category__name',
+    'author': 'author__username',
+    'thumbnail': 'thumbnail',
+}
+# Вычисляемые поля; blocks - только у одной статьи
+ARTICLE_EXTRA_FIELDS = ('url', 'tags')
+LIST_FIELDS = (
+    'id', 'slug', 'title', 'excerpt', 'created_at', 'category', 'author',
+    'comment_count', 'thumbnail', 'tags', 'url',
+)
+DETAIL_FIELDS = LIST_FIELDS + ('updated_at', 'views', 'comments_enabled', 'body_html', 'blocks')
+
+COMMENT_FIELDS = {
+    'id': 'id',
+    'author': 'author__username',
+    'content': 'content',
+    'created_at': 'created_at',
+}
+TAG_FIELDS = ('slug', 'name', 'color', 'article_count')
+
+
+class ApiError(ValueError):
+    status = 400
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode()
+
+
+def _json(data, status=200):
+    return HttpResponse(dumps(data), content_type=CONTENT_TYPE, status=status)
+
+
+def _respond(request, name, versions, build):
+    """Ответ из кэша или 304; иначе build() строит данные ответа"""
+    cached = caching.cached_page(request, name, versions)
+    if cached:
+        return cached
+    try:
+        data = build()
+    except ApiError as error:
+        return _json({'error': str(error)}, status=error.status)
+    except Http404 as error:
+        return _json({'error': str(error)}, status=404)
+    return caching.finish_page(request, _json(data), name, versions)
+
+
+def _fields(request, allowed, default):
+    value = request.GET.get('fields')
+    if not value:
+        return list(default)
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def _limit(request):
+    default = getattr(settings, 'NEWS_API_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'NEWS_API_MAX_PAGE_SIZE', 100)
+    value = request.GET.get('limit')
+    if not value:
+        return default
+    if not value.isdigit() or not 0 < int(value) <= maximum:
+        raise ApiError(f'limit должен быть от 1 до {maximum}')
+    return int(value)
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def _article_values(fields):
+    """Поля .values() для запрошенных полей статьи; id и created_at нужны курсору"""
+    lookups = {'id', 'created_at'}
+    lookups.update(ARTICLE_FIELDS[name] for name in fields if name in ARTICLE_FIELDS)
+    if 'url' in fields:
+        lookups.add('slug')
+    return sorted(lookups)
+
+
+def _tags_by_article(article_ids):
+    tags = {article_id: [] for article_id in article_ids}
+    links = Article.tags.through.objects.filter(article_id__in=article_ids) \
+        .order_by('tag__name').values_list('article_id', 'tag__slug')
+    for article_id, slug in links:
+        tags[article_id].append(slug)
+    return tags
+
+
+def _serialize_articles(request, rows, fields):
+    tags = _tags_by_article([row['id'] for row in rows]) if 'tags' in fields else {}
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == 'url':
+                item[name] = request.build_absolute_uri(reverse('news:article_detail', args=[row['slug']]))
+            elif name == 'tags':
+                item[name] = tags[row['id']]
+            elif name == 'thumbnail':
+                item[name] = _media_url(row['thumbnail'])
+            elif name in ARTICLE_FIELDS:
+                item[name] = row[ARTICLE_FIELDS[name]]
+        items.append(item)
+    return items
+
+
+@require_safe
+@read_from_replicas
+def article_list(request):
+    """Опубликованные статьи, новые первыми; фильтры ?category= и ?tag="""
+    versions = caching.get_versions('articles', 'comments', 'taxonomy')
+
+    def build():
+        fields = _fields(request, {*ARTICLE_FIELDS, *ARTICLE_EXTRA_FIELDS}, LIST_FIELDS)
+        articles = Article.objects.published()
+        if request.GET.get('category'):
+            articles = articles.filter(category__slug=request.GET['category'])
+        if request.GET.get('tag'):
+            articles = articles.filter(tags__slug=request.GET['tag'])
+
+        page = CursorPaginator(articles.values(*_article_values(fields)), _limit(request)) \
+            .page(request.GET.get('cursor'))
+        return {
+            'results': _serialize_articles(request, page.object_list, fields),
+            'next': _page_url(request, page.next_cursor),
+            'previous': _page_url(request, page.previous_cursor),
+        }
+
+    return _respond(request, 'api_articles', versions, build)
+
+
+@require_safe
+@read_from_replicas
+def article_detail(request, slug):
+    """Одна статья; blocks - блоки в порядке показа"""
+    versions = caching.get_versions('articles', 'taxonomy', caching.article_scope(slug))
+
+    def build():
+        fields = _fields(request, {*ARTICLE_FIELDS, *ARTICLE_EXTRA_FIELDS, 'blocks'}, DETAIL_FIELDS)
+        row = Article.objects.published().filter(slug=slug).values(*_article_values(fields)).first()
+        if row is None:
+            raise Http404('Статья не найдена')
+        item, = _serialize_articles(request, [row], fields)
+        if 'blocks' in fields:
+            blocks = ArticleBlock.objects.filter(article_id=row['id']).order_by('order', 'id') \
+                .values('block_type', 'content', 'image', 'image_caption')
+            item['blocks'] = [{**block, 'image': _media_url(block['image'])} for block in blocks]
+        return item
+
+    return _respond(request, 'api_article', versions, build)
+
+
+@require_safe
+@read_from_replicas
+def article_comments(request, slug):
+    """
+    Одобренные комментарии статьи деревом: у каждого комментария replies.
+    Как и на странице статьи, ветки с неодобренным родителем не показываются.
+    """
+    versions = caching.get_versions('comments', caching.article_scope(slug))
+
+    def build():
+        fields = _fields(request, COMMENT_FIELDS, COMMENT_FIELDS)
+        article_id = Article.objects.published().filter(slug=slug).values_list('pk', flat=True).first()
+        if article_id is None:
+            raise Http404('Статья не найдена')
+        lookups = {'id', 'parent_id', *(COMMENT_FIELDS[name] for name in fields)}
+        rows = list(
+            Comment.objects.approved().filter(article_id=article_id)
+            .order_by('created_at', 'id').values(*lookups)
+        )
+        items = {
+            row['id']: {**{name: row[COMMENT_FIELDS[name]] for name in fields}, 'replies': []}
+            for row in rows
+        }
+        roots = []
+        for row in rows:
+            item = items[row['id']]
+            if row['parent_id'] is None:
+                roots.append(item)
+            elif row['parent_id'] in items:
+                # Ответы на неодобренный комментарий никуда не попадают
+                items[row['parent_id']]['replies'].append(item)
+        return {'results': roots}
+
+    return _respond(request, 'api_comments', versions, build)
+
+
+@require_safe
+def tag_list(request):
+    """Теги из снимка taxonomy, без запросов к базе"""
+    versions = caching.get_versions('taxonomy')
+
+    def build():
+        fields = _fields(request, TAG_FIELDS, TAG_FIELDS)
+        values = {
+            'slug': lambda tag: tag.slug,
+            'name': lambda tag: tag.name,
+            'color': lambda tag: tag.color,
+            'article_count': lambda tag: tag.published_article_count,
+        }
+        tags = taxonomy.get_snapshot().tags
+        return {'results': [{name: values[name](tag) for name in fields} for tag in tags]}
+
+    return _respond(request, 'api_tags', versions, build)
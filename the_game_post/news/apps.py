@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import database, signals  # noqa: F401
+
+        connection_created.connect(database.configure_connection, dispatch_uid='news_configure_connection')
@@ -0,0 +1,231 @@
+"""
+Статические файлы в продакшене.
+
+CompressedManifestStaticFilesStorage - хранилище для collectstatic: имена с
+хэшем содержимого (ManifestStaticFilesStorage), CSS и JS приложения
+сжимаются, рядом с каждым текстовым файлом кладутся .gz и .br (.br - если
+установлен пакет brotli). Все это делается один раз при сборке.
+
+StaticFilesWSGI/StaticFilesASGI - обертки приложения в wsgi.py/asgi.py,
+которые отдают файлы из STATIC_ROOT, не доходя до Django. Таблица файлов с
+готовыми заголовками строится при запуске процесса, поэтому на запрос нет
+ни stat(), ни поиска по каталогам: только выбор сжатой копии по
+Accept-Encoding и чтение файла. Файлы с хэшем в имени отдаются с
+Cache-Control на год (immutable), остальные - с проверкой по ETag.
+"""
+import asyncio
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import urlparse
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+# Сжимаются только свои файлы: сторонние (админка) уже минифицированы
+MINIFY_PREFIXES = ('news/',)
+MIN_COMPRESS_SIZE = 512
+CHUNK_SIZE = 64 * 1024
+TEXT_TYPES = ('application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+
+def _minify_declarations(match):
+    # Пробелы вокруг ':' значимы в селекторах (.a :hover), убираются только в свойствах
+    return '{' + re.sub(r'\s*:\s*', ':', match.group(1)) + '}'
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r'\(\s+', '(', css)
+    css = re.sub(r'\{([^{}]*)\}', _minify_declarations, css)
+    return css.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(js):
+    """Осторожное сжатие: отступы, пустые строки и строки-комментарии"""
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def _save(self, name, content):
+        minify = MINIFIERS.get(os.path.splitext(name)[1])
+        if minify and name.startswith(MINIFY_PREFIXES):
+            content.seek(0)
+            content = ContentFile(minify(content.read().decode()).encode())
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set()
+        for name in paths:
+            if name.endswith(COMPRESSIBLE):
+                names.add(name)
+                names.add(self.stored_name(name))
+        for name in names:
+            self.compress(name)
+
+    def compress(self, name):
+        """Кладет рядом .gz и .br, если они заметно меньше файла"""
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+
+
+def _content_type(path):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in TEXT_TYPES:
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+class StaticFile:
+    """Файл и его сжатые копии с заголовками, посчитанными при запуске"""
+
+    def __init__(self, path, cache_control):
+        content_type = _content_type(path)
+        self.variants = {}
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz'), (None, '')):
+            variant = path + suffix
+            if encoding and not os.path.exists(variant):
+                continue
+            stat = os.stat(variant)
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+            headers = [
+                ('Cache-Control', cache_control),
+                ('ETag', etag),
+                ('Last-Modified', http_date(stat.st_mtime)),
+            ]
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+            body_headers = [('Content-Type', content_type), ('Content-Length', str(stat.st_size))]
+            self.variants[encoding] = (variant, etag, headers, body_headers)
+        if len(self.variants) > 1:
+            for _, _, headers, _ in self.variants.values():
+                headers.append(('Vary', 'Accept-Encoding'))
+
+    def select(self, accept_encoding, if_none_match):
+        """(статус, заголовки, путь файла или None для ответа без тела)"""
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                path, etag, headers, body_headers = self.variants[encoding]
+                break
+        else:
+            path, etag, headers, body_headers = self.variants[None]
+
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(',')):
+            return 304, headers, None
+        return 200, body_headers + headers, path
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.lower().split(','):
+        coding, _, params = part.partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        accepted.add(coding.strip())
+    return accepted
+
+
+def load_files(root=None):
+    """Таблица URL -> StaticFile для всех файлов STATIC_ROOT"""
+    root = root or settings.STATIC_ROOT
+    if not getattr(settings, 'NEWS_SERVE_STATIC', False) or not root or not os.path.isdir(root):
+        return {}
+    prefix = urlparse(settings.STATIC_URL).path
+    hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    immutable = f'public, max-age={getattr(settings, "NEWS_STATIC_MAX_AGE", 365 * 24 * 3600)}, immutable'
+    files = {}
+    for directory, _, names in os.walk(root):
+        for filename in names:
+            path = os.path.join(directory, filename)
+            if filename.endswith(('.gz', '.br')) and os.path.exists(path[:-3]):
+                continue
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[prefix + name] = StaticFile(path, immutable if name in hashed else 'public, no-cache')
+    return files
+
+
+class StaticFilesWSGI:
+    def __init__(self, application, files=None):
+        self.application = application
+        self.files = load_files() if files is None else files
+
+    def __call__(self, environ, start_response):
+        static = self.files.get(environ.get('PATH_INFO', ''))
+        method = environ.get('REQUEST_METHOD')
+        if static is None or method not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+
+        status, headers, path = static.select(
+            environ.get('HTTP_ACCEPT_ENCODING', ''), environ.get('HTTP_IF_NONE_MATCH', ''),
+        )
+        start_response('200 OK' if status == 200 else '304 Not Modified', headers)
+        if path is None or method == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), CHUNK_SIZE)
+
+
+class StaticFilesASGI:
+    def __init__(self, application, files=None):
+        self.application = application
+        self.files = load_files() if files is None else files
+
+    async def __call__(self, scope, receive, send):
+        static = self.files.get(scope['path']) if scope['type'] == 'http' else None
+        if static is None or scope['method'] not in ('GET', 'HEAD'):
+            return await self.application(scope, receive, send)
+
+        request_headers = dict(scope['headers'])
+        status, headers, path = static.select(
+            request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+            request_headers.get(b'if-none-match', b'').decode('latin-1'),
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.lower().encode(), value.encode()) for key, value in headers],
+        })
+        if path is None or scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        with open(path, 'rb') as file:
+            while True:
+                chunk = await asyncio.to_thread(file.read, CHUNK_SIZE)
+                more_body = len(chunk) == CHUNK_SIZE
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+                if not more_body:
+                    return
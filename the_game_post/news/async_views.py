@@ -0,0 +1,173 @@
+"""
+Асинхронные версии страниц статей и добавления комментария для ASGI.
+
+Подключаются вместо синхронных из views.py при NEWS_ASYNC_VIEWS = True
+(см. urls.py и asgi.py). Поведение то же самое: кэш страниц, условные
+GET-запросы, реплики для чтения. Пока представление ждет базу, поток
+сервера свободен. Запросы страницы статьи (популярные статьи и дерево
+комментариев) идут через асинхронный ORM по очереди: параллельно их
+выполнить нельзя, ORM работает в одном потоке. Шаблоны рендерятся в
+потоке: контекстные процессоры и ленивые queryset'ы в них синхронные.
+
+Синхронный ORM Django выполняется в одном потоке на процесс, поэтому
+каждый переход в поток дорог: версии кэша, кэш страниц и валидаторы
+(обращения к кэшу без базы) вызываются прямо из цикла событий, а
+пользователь загружается заранее через request.auser().
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.shortcuts import aget_object_or_404, render
+
+from . import caching, taxonomy
+from .forms import CommentForm
+from .models import Article, Category, Comment, Tag
+from .pagination import CursorPaginator, use_cursor_pagination
+from .ranking import aget_popular_articles
+from .routers import read_from_replicas, read_primary_if_changed
+from .view_counter import record_view
+from .views import ARTICLES_PER_PAGE, add_comment_response, handle_comment_submission
+
+arender = sync_to_async(render)
+
+
+async def _load_user(request):
+    # request.user нужен кэшу страниц и валидаторам; ленивая загрузка
+    # пользователя в цикле событий обратилась бы к базе синхронно
+    request.user = await request.auser()
+
+
+async def _cached_article_page(request, slug, versions):
+    """Асинхронный вариант views._cached_article_page"""
+    cache_key = caching.page_cache_key(request, 'article_detail', versions)
+    not_modified = caching.not_modified_response(request, 'article_detail', versions)
+    cached = caching.get_cached_page(cache_key)
+    if not_modified:
+        if cached:
+            article_id = cached['article_id']
+        else:
+            article_id = await Article.objects.published().filter(slug=slug).values_list('pk', flat=True).afirst()
+        if article_id:
+            record_view(article_id)
+        return not_modified
+    if cached:
+        record_view(cached['article_id'])
+        return caching.patch_validators(request, caching.response_from_cache(cached), 'article_detail', versions)
+    read_primary_if_changed(versions.last_modified)
+    return None
+
+
+async def _paginate(queryset, number):
+    """Страница Paginator с тем же поведением, что в article_list, без блокирующих запросов"""
+    paginator = Paginator(queryset, ARTICLES_PER_PAGE)
+    # count - cached_property: считаем асинхронно и подставляем заранее
+    paginator.count = await queryset.acount()
+    try:
+        page = paginator.page(number)
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    page.object_list = [article async for article in page.object_list]
+    return page
+
+
+@read_from_replicas
+async def article_list(request, category_slug=None):
+    await _load_user(request)
+    versions = caching.get_versions('articles', 'comments', 'taxonomy')
+    cached = caching.cached_page(request, 'article_list', versions)
+    if cached:
+        return cached
+
+    articles_list = Article.objects.published().with_list_data().defer('body_html')
+
+    current_category = None
+    if category_slug:
+        # Холодный или устаревший снимок загружается из базы: только в потоке
+        snapshot = await sync_to_async(taxonomy.get_snapshot)()
+        current_category = snapshot.get_category(category_slug) \
+            or await aget_object_or_404(Category, slug=category_slug)
+        articles_list = articles_list.filter(category=current_category)
+
+    tag_slug = request.GET.get('tag')
+    if tag_slug:
+        articles_list = articles_list.filter(tags__slug=tag_slug)
+
+    cursor_mode = use_cursor_pagination(request)
+    if cursor_mode:
+        paginator = CursorPaginator(articles_list, ARTICLES_PER_PAGE)
+        articles = await sync_to_async(paginator.page)(request.GET.get('cursor'))
+    else:
+        articles = await _paginate(articles_list, request.GET.get('page'))
+
+    context = caching.cache_context(versions)
+    context.update({
+        'articles': articles,
+        'cursor_mode': cursor_mode,
+        'current_category': current_category,
+        'current_tag': tag_slug,
+    })
+    response = await arender(request, 'news/article_list.html', context)
+    return caching.finish_page(request, response, 'article_list', versions)
+
+
+@read_from_replicas
+async def article_detail(request, slug):
+    """Детальная страница статьи с комментариями"""
+    await _load_user(request)
+    versions = caching.get_versions('articles', 'taxonomy', caching.article_scope(slug))
+    cached = await _cached_article_page(request, slug, versions)
+    if cached:
+        return cached
+
+    article = await aget_object_or_404(Article.objects.published().with_list_data(), slug=slug)
+    if request.method == 'POST' and article.comments_enabled:
+        return await sync_to_async(handle_comment_submission)(request, article)
+
+    article.increment_views()
+
+    popular_articles = await aget_popular_articles(article)
+    comments = await Comment.objects.athread_for(article)
+
+    context = caching.cache_context(versions)
+    context.update({
+        'article': article,
+        'popular_articles': popular_articles,
+        'comments': comments,
+        'comment_form': CommentForm(),
+    })
+    response = await arender(request, 'news/article_detail.html', context)
+    return caching.finish_page(request, response, 'article_detail', versions, article_id=article.pk)
+
+
+@read_from_replicas
+async def articles_by_tag(request, tag_slug):
+    """Показывает статьи по определенному тегу"""
+    await _load_user(request)
+    versions = caching.get_versions('articles', 'comments', 'taxonomy')
+    cached = caching.cached_page(request, 'articles_by_tag', versions)
+    if cached:
+        return cached
+
+    snapshot = await sync_to_async(taxonomy.get_snapshot)()
+    tag = snapshot.get_tag(tag_slug) or await aget_object_or_404(Tag, slug=tag_slug)
+    articles_list = Article.objects.published().filter(tags=tag).with_list_data().defer('body_html')
+    paginator = CursorPaginator(articles_list, ARTICLES_PER_PAGE)
+    articles = await sync_to_async(paginator.page)(request.GET.get('cursor'))
+
+    context = caching.cache_context(versions)
+    context.update({
+        'articles': articles,
+        'tag': tag,
+    })
+    response = await arender(request, 'news/articles_by_tag.html', context)
+    return caching.finish_page(request, response, 'articles_by_tag', versions)
+
+
+@login_required
+async def add_comment(request, slug):
+    """Добавление комментария (в том числе через AJAX)"""
+    article = await aget_object_or_404(Article, slug=slug, is_published=True)
+    # Прием комментария - запись в транзакции с сигналами: выполняется в потоке
+    return await sync_to_async(add_comment_response)(request, article)
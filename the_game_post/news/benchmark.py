@@ -0,0 +1,344 @@
+"""
+Нагрузочные замеры представлений новостей.
+
+seed_corpus() заполняет базу синтетическими данными (категории, теги,
+статьи с блоками, ветки комментариев) пакетными вставками, run_benchmark()
+прогоняет сценарии через тестовый клиент Django и собирает перцентили
+времени ответа, число SQL-запросов и размер ответа. Результаты - обычный
+словарь, пригодный для сохранения в JSON и сравнения с базовой линией
+(compare_with_baseline). Используется командами seed_news и benchmark_views.
+"""
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import counters, search, taxonomy
+from .caching import bump_versions, get_cache
+from .models import Article, ArticleBlock, Category, Comment, Tag
+from .profiling import percentile
+
+SLUG_PREFIX = 'bench-'
+BATCH_SIZE = 1000
+
+WORDS = (
+    'игра релиз обзор патч трейлер студия издатель консоль графика сюжет '
+    'персонаж уровень босс квест мультиплеер турнир киберспорт обновление '
+    'дополнение анонс скидка рейтинг геймплей механика открытый мир'
+).split()
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _batched(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed_corpus(articles=1000, tags=30, users=50, comments_per_article=10,
+                blocks_per_article=4, reply_ratio=0.5, seed=1):
+    """
+    Создает воспроизводимый (при одинаковом seed) набор данных.
+    Возвращает словарь с количеством созданных объектов.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        categories = [
+            Category.objects.get_or_create(slug=slug, defaults={'name': name})[0]
+            for slug, name in (('novosti', 'Новости'), ('igry', 'Игры'), ('stati', 'Статьи'))
+        ]
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', slug=f'{SLUG_PREFIX}tag-{i}', color='#%06x' % rng.randrange(0xFFFFFF))
+            for i in range(tags)
+        ], ignore_conflicts=True)
+        tag_ids = list(Tag.objects.filter(slug__startswith=SLUG_PREFIX).values_list('pk', flat=True))
+
+        User.objects.bulk_create([
+            User(username=f'{SLUG_PREFIX}user-{i}', password='!') for i in range(users)
+        ], ignore_conflicts=True)
+        user_ids = list(User.objects.filter(username__startswith=SLUG_PREFIX).values_list('pk', flat=True))
+
+        start = Article.objects.filter(slug__startswith=SLUG_PREFIX).count()
+        new_articles = [
+            Article(
+                title=_sentence(rng, rng.randint(3, 8)),
+                slug=f'{SLUG_PREFIX}{i}',
+                category=rng.choice(categories),
+                author_id=rng.choice(user_ids),
+                views=int(rng.paretovariate(1.2) * 10),
+            )
+            for i in range(start, start + articles)
+        ]
+        for batch in _batched(new_articles):
+            Article.objects.bulk_create(batch)
+
+        article_ids = [article.pk for article in new_articles]
+        # auto_now_add ставит всем текущее время: разносим даты публикации за год,
+        # чтобы ленты и рейтинг были похожи на настоящие
+        for article in new_articles:
+            article.created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        for batch in _batched(new_articles):
+            Article.objects.bulk_update(batch, ['created_at'])
+
+        blocks = [
+            ArticleBlock(
+                article_id=article_id, block_type='text', order=order,
+                content='\n\n'.join(_sentence(rng, rng.randint(20, 60)) for _ in range(rng.randint(1, 3))),
+            )
+            for article_id in article_ids
+            for order in range(rng.randint(1, blocks_per_article))
+        ]
+        ArticleBlock.objects.bulk_create(blocks, batch_size=BATCH_SIZE)
+
+        through = Article.tags.through
+        links = [
+            through(article_id=article_id, tag_id=tag_id)
+            for article_id in article_ids
+            for tag_id in rng.sample(tag_ids, min(len(tag_ids), rng.randint(1, 4)))
+        ]
+        through.objects.bulk_create(links, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        # Комментарии: сначала корневые, затем ответы на уже созданные
+        roots = [
+            Comment(article_id=article_id, author_id=rng.choice(user_ids), content=_sentence(rng, 12))
+            for article_id in article_ids
+            for _ in range(round(comments_per_article * (1 - reply_ratio)))
+        ]
+        Comment.objects.bulk_create(roots, batch_size=BATCH_SIZE)
+        replies = []
+        parents = list(roots)
+        for _ in range(round(comments_per_article * reply_ratio) * len(article_ids)):
+            parent = rng.choice(parents)
+            replies.append(Comment(
+                article_id=parent.article_id, author_id=rng.choice(user_ids),
+                parent=parent, content=_sentence(rng, 8),
+            ))
+        for batch in _batched(replies):
+            Comment.objects.bulk_create(batch)
+            parents.extend(batch)
+
+    # bulk_create не вызывает сигналы: обновляем производные данные вручную
+    for article in Article.objects.filter(pk__in=article_ids).iterator(chunk_size=BATCH_SIZE):
+        article.compile_body()
+    counters.reconcile()
+    search.rebuild_index()
+    bump_versions('articles', 'comments')
+    taxonomy.changed()
+
+    return {
+        'articles': len(article_ids),
+        'blocks': len(blocks),
+        'tag_links': len(links),
+        'comments': len(roots) + len(replies),
+    }
+
+
+class HttpClient:
+    """
+    Клиент для замеров на запущенном сервере (uvicorn, gunicorn, runserver):
+    те же сценарии, но через настоящий HTTP. Число SQL-запросов при этом не
+    видно, а кэш сервера командой не очищается.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=30) as response:
+                return SimpleNamespace(content=response.read(), status_code=response.status)
+        except urllib.error.HTTPError as exc:
+            return SimpleNamespace(content=exc.read(), status_code=exc.code)
+
+
+def _measure(client, method, path, data=None, headers=None, cold=False):
+    if isinstance(client, HttpClient):
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        return elapsed * 1000, None, len(response.content), response.status_code
+    if cold:
+        get_cache().clear()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        if method == 'post':
+            # Запись откатывается, чтобы повторные прогоны шли на одинаковых данных
+            with transaction.atomic():
+                response = client.post(path, data, headers=headers or {})
+                transaction.set_rollback(True)
+        else:
+            response = client.get(path)
+        elapsed = time.perf_counter() - started
+    return elapsed * 1000, len(queries), len(response.content), response.status_code
+
+
+def _scenarios(rng, sample):
+    # Метка прогона в тексте комментария: иначе повторный прогон попал бы в
+    # защиту от повторной отправки (news/comments.py) и мерил бы ее
+    run = '%08x' % random.getrandbits(32)
+    articles = list(
+        Article.objects.published().order_by('-created_at')
+        .values_list('slug', 'comments_enabled')[:sample * 10]
+    )
+    slugs = [slug for slug, _ in rng.sample(articles, min(sample, len(articles)))]
+    commentable = [slug for slug, enabled in articles if enabled] or slugs
+    tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:sample])
+    deep_page = max(1, Article.objects.published().count() // 3 // 2)
+
+    return {
+        'article_list': lambda i: ('get', reverse('news:article_list'), None),
+        'article_list_deep': lambda i: ('get', f"{reverse('news:article_list')}?page={deep_page}", None),
+        'article_detail': lambda i: ('get', reverse('news:article_detail', args=[slugs[i % len(slugs)]]), None),
+        'articles_by_tag': lambda i: ('get', reverse('news:articles_by_tag', args=[tag_slugs[i % len(tag_slugs)]]), None),
+        'comment_post': lambda i: (
+            'post',
+            reverse('news:add_comment', args=[commentable[i % len(commentable)]]),
+            {'content': f'Комментарий из бенчмарка {run} #{i}'},
+        ),
+    }
+
+
+def _run_requests(indexes, make_request, user, cold, close_connection=False, base_url=None):
+    """
+    Выполняет запросы сценария своими клиентами. Возвращает замеры и ошибки
+    (например, "database is locked" при конкурентной нагрузке).
+    """
+    if base_url:
+        anonymous = member = HttpClient(base_url)
+    else:
+        anonymous = Client()
+        member = Client()
+        member.force_login(user)
+    ajax = {'X-Requested-With': 'XMLHttpRequest'}
+    samples, errors = [], []
+    try:
+        for i in indexes:
+            method, path, data = make_request(i)
+            client = member if method == 'post' else anonymous
+            try:
+                sample = _measure(
+                    client, method, path, data, headers=ajax if method == 'post' else None, cold=cold,
+                )
+            except Exception as exc:
+                errors.append(f'{type(exc).__name__}: {exc}')
+                continue
+            samples.append(sample)
+            status = sample[3]
+            if not 200 <= status < 300:
+                errors.append(f'HTTP {status}: {method.upper()} {path}')
+    finally:
+        if close_connection:
+            connection.close()
+    return samples, errors
+
+
+# Лимит частоты комментариев отклонял бы почти все запросы comment_post (429)
+@override_settings(NEWS_COMMENT_RATE_LIMITS={})
+def run_benchmark(iterations=50, warmup=5, sample=20, cold=False, seed=1, scenarios=None, concurrency=1,
+                  base_url=None):
+    """
+    Прогоняет сценарии и возвращает {'meta': ..., 'results': {сценарий: метрики}}.
+    cold=True очищает кэш перед каждым запросом (замер без кэша страниц),
+    concurrency > 1 распределяет замеряемые запросы по потокам (у каждого
+    потока свое соединение с базой). С base_url запросы идут по HTTP на
+    запущенный сервер, чтобы сравнить WSGI и ASGI на одной нагрузке;
+    сценарии с записью при этом пропускаются.
+    """
+    rng = random.Random(seed)
+    user, _ = User.objects.get_or_create(username=f'{SLUG_PREFIX}writer')
+
+    results = {}
+    for name, make_request in _scenarios(rng, sample).items():
+        if scenarios and name not in scenarios:
+            continue
+        if base_url and make_request(0)[0] != 'get':
+            continue
+        _run_requests(range(warmup), make_request, user, cold, base_url=base_url)
+        measured = range(warmup, warmup + iterations)
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                chunks = executor.map(
+                    lambda part: _run_requests(
+                        part, make_request, user, cold, close_connection=True, base_url=base_url,
+                    ),
+                    [measured[worker::concurrency] for worker in range(concurrency)],
+                )
+                chunks = list(chunks)
+        else:
+            chunks = [_run_requests(measured, make_request, user, cold, base_url=base_url)]
+        wall = time.perf_counter() - started
+
+        samples = [item for chunk_samples, _ in chunks for item in chunk_samples]
+        errors = [error for _, chunk_errors in chunks for error in chunk_errors]
+        latencies = [elapsed for elapsed, _, _, _ in samples] or [0.0]
+        query_counts = [queries for _, queries, _, _ in samples if queries is not None]
+        sizes = [size for _, _, size, _ in samples] or [0]
+        results[name] = {
+            'requests': iterations,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(max(latencies), 3),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else 0.0,
+            'queries_mean': round(statistics.mean(query_counts), 2) if query_counts else None,
+            'queries_max': max(query_counts) if query_counts else None,
+            'bytes_mean': round(statistics.mean(sizes)),
+            'statuses': sorted({status for _, _, _, status in samples}),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+        }
+
+    return {
+        'meta': {
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold_cache': cold,
+            'concurrency': concurrency,
+            'seed': seed,
+            'articles': Article.objects.count(),
+            'comments': Comment.objects.count(),
+            'database': connection.vendor,
+            'base_url': base_url,
+        },
+        'results': results,
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance=0.2):
+    """
+    Список регрессий относительно базовой линии: рост p95 больше чем на
+    tolerance (доля) или рост максимального числа запросов.
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        if current.get('errors'):
+            regressions.append(f"{name}: ошибок {current['errors']} ({'; '.join(current['error_samples'])})")
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']} мс > {previous['p95_ms']} мс (+{tolerance:.0%})"
+            )
+        if None not in (current['queries_max'], previous['queries_max']) \
+                and current['queries_max'] > previous['queries_max']:
+            regressions.append(
+                f"{name}: запросов {current['queries_max']} > {previous['queries_max']}"
+            )
+    return regressions
@@ -0,0 +1,283 @@
+"""
+Кэширование страниц и фрагментов шаблонов.
+
+Ключи кэша версионируются: у каждой области (scope) есть номер версии,
+который увеличивается сигналами при изменении данных (см. signals.py).
+Старые записи после этого просто перестают читаться и вытесняются по таймауту,
+поэтому работает с любым бэкендом кэша (locmem, filebased, memcached, redis).
+Но locmem виден только своему процессу: команды manage.py, которые
+сбрасывают версии или заполняют кэш, требуют общий кэш (is_shared).
+Вместе с версией хранится время последнего изменения области: из версий и
+времени строятся валидаторы ETag/Last-Modified для условных GET-запросов.
+cached_page() и finish_page() - общая обвязка страниц, API и лент: ответ
+304 или страница из кэша до рендера и сохранение в кэш после него.
+
+Области:
+    'articles'       - список статей (карточки, популярные статьи)
+    'comments'       - количество комментариев в карточках
+    'taxonomy'       - теги и категории
+    'article:<slug>' - содержимое конкретной статьи и ее комментарии
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .routers import read_primary_if_changed
+
+VERSION_PREFIX = 'news:version:'
+MODIFIED_PREFIX = 'news:modified:'
+PAGE_PREFIX = 'news:page:'
+MESSAGES_COOKIE = 'messages'
+NOT_SHARED_MESSAGE = (
+    'Кэш NEWS_CACHE_ALIAS живет в памяти процесса, и сервер не увидит изменений '
+    'этой команды. Настройте общий кэш в CACHES (filebased, memcached, redis).'
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'NEWS_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """Виден ли кэш другим процессам (locmem и dummy - нет)"""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def article_scope(slug):
+    return f'article:{slug}'
+
+
+def _initial_version():
+    # Если ключ версии вытеснен из кэша, новая версия не должна совпасть со старой
+    return int(time.time() * 1000)
+
+
+class Versions(dict):
+    """{область: версия}; last_modified - время последнего изменения любой из областей"""
+    last_modified = None
+
+
+def get_versions(*scopes):
+    """Возвращает версии областей и время их изменения одним обращением к кэшу"""
+    cache = get_cache()
+    keys = {VERSION_PREFIX + scope: scope for scope in scopes}
+    modified_keys = [MODIFIED_PREFIX + scope for scope in scopes]
+    found = cache.get_many([*keys, *modified_keys])
+    versions = Versions()
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, _initial_version(), timeout=None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+
+    stamps = []
+    for key in modified_keys:
+        if key not in found:
+            # Время изменения неизвестно (кэш очищен): считаем, что изменилось сейчас
+            cache.add(key, int(time.time()), timeout=None)
+            found[key] = cache.get(key)
+        stamps.append(found[key])
+    if stamps:
+        versions.last_modified = max(stamps)
+    return versions
+
+
+def bump_versions(*scopes):
+    """Инвалидирует все записи кэша, зависящие от указанных областей"""
+    cache = get_cache()
+    for scope in scopes:
+        key = VERSION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+    now = int(time.time())
+    cache.set_many({MODIFIED_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+
+def cache_context(versions):
+    """Контекст для тега {% cache %}: таймаут фрагментов и версии областей"""
+    context = {
+        'fragment_cache_timeout': getattr(settings, 'NEWS_FRAGMENT_CACHE_TIMEOUT', 3600),
+        'cache_versions': {
+            scope.split(':', 1)[0]: version for scope, version in versions.items()
+        },
+    }
+    return context
+
+
+def page_cache_key(request, name, versions):
+    """
+    Ключ кэша страницы целиком или None, если ответ нельзя кэшировать:
+    кэшируются только GET/HEAD-запросы анонимных пользователей без
+    ожидающих flash-сообщений.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if MESSAGES_COOKIE in request.COOKIES or request.user.is_authenticated:
+        return None
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    version = '.'.join(str(versions[scope]) for scope in sorted(versions))
+    return f'{PAGE_PREFIX}{name}:{path}:{version}'
+
+
+def get_cached_page(key):
+    if key is None:
+        return None
+    return get_cache().get(key)
+
+
+def cache_page_response(key, response, **extra):
+    """Сохраняет отрендеренный ответ; extra - данные для обработки попадания в кэш"""
+    if key is None or response.status_code != 200:
+        return
+    entry = {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        **extra,
+    }
+    get_cache().set(key, entry, getattr(settings, 'NEWS_PAGE_CACHE_TIMEOUT', 300))
+
+
+def cache_streaming_response(key, response, **extra):
+    """
+    Как cache_page_response для StreamingHttpResponse: части ответа копятся
+    по мере отправки и сохраняются, только если ответ отдан целиком.
+    Ответ больше NEWS_STREAMING_CACHE_MAX_SIZE байт не кэшируется, и его
+    части перестают копиться, как только размер превышен. Поддерживаются и
+    синхронные, и асинхронные (ASGI) ответы.
+    """
+    if key is None or response.status_code != 200:
+        return
+    content = response.streaming_content
+    max_size = getattr(settings, 'NEWS_STREAMING_CACHE_MAX_SIZE', 1024 * 1024)
+    parts = []
+    size = 0
+
+    def collect(part):
+        nonlocal parts, size
+        if parts is None:
+            return
+        size += len(part)
+        if size > max_size:
+            parts = None
+        else:
+            parts.append(part)
+
+    def save():
+        if parts is not None:
+            cache_page_response(key, HttpResponse(b''.join(parts), content_type=response['Content-Type']), **extra)
+
+    if response.is_async:
+        async def stream():
+            async for part in content:
+                collect(part)
+                yield part
+            save()
+    else:
+        def stream():
+            for part in content:
+                collect(part)
+                yield part
+            save()
+
+    response.streaming_content = stream()
+
+
+def response_from_cache(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
+
+
+def cached_page(request, name, versions):
+    """Ответ 304 или страница из кэша, если они есть, иначе None"""
+    not_modified = not_modified_response(request, name, versions)
+    if not_modified:
+        return not_modified
+    cached = get_cached_page(page_cache_key(request, name, versions))
+    if cached:
+        return patch_validators(request, response_from_cache(cached), name, versions)
+    read_primary_if_changed(versions.last_modified)
+    return None
+
+
+def finish_page(request, response, name, versions, **extra):
+    """Сохраняет отрендеренную страницу в кэш и проставляет валидаторы"""
+    cache_page_response(page_cache_key(request, name, versions), response, **extra)
+    return patch_validators(request, response, name, versions)
+
+
+def _is_personal(request):
+    return MESSAGES_COOKIE in request.COOKIES or request.user.is_authenticated
+
+
+def _etag(request, name, versions):
+    """
+    ETag страницы: путь и версии областей. Для авторизованных в него входят
+    пользователь и CSRF-cookie - в их страницах есть формы с CSRF-токеном.
+    """
+    parts = [name, request.get_full_path()]
+    parts.extend(f'{scope}={versions[scope]}' for scope in sorted(versions))
+    if request.user.is_authenticated:
+        parts.append(str(request.user.pk))
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    return '"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def _last_modified(request, versions):
+    # Last-Modified только для анонимных страниц: после входа браузер мог бы
+    # получить 304 на закэшированную анонимную версию
+    if request.user.is_authenticated:
+        return None
+    return versions.last_modified
+
+
+def not_modified_response(request, name, versions):
+    """
+    Ответ 304, если у клиента актуальная версия страницы (If-None-Match /
+    If-Modified-Since), иначе None. Шаблоны при этом не рендерятся.
+    """
+    if request.method not in ('GET', 'HEAD') or MESSAGES_COOKIE in request.COOKIES:
+        return None
+    response = get_conditional_response(
+        request,
+        etag=_etag(request, name, versions),
+        last_modified=_last_modified(request, versions),
+    )
+    if response is not None:
+        patch_validators(request, response, name, versions)
+    return response
+
+
+def patch_validators(request, response, name, versions):
+    """
+    Проставляет ETag, Last-Modified и Cache-Control. Анонимные страницы может
+    хранить обратный прокси (s-maxage), браузер каждый раз перепроверяет их
+    условным запросом. Страницы пользователей и с flash-сообщениями - private.
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+        return response
+    if MESSAGES_COOKIE in request.COOKIES:
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    response['ETag'] = _etag(request, name, versions)
+    last_modified = _last_modified(request, versions)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if _is_personal(request):
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, 'NEWS_BROWSER_CACHE_TIMEOUT', 0),
+            s_maxage=getattr(settings, 'NEWS_PROXY_CACHE_TIMEOUT', 60),
+        )
+    return response
@@ -0,0 +1,181 @@
+"""
+Прием и модерация комментариев.
+
+submit_comment() - единственный путь создания комментария с сайта (форма на
+странице статьи, AJAX, асинхронные представления). Проверки идут от дешевых
+к дорогим, чтобы поток спама не доходил до базы:
+
+1. проверка формы (без запросов к базе); неверная форма не тратит лимит;
+2. ограничение частоты - корзины токенов в кэше, отдельно для пользователя
+   и для IP-адреса (DEFAULT_RATE_LIMITS, меняется NEWS_COMMENT_RATE_LIMITS);
+3. защита от повторной отправки - хэш автора, статьи, родителя и текста
+   запоминается в кэше на NEWS_COMMENT_DUPLICATE_WINDOW секунд;
+4. поиск родительского комментария и сохранение.
+
+Корзина читается и пишется без блокировок: при одновременных запросах из
+разных процессов лимит может быть превышен на единицы, для защиты от
+спама этого достаточно. За обратным прокси адрес клиента берется из
+X-Forwarded-For (client_ip, NEWS_TRUSTED_PROXIES), иначе все посетители
+попали бы в одну корзину прокси. moderate() выполняет действия модерации
+над набором комментариев пакетно.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+
+from .caching import get_cache
+from .forms import CommentForm
+from .models import Comment
+
+RATE_PREFIX = 'news:comment-rate:'
+DUPLICATE_PREFIX = 'news:comment-hash:'
+DEFAULT_RATE_LIMITS = {
+    # (емкость корзины, секунд на восстановление одного токена)
+    'user': (5, 30),
+    'ip': (20, 10),
+}
+MODERATION_ACTIONS = ('approve', 'disapprove', 'delete')
+
+
+class CommentRejected(Exception):
+    """Комментарий не принят; message показывается пользователю"""
+    status = 400
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or {}
+
+
+class RateLimited(CommentRejected):
+    status = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f'Слишком много комментариев. Попробуйте через {retry_after} с.')
+        self.retry_after = retry_after
+
+
+class DuplicateComment(CommentRejected):
+    """Такой же комментарий уже отправлен; comment_id - его id, если он известен"""
+    status = 409
+
+    def __init__(self, comment_id=None):
+        super().__init__('Этот комментарий уже отправлен')
+        self.comment_id = comment_id
+
+
+def _take_token(key, capacity, refill_seconds, now):
+    """Забирает токен из корзины; возвращает 0 или сколько секунд ждать"""
+    cache = get_cache()
+    tokens, updated = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) / refill_seconds)
+    if tokens < 1:
+        return max(1, round((1 - tokens) * refill_seconds))
+    cache.set(key, (tokens - 1, now), timeout=round(capacity * refill_seconds))
+    return 0
+
+
+def client_ip(request):
+    """
+    Адрес клиента. За NEWS_TRUSTED_PROXIES обратными прокси это адрес, который
+    добавил в X-Forwarded-For самый внешний из них: более левые значения
+    клиент может подставить сам.
+    """
+    proxies = getattr(settings, 'NEWS_TRUSTED_PROXIES', 0)
+    if proxies:
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+def check_rate(user, ip):
+    """Бросает RateLimited, если пользователь или адрес исчерпали лимит"""
+    limits = getattr(settings, 'NEWS_COMMENT_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+    now = time.time()
+    buckets = [('user', user.pk)]
+    if ip:
+        buckets.append(('ip', ip))
+    for kind, ident in buckets:
+        if kind not in limits:
+            continue
+        capacity, refill_seconds = limits[kind]
+        wait = _take_token(f'{RATE_PREFIX}{kind}:{ident}', capacity, refill_seconds, now)
+        if wait:
+            raise RateLimited(wait)
+
+
+def content_hash(user, article, parent_id, content):
+    normalized = ' '.join(content.split()).lower()
+    data = f'{user.pk}:{article.pk}:{parent_id or ""}:{normalized}'
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _parent_id(data):
+    value = data.get('parent')
+    return int(value) if value and str(value).isdigit() else None
+
+
+def submit_comment(article, user, data, ip=None):
+    """
+    Создает комментарий пользователя к статье из данных формы (content,
+    parent). Возвращает сохраненный комментарий или бросает CommentRejected.
+    """
+    if not article.comments_enabled:
+        raise CommentRejected('Комментарии к этой статье отключены')
+
+    form = CommentForm({'content': data.get('content', '')})
+    if not form.is_valid():
+        raise CommentRejected('Ошибка при добавлении комментария. Проверьте форму.', form.errors)
+    check_rate(user, ip)
+
+    parent_id = _parent_id(data)
+    cache = get_cache()
+    duplicate_key = DUPLICATE_PREFIX + content_hash(user, article, parent_id, form.cleaned_data['content'])
+    window = getattr(settings, 'NEWS_COMMENT_DUPLICATE_WINDOW', 600)
+    if not cache.add(duplicate_key, 0, timeout=window):
+        raise DuplicateComment(cache.get(duplicate_key) or None)
+
+    try:
+        comment = form.save(commit=False)
+        comment.article = article
+        comment.author = user
+        if parent_id:
+            # Ответ на чужую статью или несуществующий комментарий становится корневым
+            comment.parent = Comment.objects.select_related('author') \
+                .filter(pk=parent_id, article=article).first()
+        comment.save()
+    except Exception:
+        cache.delete(duplicate_key)
+        raise
+    cache.set(duplicate_key, comment.pk, timeout=window)
+    return comment
+
+
+def prepare_for_display(comment):
+    """Заполняет поля, которые шаблону comment.html обычно дает thread_for()"""
+    max_depth = getattr(settings, 'NEWS_COMMENT_MAX_DEPTH', 5)
+    depth, parent_id = 0, comment.parent_id
+    while parent_id is not None and depth < max_depth:
+        depth += 1
+        parent_id = Comment.objects.filter(pk=parent_id).values_list('parent_id', flat=True).first()
+    comment.depth = depth
+    comment.can_reply = depth + 1 < max_depth
+    comment.children = []
+    return comment
+
+
+def moderate(comments, action):
+    """
+    Пакетное действие модерации над queryset'ом комментариев: 'approve',
+    'disapprove' или 'delete'. Возвращает число затронутых комментариев.
+    """
+    if action == 'approve':
+        return comments.set_approved(True)
+    if action == 'disapprove':
+        return comments.set_approved(False)
+    if action == 'delete':
+        # Удаление идет через сигналы: они уменьшают счетчики и сбрасывают кэш
+        return comments.delete()[1].get(Comment._meta.label, 0)
+    raise ValueError(f'Неизвестное действие модерации: {action}')
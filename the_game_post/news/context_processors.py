@@ -0,0 +1,11 @@
+from . import taxonomy
+
+
+def taxonomy_snapshot(request):
+    """Теги и категории из снимка процесса (без запросов к базе)"""
+    snapshot = taxonomy.get_snapshot()
+    return {
+        'taxonomy': snapshot,
+        'all_tags': snapshot.tags,
+        'categories': snapshot.categories,
+    }
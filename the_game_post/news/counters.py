@@ -0,0 +1,73 @@
+"""
+Денормализованные счетчики: Article.approved_comment_count и
+Tag.published_article_count.
+
+Счетчик комментариев меняется на разницу (F-выражением) в той же
+транзакции, что и сам комментарий: сигналы срабатывают внутри
+Comment.save()/delete() (они обернуты в atomic), массовое одобрение идет
+через CommentQuerySet.set_approved(). Число статей тега пересчитывается
+целиком для затронутых тегов - изменения тегов редки. Расхождения
+исправляет команда reconcile_counters.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import taxonomy
+
+
+def change_comment_count(article_id, delta):
+    from .models import Article
+
+    if not delta or article_id is None:
+        return
+    Article.objects.filter(pk=article_id).update(
+        approved_comment_count=Greatest(F('approved_comment_count') + delta, 0)
+    )
+
+
+def _approved_comments_subquery():
+    from .models import Comment
+
+    counts = Comment.objects.filter(article=OuterRef('pk'), is_approved=True) \
+        .order_by().values('article').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _published_articles_subquery():
+    from .models import Article
+
+    through = Article.tags.through
+    counts = through.objects.filter(tag=OuterRef('pk'), article__is_published=True) \
+        .order_by().values('tag').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def refresh_tag_counts(tag_ids):
+    """Пересчитывает число опубликованных статей для указанных тегов"""
+    from .models import Tag
+
+    tag_ids = set(tag_ids)
+    if tag_ids:
+        Tag.objects.filter(pk__in=tag_ids).update(published_article_count=_published_articles_subquery())
+        # Число статей тега входит в снимок тегов
+        taxonomy.changed()
+
+
+def reconcile():
+    """
+    Сверяет счетчики с фактическими данными и исправляет расхождения.
+    Возвращает {'articles': исправлено статей, 'tags': исправлено тегов}.
+    """
+    from .models import Article, Tag
+
+    articles = Article.objects.annotate(actual=_approved_comments_subquery()) \
+        .exclude(approved_comment_count=F('actual'))
+    fixed_articles = articles.update(approved_comment_count=_approved_comments_subquery())
+
+    tags = Tag.objects.annotate(actual=_published_articles_subquery()) \
+        .exclude(published_article_count=F('actual'))
+    fixed_tags = tags.update(published_article_count=_published_articles_subquery())
+    if fixed_tags:
+        taxonomy.changed()
+
+    return {'articles': fixed_articles, 'tags': fixed_tags}
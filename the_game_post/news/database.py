@@ -0,0 +1,43 @@
+"""
+Настройка соединений с базой данных.
+
+Для SQLite при каждом новом соединении (сигнал connection_created)
+выполняются PRAGMA из DEFAULT_SQLITE_PRAGMAS; настройка NEWS_SQLITE_PRAGMAS
+меняет отдельные значения. Журнал WAL позволяет читателям не ждать писателей
+(сброс просмотров, комментарии), остальные параметры уменьшают число fsync и
+обращений к диску. Время ожидания блокировки здесь не задается: его задает
+только 'timeout' в OPTIONS базы (settings.DATABASES). Соединения держатся
+открытыми между запросами (CONN_MAX_AGE в settings.DATABASES), поэтому
+PRAGMA выполняются редко.
+"""
+import re
+
+from django.conf import settings
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # в КиБ, то есть 64 МБ
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_PRAGMA_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    pragmas = {**DEFAULT_SQLITE_PRAGMAS, **getattr(settings, 'NEWS_SQLITE_PRAGMAS', {})}
+    for name, value in pragmas.items():
+        if not _PRAGMA_RE.match(name) or not _VALUE_RE.match(str(value)):
+            raise ValueError(f'Некорректная PRAGMA в NEWS_SQLITE_PRAGMAS: {name} = {value}')
+    return pragmas
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: применяет PRAGMA к новому соединению SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
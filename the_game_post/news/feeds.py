@@ -0,0 +1,239 @@
+"""
+Ленты RSS/Atom и карта сайта для агрегаторов и поисковых роботов.
+
+Ленты - общая, по категории и по тегу, в форматах RSS 2.0 и Atom.
+Карта сайта - индекс (sitemap.xml), раздел с категориями и тегами и
+части со статьями по диапазонам id (NEWS_SITEMAP_CHUNK_SIZE статей в части),
+так что каждая часть - один запрос по первичному ключу.
+
+XML отдается потоком (StreamingHttpResponse) по мере чтения статей через
+.iterator(), поэтому память не растет с числом статей. Под ASGI поток
+отдается асинхронным итератором: синхронный Django собрал бы его в памяти
+целиком. Ответы кэшируются (кроме слишком больших) и поддерживают условные
+GET-запросы так же, как страницы (см. caching.py).
+"""
+from datetime import datetime, timezone as dt_timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Max
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+
+from . import caching, taxonomy
+from .models import Article, Category, Tag
+from .routers import read_from_replicas
+
+SITE_TITLE = 'The game post'
+SITE_DESCRIPTION = 'Новости игровой индустрии'
+
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'sitemap': 'application/xml; charset=utf-8',
+}
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+# Сколько символов XML собирать за один переход в синхронный поток под ASGI
+ASYNC_CHUNK_SIZE = 64 * 1024
+
+
+def _feed_size():
+    return getattr(settings, 'NEWS_FEED_SIZE', 50)
+
+
+def _chunk_size():
+    return getattr(settings, 'NEWS_SITEMAP_CHUNK_SIZE', 10000)
+
+
+def _updated(versions):
+    return datetime.fromtimestamp(versions.last_modified, tz=dt_timezone.utc)
+
+
+def _element(name, text, **attrs):
+    attributes = ''.join(f' {key}={quoteattr(str(value))}' for key, value in attrs.items())
+    return f'<{name}{attributes}>{escape(str(text))}</{name}>'
+
+
+def _rss(request, title, link, articles, updated):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+    yield _element('title', title)
+    yield _element('link', request.build_absolute_uri(link))
+    yield _element('description', SITE_DESCRIPTION)
+    yield '<atom:link href=%s rel="self"/>' % quoteattr(request.build_absolute_uri())
+    yield _element('lastBuildDate', rfc2822_date(updated))
+    for article in articles:
+        url = request.build_absolute_uri(article.get_absolute_url())
+        yield ''.join((
+            '<item>',
+            _element('title', article.title),
+            _element('link', url),
+            _element('guid', url, isPermaLink='true'),
+            _element('description', article.excerpt),
+            _element('pubDate', rfc2822_date(article.created_at)),
+            _element('category', article.category.name),
+            '</item>',
+        ))
+    yield '</channel></rss>\n'
+
+
+def _atom(request, title, link, articles, updated):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="ru">'
+    yield _element('title', title)
+    yield '<link href=%s rel="alternate"/>' % quoteattr(request.build_absolute_uri(link))
+    yield '<link href=%s rel="self"/>' % quoteattr(request.build_absolute_uri())
+    yield _element('id', request.build_absolute_uri())
+    yield _element('updated', rfc3339_date(updated))
+    for article in articles:
+        url = request.build_absolute_uri(article.get_absolute_url())
+        yield ''.join((
+            '<entry>',
+            _element('title', article.title),
+            '<link href=%s rel="alternate"/>' % quoteattr(url),
+            _element('id', url),
+            _element('published', rfc3339_date(article.created_at)),
+            _element('updated', rfc3339_date(article.updated_at)),
+            '<author>', _element('name', article.author.username), '</author>',
+            _element('summary', article.excerpt),
+            '<category term=%s/>' % quoteattr(article.category.name),
+            '</entry>',
+        ))
+    yield '</feed>\n'
+
+
+FEED_WRITERS = {'rss': _rss, 'atom': _atom}
+
+
+def _next_chunk(parts):
+    """Склеивает части до ASYNC_CHUNK_SIZE символов; пустая строка - конец"""
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= ASYNC_CHUNK_SIZE:
+            break
+    return ''.join(chunk)
+
+
+async def _async_content(content):
+    """Синхронный генератор XML как асинхронный итератор: запросы к базе - в потоке"""
+    parts = iter(content)
+    next_chunk = sync_to_async(_next_chunk)
+    while chunk := await next_chunk(parts):
+        yield chunk
+
+
+def _streaming(request, name, versions, content, kind):
+    if isinstance(request, ASGIRequest):
+        content = _async_content(content)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[kind])
+    caching.cache_streaming_response(caching.page_cache_key(request, name, versions), response)
+    return caching.patch_validators(request, response, name, versions)
+
+
+@read_from_replicas
+def article_feed(request, fmt, category_slug=None, tag_slug=None):
+    """Лента последних статей: общая, категории или тега"""
+    versions = caching.get_versions('articles', 'taxonomy')
+    name = f'feed_{fmt}'
+    cached = caching.cached_page(request, name, versions)
+    if cached:
+        return cached
+
+    snapshot = taxonomy.get_snapshot()
+    articles = Article.objects.published().select_related('author', 'category') \
+        .only('title', 'slug', 'excerpt', 'created_at', 'updated_at', 'author__username', 'category__name') \
+        .order_by('-created_at', '-id')
+    title, link = SITE_TITLE, reverse('news:article_list')
+    if category_slug:
+        category = snapshot.get_category(category_slug) or Category.objects.filter(slug=category_slug).first()
+        if category is None:
+            raise Http404('Категория не найдена')
+        articles = articles.filter(category=category)
+        title, link = f'{SITE_TITLE}: {category.name}', reverse('news:articles_by_category', args=[category.slug])
+    elif tag_slug:
+        tag = snapshot.get_tag(tag_slug) or Tag.objects.filter(slug=tag_slug).first()
+        if tag is None:
+            raise Http404('Тег не найден')
+        articles = articles.filter(tags=tag)
+        title, link = f'{SITE_TITLE}: #{tag.name}', reverse('news:articles_by_tag', args=[tag.slug])
+
+    size = _feed_size()
+    content = FEED_WRITERS[fmt](request, title, link, articles[:size].iterator(chunk_size=size), _updated(versions))
+    return _streaming(request, name, versions, content, fmt)
+
+
+def _sitemap_index(request, chunks):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield f'<sitemapindex xmlns="{SITEMAP_NS}">'
+    yield '<sitemap>%s</sitemap>' % _element('loc', request.build_absolute_uri(reverse('news:sitemap_sections')))
+    for chunk, lastmod in chunks:
+        url = request.build_absolute_uri(reverse('news:sitemap_chunk', args=[chunk]))
+        yield '<sitemap>%s%s</sitemap>' % (_element('loc', url), _element('lastmod', rfc3339_date(lastmod)))
+    yield '</sitemapindex>\n'
+
+
+def _urlset(request, entries):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield f'<urlset xmlns="{SITEMAP_NS}">'
+    for path, lastmod in entries:
+        parts = [_element('loc', request.build_absolute_uri(path))]
+        if lastmod:
+            parts.append(_element('lastmod', rfc3339_date(lastmod)))
+        yield '<url>%s</url>' % ''.join(parts)
+    yield '</urlset>\n'
+
+
+@read_from_replicas
+def sitemap_index(request):
+    """Индекс карты сайта: раздел категорий и тегов и части со статьями"""
+    versions = caching.get_versions('articles')
+    cached = caching.cached_page(request, 'sitemap_index', versions)
+    if cached:
+        return cached
+
+    # Номер части - (id - 1) // размер части; пустые части в индекс не попадают
+    chunks = Article.objects.published().order_by() \
+        .annotate(chunk=(F('id') - 1) / _chunk_size()) \
+        .values('chunk').annotate(lastmod=Max('updated_at')).order_by('chunk') \
+        .values_list('chunk', 'lastmod')
+    return _streaming(request, 'sitemap_index', versions, _sitemap_index(request, chunks.iterator()), 'sitemap')
+
+
+@read_from_replicas
+def sitemap_sections(request):
+    """Главная, категории и теги"""
+    versions = caching.get_versions('taxonomy')
+    cached = caching.cached_page(request, 'sitemap_sections', versions)
+    if cached:
+        return cached
+
+    snapshot = taxonomy.get_snapshot()
+    entries = [(reverse('news:article_list'), None)]
+    entries += [(reverse('news:articles_by_category', args=[c.slug]), None) for c in snapshot.categories]
+    entries += [(reverse('news:articles_by_tag', args=[t.slug]), None) for t in snapshot.tags]
+    return _streaming(request, 'sitemap_sections', versions, _urlset(request, entries), 'sitemap')
+
+
+@read_from_replicas
+def sitemap_chunk(request, chunk):
+    """Статьи с id из диапазона части"""
+    versions = caching.get_versions('articles')
+    cached = caching.cached_page(request, 'sitemap_chunk', versions)
+    if cached:
+        return cached
+
+    size = _chunk_size()
+    articles = Article.objects.published() \
+        .filter(pk__gt=chunk * size, pk__lte=(chunk + 1) * size) \
+        .order_by('pk').only('slug', 'updated_at')
+    if not articles.exists():
+        raise Http404('Часть карты сайта не найдена')
+    entries = ((article.get_absolute_url(), article.updated_at) for article in articles.iterator(chunk_size=2000))
+    return _streaming(request, 'sitemap_chunk', versions, _urlset(request, entries), 'sitemap')
@@ -0,0 +1,227 @@
+"""
+Уменьшенные копии изображений статей для srcset.
+
+Для миниатюр статей и картинок блоков генерируются варианты фиксированной
+ширины в WebP и JPEG. Файлы кладутся в MEDIA_ROOT/derivatives/<хэш>/,
+где хэш - SHA-256 содержимого оригинала: одинаковые картинки, загруженные
+дважды, обрабатываются один раз. Генерация идет в пуле потоков при загрузке
+(signals.py) или по требованию при первом показе, и может быть повторена
+командой regenerate_images.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from .caching import article_scope, bump_versions, get_cache
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+CACHE_PREFIX = 'news:image:'
+FORMATS = (
+    # (расширение, формат Pillow, параметры сохранения)
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+FAILED = 'failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def get_widths():
+    return tuple(getattr(settings, 'NEWS_IMAGE_WIDTHS', (320, 640, 1280)))
+
+
+def _index_name(name):
+    """Файл, связывающий имя оригинала с хэшем содержимого"""
+    return f'{DERIVATIVES_DIR}/index/{hashlib.md5(name.encode()).hexdigest()}.txt'
+
+
+def _manifest_name(digest):
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}/manifest.json'
+
+
+def _variant_name(digest, width, ext):
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}/{width}.{ext}'
+
+
+def _read(name):
+    with default_storage.open(name, 'rb') as f:
+        return f.read()
+
+
+def _write(name, content):
+    """
+    Записывает файл и возвращает имя, под которым он сохранен. Содержимое
+    пишется под уникальным временным именем и атомарно заменяет файл name,
+    так что параллельная генерация не удаляет чужой файл, а читатели не видят
+    недописанного. Хранилище без локальных путей само выбирает свободное имя.
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return default_storage.save(name, ContentFile(content))
+    temp_name = default_storage.save(f'{name}.tmp', ContentFile(content))
+    try:
+        os.replace(default_storage.path(temp_name), path)
+    except BaseException:
+        # После удачной замены имя .tmp может занять другой поток, удаляем только свой файл
+        default_storage.delete(temp_name)
+        raise
+    return name
+
+
+def _render_variants(data, digest):
+    """Создает варианты изображения, возвращает манифест {формат: [[ширина, имя], ...]}"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        widths = [width for width in get_widths() if width < image.width] or [image.width]
+
+        manifest = {ext: [] for ext, _, _ in FORMATS}
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+            for ext, pil_format, options in FORMATS:
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, **options)
+                name = _write(_variant_name(digest, width, ext), buffer.getvalue())
+                manifest[ext].append([width, name])
+    return manifest
+
+
+def generate_derivatives(name, force=False):
+    """
+    Генерирует варианты для файла из MEDIA_ROOT и возвращает манифест.
+    Если варианты с таким же содержимым уже есть, только связывает с ними имя.
+    """
+    data = _read(name)
+    digest = hashlib.sha256(data).hexdigest()
+    manifest_name = _manifest_name(digest)
+
+    if not force and default_storage.exists(manifest_name):
+        manifest = json.loads(_read(manifest_name))
+    else:
+        manifest = _render_variants(data, digest)
+        _write(manifest_name, json.dumps(manifest).encode())
+    _write(_index_name(name), digest.encode())
+    get_cache().set(CACHE_PREFIX + name, manifest, timeout=None)
+    return manifest
+
+
+def _variants_ready(name):
+    """
+    Сбрасывает кэш страниц и фрагментов со статьями, у которых это миниатюра:
+    до появления вариантов в них попал обычный <img>.
+    """
+    from .models import Article
+
+    slugs = list(Article.objects.filter(thumbnail=name).values_list('slug', flat=True))
+    if slugs:
+        bump_versions('articles', *(article_scope(slug) for slug in slugs))
+
+
+def _generate_in_background(name):
+    try:
+        generate_derivatives(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        get_cache().set(CACHE_PREFIX + name, FAILED, timeout=3600)
+        return
+    finally:
+        _in_flight.discard(name)
+    # Варианты уже записаны: ошибка сброса кэша не делает изображение сломанным
+    try:
+        _variants_ready(name)
+    except Exception:
+        logger.exception('Не удалось сбросить кэш статей с изображением %s', name)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'NEWS_IMAGE_WORKERS', 2),
+            thread_name_prefix='news-images',
+        )
+    return _executor
+
+
+def schedule(name):
+    """Ставит генерацию вариантов в очередь пула (повторные вызовы игнорируются)"""
+    with _executor_lock:
+        if not name or name in _in_flight:
+            return None
+        _in_flight.add(name)
+        executor = _get_executor()
+    return executor.submit(_generate_in_background, name)
+
+
+def _stored_manifest(name):
+    """Манифест из кэша или из хранилища (через индекс имени), иначе None"""
+    cache = get_cache()
+    manifest = cache.get(CACHE_PREFIX + name)
+    if manifest is None:
+        index_name = _index_name(name)
+        if default_storage.exists(index_name):
+            digest = _read(index_name).decode()
+            manifest_name = _manifest_name(digest)
+            if default_storage.exists(manifest_name):
+                manifest = json.loads(_read(manifest_name))
+                cache.set(CACHE_PREFIX + name, manifest, timeout=None)
+    return manifest
+
+
+def get_manifest(name):
+    """
+    Манифест вариантов изображения или None, если их еще нет.
+    Отсутствующие варианты ставятся в очередь на генерацию.
+    """
+    if not name:
+        return None
+    manifest = _stored_manifest(name)
+    if manifest is None:
+        schedule(name)
+        return None
+    return None if manifest == FAILED else manifest
+
+
+def ensure_derivatives(name):
+    """Как get_manifest, но отсутствующие варианты генерируются сразу"""
+    if not name:
+        return None
+    manifest = _stored_manifest(name)
+    if manifest is None:
+        try:
+            manifest = generate_derivatives(name)
+        except Exception:
+            logger.exception('Не удалось обработать изображение %s', name)
+            return None
+    return None if manifest == FAILED else manifest
+
+
+def srcsets(image):
+    """{формат: строка srcset} для поля изображения или None"""
+    manifest = get_manifest(getattr(image, 'name', None))
+    if not manifest:
+        return None
+    return {
+        ext: ', '.join(f'{default_storage.url(name)} {width}w' for width, name in variants)
+        for ext, variants in manifest.items()
+    }
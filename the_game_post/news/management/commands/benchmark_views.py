@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from news.benchmark import compare_with_baseline, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа, число SQL-запросов и размер ответа основных страниц. '
+        'Запускать на базе, заполненной командой seed_news.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--concurrency', type=int, default=1, help='Число параллельных потоков')
+        parser.add_argument(
+            '--base-url',
+            help='Замерять запущенный сервер по HTTP (например, http://127.0.0.1:8000), '
+                 'чтобы сравнить WSGI и ASGI на одной нагрузке',
+        )
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Запустить только этот сценарий')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--baseline', help='JSON с прошлым прогоном для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно базовой линии (доля, по умолчанию 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        # Тестовый клиент требует окружения как в тестах (ALLOWED_HOSTS и т.п.)
+        setup_test_environment()
+        report = run_benchmark(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            cold=options['cold'],
+            concurrency=options['concurrency'],
+            base_url=options['base_url'],
+            seed=options['seed'],
+            scenarios=options['scenarios'],
+        )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Обнаружены регрессии:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news import caching
+from news.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сохраненный HTML и краткое содержание статей из блоков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Только статьи без собранного HTML')
+
+    def handle(self, *args, **options):
+        if not caching.is_shared():
+            raise CommandError(caching.NOT_SHARED_MESSAGE)
+        articles = Article.objects.order_by('pk')
+        if options['missing']:
+            articles = articles.filter(body_html='')
+        total = 0
+        for article in articles.iterator(chunk_size=500):
+            article.compile_body()
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Собрано статей: {total}'))
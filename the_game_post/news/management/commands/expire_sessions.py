@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from news import sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет истекшие сессии из базы пачками (замена clearsessions для больших '
+        'таблиц). Запускать периодически, например из cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сессий в одном DELETE')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между пачками, секунд')
+
+    def handle(self, *args, **options):
+        if sessions.session_model() is None:
+            self.stdout.write(self.style.WARNING(
+                f'{settings.SESSION_ENGINE} не хранит сессии в базе, удалять нечего'
+            ))
+            return
+        deleted = sessions.expire_sessions(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено истекших сессий: {deleted}'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from news import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгружает статьи с блоками, тегами и категориями в JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Файл JSONL или "-" для вывода в stdout')
+        parser.add_argument('--media-dir', help='Куда скопировать файлы изображений')
+        parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=transfer.MEDIA_WORKERS,
+                            help='Потоков для копирования файлов')
+
+    def handle(self, *args, **options):
+        kwargs = {
+            'media_dir': options['media_dir'],
+            'batch_size': options['batch_size'],
+            'workers': options['workers'],
+        }
+        if options['output'] == '-':
+            result = transfer.export_articles(self.stdout, **kwargs)
+            # Итог - в stderr, чтобы не смешивать его с данными
+            out = self.stderr
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                result = transfer.export_articles(output, **kwargs)
+            out = self.stdout
+        out.write(f"Выгружено статей: {result['articles']}, файлов: {result['media']}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from news.view_counter import CacheViewBuffer, get_view_buffer, flush_views
+
+
+class Command(BaseCommand):
+    help = 'Сбрасывает накопленные просмотры статей в базу данных'
+
+    def handle(self, *args, **options):
+        buffer = get_view_buffer()
+        if not isinstance(buffer, CacheViewBuffer):
+            self.stdout.write(self.style.WARNING(
+                'NEWS_VIEW_BUFFER = "local": просмотры хранятся в памяти процессов сервера '
+                'и сбрасываются их фоновым потоком. Команда работает с буфером "cache".'
+            ))
+        flushed = flush_views(buffer)
+        self.stdout.write(self.style.SUCCESS(f'Сброшено просмотров: {flushed}'))
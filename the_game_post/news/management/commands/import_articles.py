@@ -0,0 +1,46 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand, CommandError
+
+from news import caching, transfer
+
+
+class Command(BaseCommand):
+    help = 'Загружает статьи из JSONL пакетными вставками (существующие slug пропускаются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл JSONL или "-" для чтения из stdin')
+        parser.add_argument('--media-dir', help='Откуда копировать файлы изображений')
+        parser.add_argument('--default-author', help='Пользователь для статей с неизвестным автором')
+        parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=transfer.MEDIA_WORKERS,
+                            help='Потоков для копирования файлов')
+
+    def handle(self, *args, **options):
+        if not caching.is_shared():
+            raise CommandError(caching.NOT_SHARED_MESSAGE)
+        default_author = None
+        if options['default_author']:
+            default_author = User.objects.filter(username=options['default_author']).first()
+            if default_author is None:
+                raise CommandError(f"Пользователь {options['default_author']} не найден")
+
+        kwargs = {
+            'media_dir': options['media_dir'],
+            'default_author': default_author,
+            'batch_size': options['batch_size'],
+            'workers': options['workers'],
+        }
+        try:
+            if options['input'] == '-':
+                result = transfer.import_articles(sys.stdin, **kwargs)
+            else:
+                with open(options['input'], encoding='utf-8') as lines:
+                    result = transfer.import_articles(lines, **kwargs)
+        except (KeyError, ValueError, SuspiciousFileOperation) as error:
+            raise CommandError(f'Импорт остановлен: {error}') from error
+
+        summary = ', '.join(f'{name}: {count}' for name, count in result.items())
+        self.stdout.write(self.style.SUCCESS(f'Импортировано - {summary}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс статей (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=search.INDEX_BATCH_SIZE,
+            help='Сколько статей индексировать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано статей: {total}'))
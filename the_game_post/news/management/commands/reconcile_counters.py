@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news import caching, counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики комментариев статей и статей тегов с данными и исправляет расхождения'
+
+    def handle(self, *args, **options):
+        if not caching.is_shared():
+            raise CommandError(caching.NOT_SHARED_MESSAGE)
+        fixed = counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Исправлено статей: {fixed['articles']}, тегов: {fixed['tags']}"
+        ))
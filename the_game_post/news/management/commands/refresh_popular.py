@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news import caching
+from news.ranking import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги популярных статей и сохраняет их в кэш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, help='Длина каждого списка (по умолчанию NEWS_POPULAR_SIZE)')
+
+    def handle(self, *args, **options):
+        if not caching.is_shared():
+            raise CommandError(caching.NOT_SHARED_MESSAGE)
+        scopes = refresh_rankings(size=options['size'])
+        self.stdout.write(self.style.SUCCESS(f'Обновлено рейтингов: {scopes}'))
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from news.images import generate_derivatives
+from news.models import Article, ArticleBlock
+
+
+class Command(BaseCommand):
+    help = 'Генерирует уменьшенные копии миниатюр статей и изображений блоков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать уже существующие варианты')
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'NEWS_IMAGE_WORKERS', 2),
+            help='Число потоков обработки',
+        )
+
+    def handle(self, *args, **options):
+        names = set(
+            Article.objects.exclude(thumbnail='').exclude(thumbnail__isnull=True)
+            .values_list('thumbnail', flat=True)
+        )
+        names.update(
+            ArticleBlock.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('image', flat=True)
+        )
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_derivatives, name, options['force']): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {done}, с ошибками: {failed}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from news.benchmark import seed_corpus
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими статьями, тегами и комментариями для замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=30)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=10, help='Комментариев на статью')
+        parser.add_argument('--blocks', type=int, default=4, help='Максимум блоков на статью')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        created = seed_corpus(
+            articles=options['articles'],
+            tags=options['tags'],
+            users=options['users'],
+            comments_per_article=options['comments'],
+            blocks_per_article=options['blocks'],
+            seed=options['seed'],
+        )
+        summary = ', '.join(f'{name}: {count}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Создано - {summary}'))
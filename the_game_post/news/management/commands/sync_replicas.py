@@ -0,0 +1,42 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from news.routers import get_read_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик (NEWS_READ_DATABASES). '
+        'Для локальной проверки маршрутизации чтения; запускать после миграций '
+        'и периодически, например из cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases', help='Только эта реплика')
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Команда копирует только SQLite; для PostgreSQL используйте потоковую репликацию')
+        replicas = options['databases'] or get_read_databases()
+        if not replicas:
+            raise CommandError('Реплики не настроены (DATABASE_REPLICAS в окружении)')
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in replicas:
+                if alias not in get_read_databases():
+                    raise CommandError(f'{alias} не является репликой')
+                # Закрываем соединение Django, чтобы не читать из него старые данные
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    # Backup API дает согласованную копию даже при одновременной записи
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'{alias}: скопировано'))
+        finally:
+            source.close()
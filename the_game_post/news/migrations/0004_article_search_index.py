@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS news_article_fts USING fts5("
+        "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    # Совпадение в заголовке весит больше, чем в тексте
+    schema_editor.execute(
+        "INSERT INTO news_article_fts (news_article_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    # Индексируем уже существующие статьи
+    schema_editor.execute(
+        "INSERT INTO news_article_fts (rowid, title, body) "
+        "SELECT a.id, a.title, COALESCE(("
+        "  SELECT group_concat(content, char(10) || char(10)) FROM ("
+        "    SELECT b.content FROM news_articleblock b"
+        "    WHERE b.article_id = a.id AND b.block_type = 'text' ORDER BY b.\"order\", b.id"
+        "  )"
+        "), '') FROM news_article a"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS news_article_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
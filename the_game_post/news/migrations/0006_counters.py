@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Article = apps.get_model('news', 'Article')
+    Comment = apps.get_model('news', 'Comment')
+    Tag = apps.get_model('news', 'Tag')
+
+    comments = Comment.objects.filter(article=OuterRef('pk'), is_approved=True) \
+        .order_by().values('article').annotate(total=Count('pk')).values('total')
+    Article.objects.update(
+        approved_comment_count=Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+    )
+
+    articles = Article.tags.through.objects.filter(tag=OuterRef('pk'), article__is_published=True) \
+        .order_by().values('tag').annotate(total=Count('pk')).values('total')
+    Tag.objects.update(
+        published_article_count=Coalesce(Subquery(articles, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_article_body_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Одобренных комментариев'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='published_article_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликованных статей'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def compile_bodies(apps, schema_editor):
+    """Собирает HTML и выжимку статей, созданных до появления этих полей"""
+    from news.models import Article as CurrentArticle
+
+    Article = apps.get_model('news', 'Article')
+    ArticleBlock = apps.get_model('news', 'ArticleBlock')
+
+    for article in Article.objects.filter(body_html='').order_by('pk').iterator(chunk_size=500):
+        blocks = ArticleBlock.objects.filter(article_id=article.pk).order_by('order', 'id')
+        body_html, excerpt = CurrentArticle.render_body(blocks)
+        Article.objects.filter(pk=article.pk).update(body_html=body_html, excerpt=excerpt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(compile_bodies, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,13 @@
-from django.db import models
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Prefetch, Q
 from django.contrib.auth.models import User
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.text import Truncator
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
@@ -20,6 +26,9 @@ class Tag(models.Model):
     slug = models.SlugField(unique=True, verbose_name="URL")
     color = models.CharField(max_length=7, default="#3498db", verbose_name="Цвет тега", 
                            help_text="В формате HEX, например: #3498db")
+    # Поддерживается сигналами (см. counters.py)
+    published_article_count = models.PositiveIntegerField(default=0, editable=False,
+                                                          verbose_name="Опубликованных статей")
     
     class Meta:
         verbose_name = "Тег"
@@ -28,6 +37,25 @@ class Tag(models.Model):
     
     def __str__(self):
         return self.name    
+
+class ArticleQuerySet(models.QuerySet):
+    def published(self):
+        """Только опубликованные статьи"""
+        return self.filter(is_published=True)
+
+    def with_list_data(self):
+        """Подгружает всё, что нужно карточке статьи, фиксированным числом запросов"""
+        return self.select_related('author', 'category').prefetch_related('tags')
+
+    def with_first_block(self):
+        """Подгружает первый блок каждой статьи одним запросом"""
+        return self.prefetch_related(Prefetch(
+            'blocks',
+            queryset=ArticleBlock.objects.order_by('order', 'id')[:1],
+            to_attr='first_blocks',
+        ))
+
+
 class Article(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     slug = models.SlugField(unique=True, verbose_name="URL")
@@ -45,11 +73,38 @@ class Article(models.Model):
     views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
     tags = models.ManyToManyField(Tag, blank=True, related_name='articles', verbose_name="Теги")
     comments_enabled = models.BooleanField(default=True, verbose_name="Комментарии включены")
+    # Собираются из блоков методом compile_body() после сохранения блоков (signals.py)
+    body_html = models.TextField(blank=True, editable=False, verbose_name="HTML статьи")
+    excerpt = models.TextField(blank=True, editable=False, verbose_name="Краткое содержание")
+    # Поддерживается сигналами (см. counters.py)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False,
+                                                         verbose_name="Одобренных комментариев")
+
+    objects = ArticleQuerySet.as_manager()
+
+    EXCERPT_WORDS = 30
     
     class Meta:
         verbose_name = "Статья"
         verbose_name_plural = "Статьи"
         ordering = ['-created_at']
+        indexes = [
+            # Лента опубликованных статей, в том числе курсорная пагинация
+            models.Index(
+                fields=['-created_at', '-id'], condition=Q(is_published=True),
+                name='article_published_idx',
+            ),
+            # Лента категории
+            models.Index(
+                fields=['category', '-created_at', '-id'], condition=Q(is_published=True),
+                name='article_pub_category_idx',
+            ),
+            # Популярные статьи
+            models.Index(
+                fields=['-views'], condition=Q(is_published=True),
+                name='article_pub_views_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.title
@@ -58,13 +113,52 @@ class Article(models.Model):
         return reverse('news:article_detail', kwargs={'slug': self.slug})
     
     def increment_views(self):
-        """Увеличивает счетчик просмотров на 1"""
-        self.views += 1
-        self.save(update_fields=['views'])
+        """
+        Учитывает просмотр статьи. Запись в базу откладывается:
+        просмотр попадает в буфер, который сбрасывается пакетно (см. view_counter).
+        """
+        from .view_counter import record_view
+
+        # Показываем читателю значение с учетом еще не сброшенных просмотров
+        self.views += record_view(self.pk)
     
+    @classmethod
+    def render_body(cls, blocks):
+        """HTML тела и выжимка из блоков (в порядке показа) без сохранения"""
+        from . import images
+
+        blocks = list(blocks)
+        for block in blocks:
+            if block.block_type == 'image' and block.image:
+                images.ensure_derivatives(block.image.name)
+
+        body_html = render_to_string('news/article_body.html', {'blocks': blocks}).strip()
+        first_text = next((block.content for block in blocks if block.block_type == 'text'), '')
+        return body_html, Truncator(' '.join(first_text.split())).words(cls.EXCERPT_WORDS)
+
+    def compile_body(self):
+        """
+        Собирает HTML тела статьи и текстовую выжимку для карточек из блоков
+        и сохраняет их, не трогая остальные поля. Варианты изображений
+        генерируются сразу, чтобы в сохраненный HTML попал srcset.
+        """
+        from .caching import article_scope, bump_versions
+
+        body_html, excerpt = self.render_body(self.blocks.order_by('order', 'id'))
+        if (body_html, excerpt) != (self.body_html, self.excerpt):
+            self.body_html, self.excerpt = body_html, excerpt
+            Article.objects.filter(pk=self.pk).update(body_html=body_html, excerpt=excerpt)
+            bump_versions('articles', article_scope(self.slug))
+
     def get_comments_count(self):
-        """Возвращает количество комментариев к статье"""
-        return self.comments.filter(is_approved=True).count()
+        """Возвращает количество одобренных комментариев к статье"""
+        return self.approved_comment_count
+
+    def get_first_block(self):
+        """Первый блок статьи для превью (использует prefetch, если он был)"""
+        if hasattr(self, 'first_blocks'):
+            return self.first_blocks[0] if self.first_blocks else None
+        return self.blocks.order_by('order', 'id').first()
 
 class ArticleBlock(models.Model):
     BLOCK_TYPES = [
@@ -83,10 +177,92 @@ class ArticleBlock(models.Model):
         verbose_name = "Блок статьи"
         verbose_name_plural = "Блоки статьи"
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['article', 'order'], name='articleblock_order_idx'),
+        ]
     
     def __str__(self):
         return f"{self.article.title} - {self.get_block_type_display()} ({self.order})"
 
+class CommentQuerySet(models.QuerySet):
+    def approved(self):
+        """Только одобренные комментарии"""
+        return self.filter(is_approved=True)
+
+    @transaction.atomic
+    def set_approved(self, approved):
+        """
+        Массово одобряет или снимает одобрение, обновляя счетчики статей.
+        update() не вызывает сигналы, поэтому счетчики меняются здесь же.
+        Возвращает число измененных комментариев.
+        """
+        from .caching import article_scope, bump_versions
+        from .counters import change_comment_count
+
+        # Строки блокируются до конца транзакции, чтобы разница была точной
+        rows = list(
+            self.exclude(is_approved=approved).select_for_update()
+            .order_by().values_list('pk', 'article_id')
+        )
+        if not rows:
+            return 0
+        per_article = defaultdict(int)
+        for _, article_id in rows:
+            per_article[article_id] += 1 if approved else -1
+
+        updated = Comment.objects.filter(pk__in=[pk for pk, _ in rows]).update(is_approved=approved)
+        for article_id, delta in per_article.items():
+            change_comment_count(article_id, delta)
+
+        slugs = Article.objects.filter(pk__in=per_article).values_list('slug', flat=True)
+        bump_versions('comments', *(article_scope(slug) for slug in slugs))
+        return updated
+
+    def thread_for(self, article, max_depth=None):
+        """
+        Загружает одобренные комментарии статьи одним запросом и собирает
+        из них дерево в памяти. Возвращает список корневых комментариев;
+        у каждого комментария заполнены children, depth и can_reply.
+        Ветки, чей родитель не одобрен, не показываются.
+        """
+        return self._build_thread(article, list(self._thread_comments(article)), max_depth)
+
+    async def athread_for(self, article, max_depth=None):
+        """Асинхронный thread_for: комментарии читаются асинхронным ORM"""
+        comments = [comment async for comment in self._thread_comments(article)]
+        return self._build_thread(article, comments, max_depth)
+
+    def _thread_comments(self, article):
+        return self.approved().filter(article=article).select_related('author').order_by('created_at', 'id')
+
+    @staticmethod
+    def _build_thread(article, comments, max_depth):
+        if max_depth is None:
+            max_depth = getattr(settings, 'NEWS_COMMENT_MAX_DEPTH', 5)
+
+        by_id = {comment.pk: comment for comment in comments}
+        # Дерево хранится как список смежности: parent_id -> ответы
+        children = defaultdict(list)
+        for comment in comments:
+            comment.article = article
+            if comment.parent_id is not None:
+                parent = by_id.get(comment.parent_id)
+                if parent is None:
+                    continue
+                comment.parent = parent
+            children[comment.parent_id].append(comment)
+
+        roots = children[None]
+        stack = [(root, 0) for root in roots]
+        while stack:
+            comment, depth = stack.pop()
+            comment.depth = depth
+            comment.can_reply = depth + 1 < max_depth
+            comment.children = children.get(comment.pk, [])
+            stack.extend((child, depth + 1) for child in comment.children)
+        return roots
+
+
 class Comment(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='comments', verbose_name="Статья")
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Автор")
@@ -95,18 +271,37 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     is_approved = models.BooleanField(default=True, verbose_name="Одобрен")
+
+    objects = CommentQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['created_at']
+        indexes = [
+            # Ветка комментариев статьи и подсчет одобренных. Частичный индекс:
+            # SQLite не использует булево условие как равенство в составном ключе
+            models.Index(
+                fields=['article', 'parent', 'created_at'], condition=Q(is_approved=True),
+                name='comment_thread_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Комментарий от {self.author.username} к '{self.article.title}'"
+
+    def save(self, *args, **kwargs):
+        # Счетчик статьи обновляется сигналом в той же транзакции
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
     
     def is_reply(self):
         """Проверяет, является ли комментарий ответом"""
-        return self.parent is not None
+        return self.parent_id is not None
     
     def get_replies(self):
         """Возвращает все ответы на комментарий"""
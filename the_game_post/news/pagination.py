@@ -0,0 +1,110 @@
+"""
+Курсорная (keyset) пагинация лент статей.
+
+Страницы строятся по упорядочиванию (created_at, id) по убыванию: вместо
+OFFSET следующая страница выбирается условием "строго старше последней
+статьи текущей страницы", поэтому глубокие страницы стоят столько же,
+сколько первая, и общий COUNT(*) не нужен.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def use_cursor_pagination(request):
+    """Курсорный режим включается настройкой NEWS_PAGINATION или курсором в запросе"""
+    return getattr(settings, 'NEWS_PAGINATION', 'page') == 'cursor' or 'cursor' in request.GET
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, article):
+    if isinstance(article, dict):
+        # Строка из .values() (JSON API)
+        created_at, pk = article['created_at'], article['id']
+    else:
+        created_at, pk = article.created_at, article.pk
+    raw = f'{direction}|{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает курсор в (направление, created_at, id)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+    if direction not in ('n', 'p') or created_at is None:
+        raise InvalidCursor(token)
+    return direction, created_at, pk
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинатор по курсору; некорректный курсор ведет на первую страницу"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        try:
+            direction, created_at, pk = decode_cursor(cursor) if cursor else (None, None, None)
+        except InvalidCursor:
+            direction = None
+
+        if direction == 'p':
+            # Предыдущая страница: идем от курсора к более новым статьям
+            rows = list(self.queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            ).order_by('created_at', 'id')[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            queryset = self.queryset.order_by('-created_at', '-id')
+            if direction == 'n':
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+            rows = list(queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = direction == 'n'
+
+        if not rows:
+            return CursorPage([])
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor('n', rows[-1]) if has_next else None,
+            previous_cursor=encode_cursor('p', rows[0]) if has_previous else None,
+        )
@@ -0,0 +1,242 @@
+"""
+Профилирование запросов.
+
+ProfilingMiddleware (включается настройкой NEWS_PROFILING) для каждого
+запроса собирает имя представления, число SQL-запросов и их суммарное время,
+повторяющиеся запросы (признак N+1), время рендеринга шаблонов и размер
+ответа. Запись пишется в лог 'news.profiling' одной JSON-строкой и попадает
+в скользящую статистику процесса, которую показывает profiling_stats
+(только для персонала).
+"""
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('news.profiling')
+
+# Сколько повторяющихся запросов попадает в запись
+DUPLICATES_LIMIT = 5
+
+_current = ContextVar('news_profile', default=None)
+_render_hook_lock = threading.Lock()
+_render_hook_installed = False
+
+_IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def fingerprint(sql):
+    """
+    Отпечаток запроса: параметры Django передает отдельно, поэтому достаточно
+    свернуть списки IN (%s, %s, ...) разной длины и пробелы.
+    """
+    return _SPACES_RE.sub(' ', _IN_LIST_RE.sub('(%s, ...)', sql)).strip()
+
+
+class RequestProfile:
+    """Данные одного запроса; экземпляр служит execute_wrapper для соединений"""
+
+    def __init__(self):
+        self.queries = []
+        self.render_ms = 0.0
+        self.render_sql_ms = 0.0
+        self._render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries.append((fingerprint(sql), elapsed))
+            if self._render_depth:
+                self.render_sql_ms += elapsed
+
+    @property
+    def sql_ms(self):
+        return sum(elapsed for _, elapsed in self.queries)
+
+    def duplicates(self):
+        counts = Counter(sql for sql, _ in self.queries)
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in counts.most_common(DUPLICATES_LIMIT) if count > 1
+        ]
+
+
+def _install_render_hook():
+    """
+    Оборачивает рендеринг шаблонов Django, чтобы учитывать его время.
+    Считается только внешний вызов: include и inclusion-теги входят в него.
+    """
+    global _render_hook_installed
+    from django.template.backends.django import Template
+
+    with _render_hook_lock:
+        if _render_hook_installed:
+            return
+        render = Template.render
+
+        @functools.wraps(render)
+        def profiled_render(self, context=None, request=None):
+            profile = _current.get()
+            if profile is None:
+                return render(self, context, request)
+            profile._render_depth += 1
+            started = time.perf_counter()
+            try:
+                return render(self, context, request)
+            finally:
+                profile._render_depth -= 1
+                if not profile._render_depth:
+                    profile.render_ms += (time.perf_counter() - started) * 1000
+
+        Template.render = profiled_render
+        _render_hook_installed = True
+
+
+def _profile_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: передает запрос профилю текущего запроса"""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def _attach_query_hook(sender=None, connection=None, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+def _install_query_hook():
+    """
+    Подключает _profile_query ко всем соединениям, в том числе созданным
+    позже в других потоках. Профиль запроса берется из контекста, поэтому
+    запросы ORM из sync_to_async в ASGI попадают в профиль своего запроса.
+    """
+    connection_created.connect(_attach_query_hook, dispatch_uid='news_profile_queries')
+    for connection in connections.all(initialized_only=True):
+        _attach_query_hook(connection=connection)
+
+
+class RollingStats:
+    """Последние NEWS_PROFILING_WINDOW записей для каждого имени URL"""
+
+    METRICS = ('duration_ms', 'queries', 'sql_ms', 'render_ms', 'bytes')
+
+    def __init__(self, window=None):
+        self.window = window
+        self._records = defaultdict(self._new_window)
+        self._lock = threading.Lock()
+
+    def _new_window(self):
+        return deque(maxlen=self.window or getattr(settings, 'NEWS_PROFILING_WINDOW', 500))
+
+    def add(self, record):
+        with self._lock:
+            self._records[record['view']].append(record)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+    def summary(self):
+        """{имя URL: {'requests': n, метрика: {'p50', 'p95', 'p99'}}}"""
+        with self._lock:
+            snapshot = {view: list(records) for view, records in self._records.items()}
+        result = {}
+        for view, records in sorted(snapshot.items()):
+            row = {'requests': len(records)}
+            for metric in self.METRICS:
+                values = [record[metric] for record in records if record[metric] is not None]
+                row[metric] = {
+                    f'p{p}': round(percentile(values, p), 2) for p in (50, 95, 99)
+                }
+            result[view] = row
+        return result
+
+
+stats = RollingStats()
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование запросов; при NEWS_PROFILING = False отключается при загрузке.
+    Работает и в синхронном, и в асинхронном стеке (ASGI).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'NEWS_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _install_render_hook()
+        _install_query_hook()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, profile, started)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, profile, started)
+
+    def _record(self, request, response, profile, started):
+        duration = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view != 'news:profiling_stats':
+            record = {
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration, 2),
+                'queries': len(profile.queries),
+                'sql_ms': round(profile.sql_ms, 2),
+                'duplicates': profile.duplicates(),
+                'render_ms': round(profile.render_ms, 2),
+                'render_sql_ms': round(profile.render_sql_ms, 2),
+                'bytes': None if response.streaming else len(response.content),
+            }
+            logger.info(json.dumps(record, ensure_ascii=False))
+            stats.add(record)
+        return response
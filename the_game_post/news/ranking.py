@@ -0,0 +1,183 @@
+"""
+Рейтинг популярных статей с затуханием по времени.
+
+Рейтинг пересчитывается вне запросов и хранится в кэше как готовые списки
+id статей: общий, по каждой категории и по каждому тегу. Страница статьи
+только читает нужный список из кэша. Пересчитывает его фоновый поток
+процесса сервера раз в NEWS_POPULAR_REFRESH_INTERVAL секунд (при общем кэше -
+один процесс за интервал) или команда refresh_popular, если кэш общий.
+
+Оценка статьи - по мотивам формулы Hacker News:
+    (просмотры + COMMENT_WEIGHT * свежие комментарии) / (возраст в часах + 2) ** GRAVITY
+"""
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .caching import get_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'news:popular:'
+COMMENT_WEIGHT = 10
+GRAVITY = 1.5
+COMMENT_WINDOW = timedelta(days=7)
+BATCH_SIZE = 2000
+
+
+def scope_key(scope):
+    return f'{KEY_PREFIX}{scope}'
+
+
+def score(views, recent_comments, created_at, now):
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    return (views + COMMENT_WEIGHT * recent_comments) / (age_hours + 2) ** GRAVITY
+
+
+def compute_rankings(size=None, now=None):
+    """
+    Считает рейтинги за один проход по опубликованным статьям.
+    Возвращает {область: [id статей по убыванию оценки]}, где область -
+    'all', 'category:<id>' или 'tag:<id>'.
+    """
+    from .models import Article, Comment
+
+    size = size or getattr(settings, 'NEWS_POPULAR_SIZE', 10)
+    now = now or timezone.now()
+
+    recent_comments = dict(
+        Comment.objects.approved().filter(created_at__gte=now - COMMENT_WINDOW)
+        .order_by().values('article_id').annotate(total=Count('id'))
+        .values_list('article_id', 'total')
+    )
+    article_tags = defaultdict(list)
+    through = Article.tags.through.objects.filter(article__is_published=True)
+    for article_id, tag_id in through.values_list('article_id', 'tag_id').iterator(chunk_size=BATCH_SIZE):
+        article_tags[article_id].append(tag_id)
+
+    heaps = defaultdict(list)
+    articles = Article.objects.published().order_by().values_list('id', 'category_id', 'views', 'created_at')
+    for article_id, category_id, views, created_at in articles.iterator(chunk_size=BATCH_SIZE):
+        entry = (score(views, recent_comments.get(article_id, 0), created_at, now), article_id)
+        scopes = ['all', f'category:{category_id}']
+        scopes.extend(f'tag:{tag_id}' for tag_id in article_tags.get(article_id, ()))
+        for scope in scopes:
+            heap = heaps[scope]
+            if len(heap) < size:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    return {
+        scope: [article_id for _, article_id in sorted(heap, reverse=True)]
+        for scope, heap in heaps.items()
+    }
+
+
+def refresh_rankings(size=None, now=None):
+    """Пересчитывает рейтинги и сохраняет их в кэш, возвращает число областей"""
+    rankings = compute_rankings(size=size, now=now)
+    cache = get_cache()
+    # Списки областей, которые пропали из рейтинга (например, у тега не осталось статей)
+    stale = set(cache.get(scope_key('scopes'), ())) - set(rankings)
+    cache.set_many({scope_key(scope): ids for scope, ids in rankings.items()}, timeout=None)
+    cache.delete_many([scope_key(scope) for scope in stale])
+    cache.set(scope_key('scopes'), list(rankings), timeout=None)
+    return len(rankings)
+
+
+def refresh_if_due(interval):
+    """Пересчитывает рейтинги, если за interval секунд этого не сделал ни один процесс"""
+    if get_cache().add(scope_key('refreshing'), True, timeout=interval):
+        return refresh_rankings()
+    return None
+
+
+class _Refresher(threading.Thread):
+    """Фоновый поток, периодически пересчитывающий рейтинги"""
+
+    def __init__(self, interval):
+        super().__init__(name='news-ranking-refresher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Первый пересчет - сразу после запуска, а не через интервал
+        while True:
+            try:
+                refresh_if_due(self.interval)
+            except Exception:
+                logger.exception('Не удалось пересчитать рейтинг популярных статей')
+            finally:
+                close_old_connections()
+            if self.stopped.wait(self.interval):
+                return
+
+
+_refresher = None
+
+
+def start_ranking_refresher():
+    """
+    Запускает периодический пересчет рейтингов в фоне.
+    Вызывается из точек входа WSGI/ASGI; интервал задается NEWS_POPULAR_REFRESH_INTERVAL.
+    """
+    global _refresher
+    interval = getattr(settings, 'NEWS_POPULAR_REFRESH_INTERVAL', 300)
+    if _refresher is not None or not interval:
+        return
+    _refresher = _Refresher(interval)
+    _refresher.start()
+
+
+def get_ranked_ids(*scopes):
+    """Ранжированные id статей для областей в порядке приоритета, без повторов"""
+    found = get_cache().get_many([scope_key(scope) for scope in scopes])
+    ids = []
+    for scope in scopes:
+        for article_id in found.get(scope_key(scope), ()):
+            if article_id not in ids:
+                ids.append(article_id)
+    return ids
+
+
+def _popular_query(article, limit):
+    """Запрос строк популярных статей и ранжированные id (None, пока рейтинг не посчитан)"""
+    from .models import Article
+
+    fields = ('id', 'slug', 'title', 'views')
+    published = Article.objects.published().exclude(pk=article.pk)
+    ids = [pk for pk in get_ranked_ids(f'category:{article.category_id}', 'all') if pk != article.pk]
+    if not ids:
+        return published.order_by('-views').values(*fields)[:limit], None
+    return published.filter(pk__in=ids[:limit * 2]).values(*fields), ids
+
+
+def _ranked_rows(rows, ids, limit):
+    if ids is None:
+        return rows
+    by_id = {row['id']: row for row in rows}
+    return [by_id[pk] for pk in ids if pk in by_id][:limit]
+
+
+def get_popular_articles(article, limit=5):
+    """
+    Популярные статьи для страницы статьи: сначала из ее категории, затем общие.
+    Рейтинг берется из кэша, сами статьи - одним запросом по первичному ключу.
+    Пока рейтинг не посчитан, используются статьи с наибольшим числом просмотров.
+    """
+    rows, ids = _popular_query(article, limit)
+    return _ranked_rows(list(rows), ids, limit)
+
+
+async def aget_popular_articles(article, limit=5):
+    """Асинхронный get_popular_articles: строки читаются асинхронным ORM"""
+    rows, ids = _popular_query(article, limit)
+    return _ranked_rows([row async for row in rows], ids, limit)
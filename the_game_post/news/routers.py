@@ -0,0 +1,160 @@
+"""
+Разделение чтения и записи между основной базой и репликами.
+
+Публичные страницы, помеченные декоратором read_from_replicas, читают
+статьи, блоки, теги и категории с реплик (NEWS_READ_DATABASES). Остальное -
+запись, комментарии, пользователи и сессии, админка, команды - идет в
+основную базу. После любой записи клиент на NEWS_REPLICA_PIN_SECONDS
+закрепляется за основной базой cookie (PrimaryPinMiddleware), чтобы сразу
+видеть свои изменения, даже если реплика еще отстает. По той же причине
+страница, которую заполняют в кэш в первые NEWS_REPLICA_PIN_SECONDS после
+изменения ее данных, читается из основной базы (read_primary_if_changed).
+"""
+import functools
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'news_primary'
+REPLICA_MODELS = {'article', 'articleblock', 'tag', 'category'}
+
+_use_replicas = ContextVar('news_use_replicas', default=False)
+_wrote = ContextVar('news_wrote', default=False)
+
+
+def get_read_databases():
+    return list(getattr(settings, 'NEWS_READ_DATABASES', []))
+
+
+def _pin_seconds():
+    return getattr(settings, 'NEWS_REPLICA_PIN_SECONDS', 15)
+
+
+def _can_use_replicas(request):
+    return request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+
+
+def _enter_replicas():
+    # Учитываются только записи этого запроса
+    return _use_replicas.set(True), _wrote.set(False)
+
+
+def _exit_replicas(tokens):
+    use_token, wrote_token = tokens
+    wrote = _wrote.get()
+    _wrote.reset(wrote_token)
+    if wrote:
+        _wrote.set(True)
+    _use_replicas.reset(use_token)
+
+
+def read_from_replicas(view):
+    """Разрешает представлению читать с реплик (только GET/HEAD без закрепления)"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not _can_use_replicas(request):
+                return await view(request, *args, **kwargs)
+            tokens = _enter_replicas()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _exit_replicas(tokens)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _can_use_replicas(request):
+            return view(request, *args, **kwargs)
+        tokens = _enter_replicas()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _exit_replicas(tokens)
+    return wrapper
+
+
+def read_primary_if_changed(modified_at):
+    """
+    Если данные изменились недавно (modified_at - время в секундах), остаток
+    запроса читает из основной базы: реплика может еще не получить изменение,
+    и в кэш под новой версией попала бы старая страница.
+    """
+    if modified_at is not None and int(time.time()) - modified_at <= _pin_seconds():
+        _use_replicas.set(False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'news' or model._meta.model_name not in REPLICA_MODELS:
+            return None
+        if not _use_replicas.get() or _wrote.get():
+            return DEFAULT_DB_ALIAS
+        replicas = get_read_databases()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # До конца запроса все чтения тоже идут в основную базу
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы
+        databases = {DEFAULT_DB_ALIAS, *get_read_databases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики получают схему вместе с данными из основной базы
+        if db in get_read_databases():
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    """
+    Ставит cookie закрепления за основной базой, если запрос что-то записал.
+    Работает и в синхронном, и в асинхронном стеке (ASGI).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+        return self._pin(response, wrote)
+
+    async def __acall__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+        return self._pin(response, wrote)
+
+    def _pin(self, response, wrote):
+        if wrote and get_read_databases():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=_pin_seconds(),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,191 @@
+"""
+Полнотекстовый поиск по статьям на SQLite FTS5.
+
+Индекс news_article_fts (см. миграцию 0004) хранит заголовок и текст
+всех текстовых блоков статьи, rowid совпадает с id статьи. Индекс
+обновляется сигналами (signals.py) и перестраивается командой
+rebuild_search_index. На других СУБД поиск откатывается к icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'news_article_fts'
+INDEX_BATCH_SIZE = 1000
+
+# Маркеры подсветки в snippet(): текст экранируется до замены их на <mark>
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский ввод в безопасный запрос FTS5: каждое слово
+    берется в кавычки, слова объединяются через AND. По префиксу ищется только
+    последнее слово (его могут еще дописывать) - префиксные запросы дороже.
+    """
+    words = re.findall(r'\w+', text or '')[:16]
+    terms = ['"%s"' % word for word in words]
+    if terms and len(words[-1]) >= 2:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _article_documents(article_ids):
+    """Тексты для индекса: {id: (заголовок, текст блоков)}"""
+    from .models import Article, ArticleBlock
+
+    documents = {
+        pk: [title, []]
+        for pk, title in Article.objects.filter(pk__in=article_ids).values_list('pk', 'title')
+    }
+    blocks = ArticleBlock.objects.filter(
+        article_id__in=documents, block_type='text'
+    ).order_by('article_id', 'order', 'id').values_list('article_id', 'content')
+    for article_id, content in blocks:
+        documents[article_id][1].append(content)
+    return {pk: (title, '\n\n'.join(texts)) for pk, (title, texts) in documents.items()}
+
+
+def index_articles(article_ids):
+    """Переиндексирует указанные статьи (удаленные статьи убираются из индекса)"""
+    if not is_available() or not article_ids:
+        return
+    article_ids = list(article_ids)
+    documents = _article_documents(article_ids)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in article_ids]
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+            [(pk, title, body) for pk, (title, body) in documents.items()],
+        )
+
+
+def remove_articles(article_ids):
+    if not is_available() or not article_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in article_ids]
+        )
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE):
+    """Полностью перестраивает индекс, возвращает число проиндексированных статей"""
+    from .models import Article
+
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    total = 0
+    batch = []
+    for pk in Article.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            index_articles(batch)
+            total += len(batch)
+            batch = []
+    index_articles(batch)
+    total += len(batch)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def matching_ids_sql(text):
+    """Подзапрос с id статей, подходящих под запрос (для фильтра pk__in)"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [build_match_query(text)])
+
+
+def highlight(snippet):
+    html = escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+class ArticleSearch:
+    """
+    Результаты поиска опубликованных статей, отсортированные по релевантности
+    (rank = bm25 с повышенным весом заголовка, настроен в миграции).
+    Поддерживает count() и срезы, поэтому подходит для django.core.paginator.Paginator:
+    каждая страница - один запрос к FTS-индексу и один запрос за статьями.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.match = build_match_query(text)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self._count_fts() if is_available() else self._fallback().count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.match:
+            return []
+        offset = item.start or 0
+        limit = (item.stop - offset) if item.stop is not None else self.count()
+        if is_available():
+            return self._page_fts(offset, limit)
+        return list(self._fallback()[offset:offset + limit])
+
+    def _count_fts(self):
+        if not self.match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'JOIN news_article a ON a.id = {FTS_TABLE}.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s AND a.is_published',
+                [self.match],
+            )
+            return cursor.fetchone()[0]
+
+    def _page_fts(self, offset, limit):
+        from .models import Article
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {FTS_TABLE}.rowid, snippet({FTS_TABLE}, -1, %s, %s, %s, 24) FROM {FTS_TABLE} '
+                f'JOIN news_article a ON a.id = {FTS_TABLE}.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s AND a.is_published '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [_MARK_START, _MARK_END, '…', self.match, limit, offset],
+            )
+            rows = cursor.fetchall()
+
+        articles = Article.objects.with_list_data().defer('body_html').in_bulk([pk for pk, _ in rows])
+        results = []
+        for pk, snippet in rows:
+            article = articles.get(pk)
+            if article is not None:
+                article.search_snippet = highlight(snippet)
+                results.append(article)
+        return results
+
+    def _fallback(self):
+        from .models import Article
+
+        words = re.findall(r'\w+', self.text or '')
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(blocks__content__icontains=word)
+        return Article.objects.published().filter(condition).with_list_data().distinct()
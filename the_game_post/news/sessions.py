@@ -0,0 +1,75 @@
+"""
+Сессии и пользователь запроса без обращений к базе.
+
+Хранилище сессий выбирается в настройках (SESSION_ENGINE): cached_db читает
+сессию из кэша и идет в базу только при промахе, signed_cookies хранит ее в
+подписанной cookie. Пользователь запроса и так загружается лениво
+(AuthenticationMiddleware), поэтому анонимный читатель без cookie сессии не
+делает ни одного запроса. Для вошедших CachedModelBackend берет пользователя
+из кэша; запись сбрасывается сигналом при изменении или удалении
+пользователя, так что смена пароля по-прежнему завершает старые сессии.
+
+expire_sessions() удаляет истекшие сессии из базы пачками, чтобы не держать
+таблицу под одним большим DELETE.
+"""
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import get_cache
+
+USER_PREFIX = 'news:user:'
+
+
+def user_cache_key(user_id):
+    return f'{USER_PREFIX}{user_id}'
+
+
+def forget_user(user_id):
+    """Сбрасывает пользователя из кэша; вызывается сигналами"""
+    key = user_cache_key(user_id)
+    get_cache().delete(key)
+    # До фиксации транзакции другой запрос мог снова положить в кэш старые данные
+    transaction.on_commit(lambda: get_cache().delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который хранит пользователя сессии в кэше"""
+
+    def get_user(self, user_id):
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, getattr(settings, 'NEWS_USER_CACHE_TIMEOUT', 300))
+            return user
+        return user if self.user_can_authenticate(user) else None
+
+
+def session_model():
+    """Модель сессий текущего SESSION_ENGINE или None, если сессии не в базе"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    get_model_class = getattr(store, 'get_model_class', None)
+    return get_model_class() if get_model_class else None
+
+
+def expire_sessions(batch_size=1000, pause=0):
+    """Удаляет истекшие сессии пачками по batch_size; возвращает их число"""
+    model = session_model()
+    if model is None:
+        return 0
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(model.objects.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(pk__in=keys).delete()[0]
+        if pause:
+            time.sleep(pause)
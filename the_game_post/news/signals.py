@@ -0,0 +1,178 @@
+"""Инвалидация кэша страниц, фрагментов и пользователей, счетчики при изменении данных"""
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, images, search, sessions, taxonomy
+from .caching import article_scope, bump_versions
+from .models import Article, ArticleBlock, Category, Comment, Tag
+
+
+def _article_slug(instance):
+    """Slug статьи, к которой относится блок или комментарий (None, если статья удалена)"""
+    if type(instance).article.is_cached(instance):
+        return instance.article.slug
+    return Article.objects.filter(pk=instance.article_id).values_list('slug', flat=True).first()
+
+
+@receiver(pre_save, sender=Article)
+def remember_old_slug(sender, instance, **kwargs):
+    instance._old_slug = None
+    instance._was_published = None
+    instance._old_thumbnail = None
+    if instance.pk:
+        old = Article.objects.filter(pk=instance.pk).values_list('slug', 'is_published', 'thumbnail').first()
+        if old:
+            instance._old_slug, instance._was_published, instance._old_thumbnail = old
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article(sender, instance, **kwargs):
+    scopes = ['articles', article_scope(instance.slug)]
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug and old_slug != instance.slug:
+        scopes.append(article_scope(old_slug))
+    bump_versions(*scopes)
+
+
+@receiver(post_save, sender=ArticleBlock)
+@receiver(post_delete, sender=ArticleBlock)
+def invalidate_article_block(sender, instance, **kwargs):
+    slug = _article_slug(instance)
+    if slug:
+        # Выжимка из блоков показывается в карточках статей
+        bump_versions('articles', article_scope(slug))
+
+
+def _compile_article(article_id):
+    article = Article.objects.filter(pk=article_id).first()
+    if article is not None:
+        article.compile_body()
+
+
+@receiver(post_save, sender=ArticleBlock)
+@receiver(post_delete, sender=ArticleBlock)
+def compile_article_body(sender, instance, **kwargs):
+    # HTML и выжимка собираются после фиксации, когда сохранены все блоки
+    # (инлайн админки пишет их пачкой); повторная сборка без изменений ничего не пишет
+    transaction.on_commit(partial(_compile_article, instance.article_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    slug = _article_slug(instance)
+    if slug:
+        bump_versions('comments', article_scope(slug))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_taxonomy(sender, instance, **kwargs):
+    taxonomy.changed()
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def invalidate_article_tags(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Изменены статьи тега: затрагивает страницы всех этих статей
+        bump_versions('articles')
+        taxonomy.changed()
+    else:
+        bump_versions('articles', article_scope(instance.slug))
+
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, **kwargs):
+    search.index_articles([instance.pk])
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    search.remove_articles([instance.pk])
+
+
+@receiver(post_save, sender=ArticleBlock)
+@receiver(post_delete, sender=ArticleBlock)
+def index_article_block(sender, instance, **kwargs):
+    search.index_articles([instance.article_id])
+
+
+@receiver(post_save, sender=Article)
+def prepare_thumbnail_variants(sender, instance, **kwargs):
+    # Сохранения без новой миниатюры (просмотры, метаданные) файл не перечитывают
+    if instance.thumbnail and instance.thumbnail.name != getattr(instance, '_old_thumbnail', None):
+        images.schedule(instance.thumbnail.name)
+
+
+@receiver(post_save, sender=ArticleBlock)
+def prepare_block_image_variants(sender, instance, **kwargs):
+    if instance.image:
+        images.schedule(instance.image.name)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_state(sender, instance, **kwargs):
+    instance._was_approved = None
+    if instance.pk:
+        instance._was_approved = Comment.objects.filter(pk=instance.pk) \
+            .values_list('is_approved', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    was_approved = bool(getattr(instance, '_was_approved', None))
+    if instance.is_approved != was_approved:
+        counters.change_comment_count(instance.article_id, 1 if instance.is_approved else -1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.is_approved:
+        counters.change_comment_count(instance.article_id, -1)
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def count_tag_articles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # После очистки связей уже не узнать, какие теги затронуты
+        if reverse:
+            instance._cleared_tag_ids = [instance.pk]
+        else:
+            instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        counters.refresh_tag_counts(getattr(instance, '_cleared_tag_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        counters.refresh_tag_counts([instance.pk] if reverse else pk_set or [])
+
+
+@receiver(post_save, sender=Article)
+def count_published_article(sender, instance, created, **kwargs):
+    was_published = bool(getattr(instance, '_was_published', None))
+    if not created and instance.is_published != was_published:
+        counters.refresh_tag_counts(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Article)
+def remember_article_tags(sender, instance, **kwargs):
+    instance._tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def count_deleted_article(sender, instance, **kwargs):
+    counters.refresh_tag_counts(getattr(instance, '_tag_ids', []))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # Новый пароль или is_active должны сразу действовать на сессии
+    sessions.forget_user(instance.pk)
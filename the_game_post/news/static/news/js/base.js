@@ -0,0 +1,37 @@
+function toggleDropdown() {
+    const dropdown = document.getElementById('dropdownMenu');
+    const overlay = document.getElementById('overlay');
+    
+    if (dropdown.classList.contains('show')) {
+        closeDropdown();
+    } else {
+        dropdown.classList.add('show');
+        overlay.style.display = 'block';
+    }
+}
+
+function closeDropdown() {
+    const dropdown = document.getElementById('dropdownMenu');
+    const overlay = document.getElementById('overlay');
+    
+    dropdown.classList.remove('show');
+    overlay.style.display = 'none';
+}
+
+// Закрытие меню при клике вне его
+document.addEventListener('click', function(event) {
+    const dropdown = document.getElementById('dropdownMenu');
+    const userIcon = document.querySelector('.user-icon');
+    const overlay = document.getElementById('overlay');
+    
+    if (!userIcon.contains(event.target) && !dropdown.contains(event.target)) {
+        closeDropdown();
+    }
+});
+
+// Закрытие меню при нажатии ESC
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+        closeDropdown();
+    }
+});
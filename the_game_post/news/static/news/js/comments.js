@@ -0,0 +1,173 @@
+// Показать форму ответа
+function showReplyForm(commentId) {
+    console.log('Показать форму ответа для комментария:', commentId);
+    
+    // Скрываем все открытые формы ответов
+    const allReplyForms = document.querySelectorAll('.reply-form');
+    allReplyForms.forEach(form => {
+        form.style.display = 'none';
+    });
+    
+    // Показываем нужную форму
+    const replyForm = document.getElementById('reply-form-' + commentId);
+    if (replyForm) {
+        replyForm.style.display = 'block';
+        
+        // Плавная прокрутка к форме
+        replyForm.scrollIntoView({ 
+            behavior: 'smooth', 
+            block: 'center' 
+        });
+        
+        // Фокусируемся на текстовом поле
+        const textarea = replyForm.querySelector('textarea');
+        if (textarea) {
+            textarea.focus();
+        }
+    } else {
+        console.error('Форма ответа не найдена для комментария:', commentId);
+    }
+}
+
+// Скрыть форму ответа
+function hideReplyForm(commentId) {
+    console.log('Скрыть форму ответа для комментария:', commentId);
+    
+    const replyForm = document.getElementById('reply-form-' + commentId);
+    if (replyForm) {
+        replyForm.style.display = 'none';
+        
+        // Очищаем текстовое поле
+        const textarea = replyForm.querySelector('textarea');
+        if (textarea) {
+            textarea.value = '';
+        }
+    }
+}
+
+// Простая версия отправки формы (без AJAX)
+function submitReplyForm(form, commentId) {
+    const textarea = form.querySelector('textarea');
+    if (textarea && !textarea.value.trim()) {
+        alert('Введите текст ответа!');
+        return false;
+    }
+    return true; // Продолжить стандартную отправку формы
+}
+
+// Делегирование событий для динамически созданных кнопок
+document.addEventListener('DOMContentLoaded', function() {
+    console.log('DOM загружен, инициализация системы комментариев');
+    
+    // Обработчик для всех кнопок "Ответить" (включая вложенные)
+    document.addEventListener('click', function(event) {
+        if (event.target.classList.contains('btn-reply')) {
+            const commentId = event.target.getAttribute('onclick')?.match(/\d+/)?.[0];
+            if (commentId) {
+                showReplyForm(parseInt(commentId));
+            }
+        }
+    });
+    
+    // Обработчик для всех кнопок "Отмена"
+    document.addEventListener('click', function(event) {
+        if (event.target.classList.contains('btn-secondary') && 
+            event.target.textContent.includes('Отмена')) {
+            const commentId = event.target.getAttribute('onclick')?.match(/\d+/)?.[0];
+            if (commentId) {
+                hideReplyForm(parseInt(commentId));
+            }
+        }
+    });
+    
+    // Прокрутка к комментарию из URL hash
+    if (window.location.hash) {
+        const commentId = window.location.hash.substring(1);
+        const commentElement = document.getElementById(commentId);
+        if (commentElement) {
+            setTimeout(() => {
+                commentElement.scrollIntoView({ behavior: 'smooth' });
+                commentElement.classList.add('comment-highlight');
+                setTimeout(() => {
+                    commentElement.classList.remove('comment-highlight');
+                }, 3000);
+            }, 500);
+        }
+    }
+    
+    // Автоматическое скрытие сообщений через 5 секунд
+    setTimeout(() => {
+        const messages = document.querySelectorAll('.alert');
+        messages.forEach(message => {
+            message.style.opacity = '0';
+            setTimeout(() => {
+                if (message.parentElement) {
+                    message.parentElement.remove();
+                }
+            }, 300);
+        });
+    }, 5000);
+});
+
+// Отправка комментариев без перезагрузки страницы; без JS формы работают как обычно
+document.addEventListener('submit', function(event) {
+    const form = event.target;
+    if (!form.classList.contains('comment-form') || !window.fetch) {
+        return;
+    }
+    event.preventDefault();
+    const button = form.querySelector('button[type="submit"]');
+    if (button) {
+        button.disabled = true;
+    }
+
+    fetch(form.closest('.comments-section').dataset.commentUrl, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+        credentials: 'same-origin',
+    })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                alert(data.message);
+                return;
+            }
+            if (data.html) {
+                insertComment(data.parent_id, data.html);
+            }
+            form.reset();
+            if (data.parent_id) {
+                hideReplyForm(data.parent_id);
+            }
+            const comment = document.getElementById('comment-' + data.comment_id);
+            if (comment) {
+                comment.scrollIntoView({ behavior: 'smooth', block: 'center' });
+            }
+        })
+        .catch(() => form.submit())
+        .finally(() => {
+            if (button) {
+                button.disabled = false;
+            }
+        });
+});
+
+// Вставить HTML нового комментария в конец списка или ответов родителя
+function insertComment(parentId, html) {
+    let container = document.getElementById('comments-list');
+    const parent = parentId && document.getElementById('comment-' + parentId);
+    if (parent) {
+        container = parent.querySelector(':scope > .comment-replies');
+        if (!container) {
+            container = document.createElement('div');
+            container.className = 'comment-replies';
+            parent.appendChild(container);
+        }
+    }
+    const empty = container.querySelector('.no-comments');
+    if (empty) {
+        empty.remove();
+    }
+    container.insertAdjacentHTML('beforeend', html);
+}
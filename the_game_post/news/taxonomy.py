@@ -0,0 +1,105 @@
+"""
+Снимок тегов и категорий в памяти процесса.
+
+Теги и категории меняются только из админки, а нужны почти каждой странице
+(облако тегов, навигация, поиск тега или категории по slug). Снимок
+загружается двумя запросами и живет в процессе, пока не изменится версия
+области 'taxonomy' в общем кэше (ее увеличивают сигналы, см. signals.py).
+Версия проверяется не чаще раза в NEWS_TAXONOMY_CHECK_INTERVAL секунд,
+поэтому при общем кэше другие процессы видят изменения с задержкой не
+больше этого интервала; процесс, в котором произошло изменение, - сразу.
+Кэш в памяти процесса (locmem) чужих версий не видит, поэтому снимок
+старше NEWS_TAXONOMY_MAX_AGE секунд перезагружается и без смены версии:
+это предел задержки при любом кэше.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import caching
+
+
+class TaxonomySnapshot:
+    """Неизменяемый набор тегов и категорий; объекты только для чтения"""
+
+    def __init__(self, version, tags, categories):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.tags = tuple(tags)
+        self.categories = tuple(categories)
+        self.tags_by_slug = {tag.slug: tag for tag in self.tags}
+        self.categories_by_slug = {category.slug: category for category in self.categories}
+
+    def get_tag(self, slug):
+        return self.tags_by_slug.get(slug)
+
+    def get_category(self, slug):
+        return self.categories_by_slug.get(slug)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_checked_at = 0.0
+
+
+def _check_interval():
+    return getattr(settings, 'NEWS_TAXONOMY_CHECK_INTERVAL', 5)
+
+
+def _max_age():
+    return getattr(settings, 'NEWS_TAXONOMY_MAX_AGE', 300)
+
+
+def _expired(snapshot, now):
+    return now - snapshot.loaded_at >= _max_age()
+
+
+def _load(version):
+    from .models import Category, Tag
+
+    # Снимок живет до следующего изменения, поэтому читается из основной базы:
+    # отстающая реплика закрепила бы старые данные под новой версией
+    return TaxonomySnapshot(
+        version, Tag.objects.using(DEFAULT_DB_ALIAS), Category.objects.using(DEFAULT_DB_ALIAS),
+    )
+
+
+def get_snapshot():
+    """Текущий снимок; перезагружается, если версия в кэше изменилась или он устарел"""
+    global _snapshot, _checked_at
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None and now - _checked_at < _check_interval():
+        return snapshot
+
+    version = caching.get_versions('taxonomy')['taxonomy']
+    if snapshot is not None and snapshot.version == version and not _expired(snapshot, now):
+        _checked_at = now
+        return snapshot
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version or _expired(_snapshot, now):
+            _snapshot = _load(version)
+        _checked_at = now
+        return _snapshot
+
+
+def invalidate():
+    """Сбрасывает снимок процесса; вызывается после увеличения версии"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def _bump():
+    caching.bump_versions('taxonomy')
+    invalidate()
+
+
+def changed():
+    """Теги или категории изменились: новая версия для всех процессов"""
+    _bump()
+    # До фиксации транзакции другой процесс мог загрузить старые данные под новой версией
+    transaction.on_commit(_bump)
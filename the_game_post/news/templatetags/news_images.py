@@ -0,0 +1,20 @@
+from django import template
+
+from news import images
+
+register = template.Library()
+
+
+@register.inclusion_tag('news/responsive_image.html')
+def responsive_image(image, alt='', css_class='', sizes='100vw'):
+    """
+    <picture> с вариантами изображения в WebP и JPEG разной ширины.
+    Пока варианты не готовы, выводится обычный <img> с оригиналом.
+    """
+    return {
+        'image': image,
+        'srcsets': images.srcsets(image),
+        'alt': alt,
+        'css_class': css_class,
+        'sizes': sizes,
+    }
@@ -1,3 +1,1717 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from xml.dom import minidom
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    api, assets, async_views, benchmark, caching, comments, database, images, profiling, ranking, routers,
+    search, sessions, taxonomy, view_counter, views,
+)
+from .models import Article, ArticleBlock, Category, Comment, Tag
+from .pagination import CursorPaginator
+
+
+def make_articles(count, author, category, tags=(), start=0):
+    """Создаёт набор опубликованных статей с блоком и комментариями"""
+    articles = []
+    for i in range(start, start + count):
+        article = Article.objects.create(
+            title=f'Статья {i}', slug=f'article-{i}',
+            category=category, author=author,
+        )
+        article.tags.set(tags)
+        ArticleBlock.objects.create(article=article, block_type='text', content=f'Текст {i}')
+        article.compile_body()
+        Comment.objects.create(article=article, author=author, content='Первый!')
+        Comment.objects.create(article=article, author=author, content='Скрыт', is_approved=False)
+        articles.append(article)
+    return articles
+
+
+def use_shared_cache(test):
+    """Файловый кэш вместо locmem: команды, сбрасывающие кэш сервера, требуют общий"""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location, True)
+    overrides = override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+    })
+    overrides.enable()
+    test.addCleanup(overrides.disable)
+
+
+class ArticleQuerySetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tags = [
+            Tag.objects.create(name='RPG', slug='rpg'),
+            Tag.objects.create(name='Инди', slug='indie'),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_with_list_data_annotates_approved_comments(self):
+        make_articles(2, self.author, self.category, self.tags)
+        articles = list(Article.objects.published().with_list_data().with_first_block())
+
+        self.assertEqual([a.approved_comment_count for a in articles], [1, 1])
+        with self.assertNumQueries(0):
+            for article in articles:
+                article.author.username
+                article.category.name
+                list(article.tags.all())
+                article.get_first_block()
+
+    def test_article_list_query_count_is_constant(self):
+        make_articles(1, self.author, self.category, self.tags)
+        # Новые статьи меняют счетчики тегов: снимок тегов перечитывается один раз
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(3):
+            self.client.get(reverse('news:article_list'))
+
+        make_articles(5, self.author, self.category, self.tags, start=1)
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('news:article_list'))
+        self.assertContains(response, '💬 1')
+
+    def test_articles_by_tag_query_count_is_constant(self):
+        url = reverse('news:articles_by_tag', args=['rpg'])
+        make_articles(1, self.author, self.category, self.tags)
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        make_articles(10, self.author, self.category, self.tags, start=1)
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, 'Текст 10')
+
+
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        cls.article, cls.other = make_articles(2, author, category)
+
+    def setUp(self):
+        cache.clear()
+        view_counter._buffer = None
+        self.addCleanup(setattr, view_counter, '_buffer', None)
+
+    def test_detail_page_does_not_write(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, '👁 1')
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+
+        self.client.get(url)
+        self.assertEqual(view_counter.flush_views(), 2)
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.views, 2)
+
+    def _hit_concurrently(self, article_ids, threads=8, hits=250):
+        def worker():
+            for _ in range(hits):
+                for article_id in article_ids:
+                    view_counter.record_view(article_id)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return threads * hits
+
+    def test_concurrent_hits_are_exact(self):
+        expected = self._hit_concurrently([self.article.pk, self.other.pk])
+        view_counter.flush_views()
+        view_counter.flush_views()
+
+        self.article.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.article.views, self.other.views), (expected, expected))
+
+    @override_settings(NEWS_VIEW_BUFFER='cache')
+    def test_cache_buffer_keeps_hits_during_flush(self):
+        buffer = view_counter.get_view_buffer()
+        self.assertIsInstance(buffer, view_counter.CacheViewBuffer)
+        expected = self._hit_concurrently([self.article.pk], threads=4, hits=50)
+        buffer.add(self.other.pk, 3)
+
+        self.assertEqual(view_counter.flush_views(), expected + 3)
+        self.assertEqual(buffer.pending(self.article.pk), 0)
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.views, expected)
+
+    def test_cache_buffer_drains_only_viewed_articles(self):
+        buffer = view_counter.CacheViewBuffer()
+        buffer.add(self.article.pk, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(buffer.drain(), {self.article.pk: 2})
+        self.assertEqual(buffer.drain(), {})
+
+        buffer.add(self.article.pk)
+        buffer.add(self.other.pk)
+        self.assertEqual(buffer.drain(), {self.article.pk: 1, self.other.pk: 1})
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.article, = make_articles(1, cls.author, cls.category, [cls.tag])
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCachedAfterFirstHit(self, url):
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        return second
+
+    def test_anonymous_pages_are_cached(self):
+        self.assertCachedAfterFirstHit(reverse('news:article_list'))
+        self.assertCachedAfterFirstHit(reverse('news:articles_by_tag', args=['rpg']))
+        self.assertCachedAfterFirstHit(reverse('news:article_detail', args=[self.article.slug]))
+
+    def test_cached_detail_still_counts_views(self):
+        view_counter._buffer = None
+        self.addCleanup(setattr, view_counter, '_buffer', None)
+        url = reverse('news:article_detail', args=[self.article.slug])
+        self.assertCachedAfterFirstHit(url)
+        self.assertEqual(view_counter.get_view_buffer().pending(self.article.pk), 2)
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(self.author)
+        url = reverse('news:article_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(queries.captured_queries)
+
+    def test_comment_invalidates_detail_page(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        self.assertCachedAfterFirstHit(url)
+        Comment.objects.create(article=self.article, author=self.author, content='Свежий комментарий')
+        self.assertContains(self.client.get(url), 'Свежий комментарий')
+
+    def test_block_edit_invalidates_body_fragment(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        self.client.get(url)
+        block = self.article.blocks.get()
+        block.content = 'Обновленный текст'
+        with self.captureOnCommitCallbacks(execute=True):
+            block.save()
+        self.assertContains(self.client.get(url), 'Обновленный текст')
+
+    def test_tag_rename_invalidates_lists(self):
+        url = reverse('news:article_list')
+        self.assertCachedAfterFirstHit(url)
+        self.tag.name = 'Ролевые'
+        self.tag.save()
+        self.assertContains(self.client.get(url), 'Ролевые')
+
+    def test_article_tags_change_invalidates_tag_page(self):
+        url = reverse('news:articles_by_tag', args=['rpg'])
+        self.assertContains(self.client.get(url), self.article.title)
+        self.article.tags.clear()
+        self.assertNotContains(self.client.get(url), self.article.title)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}
+            with override_settings(CACHES=caches_setting):
+                url = reverse('news:article_detail', args=[self.article.slug])
+                self.assertCachedAfterFirstHit(url)
+                Category.objects.filter(pk=self.category.pk).get().save()
+                self.article.title = 'Новый заголовок'
+                self.article.save()
+                self.assertContains(self.client.get(url), 'Новый заголовок')
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        cls.article = Article.objects.create(
+            title='Обсуждение', slug='discussion', category=category, author=cls.author,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def add_branch(self, depth, parent=None, approved=True):
+        comments = []
+        for level in range(depth):
+            parent = Comment.objects.create(
+                article=self.article, author=self.author, parent=parent,
+                content=f'Уровень {level}', is_approved=approved,
+            )
+            comments.append(parent)
+        return comments
+
+    def test_thread_is_built_in_memory(self):
+        root, reply, deep = self.add_branch(3)
+        hidden, = self.add_branch(1, approved=False)
+        self.add_branch(1, parent=hidden)
+
+        with self.assertNumQueries(1):
+            roots = Comment.objects.thread_for(self.article, max_depth=3)
+            self.assertEqual(roots, [root])
+            self.assertEqual(roots[0].children, [reply])
+            loaded_reply = roots[0].children[0]
+            self.assertEqual(loaded_reply.children, [deep])
+            loaded_deep = loaded_reply.children[0]
+            self.assertEqual(loaded_deep.parent.author.username, 'author')
+            self.assertEqual([c.depth for c in (roots[0], loaded_reply, loaded_deep)], [0, 1, 2])
+            self.assertTrue(loaded_reply.can_reply)
+            self.assertFalse(loaded_deep.can_reply)
+
+    def test_detail_query_count_does_not_depend_on_thread_size(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        self.add_branch(3)
+        taxonomy.get_snapshot()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        for _ in range(20):
+            self.add_branch(4)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertContains(response, 'ответ для author', count=3 * 20 + 2)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        cls.articles = make_articles(10, author, category)
+        cls.newest_first = sorted(cls.articles, key=lambda a: (a.created_at, a.pk), reverse=True)
+
+    def test_walks_forward_and_back(self):
+        queryset = Article.objects.published()
+        paginator = CursorPaginator(queryset, 4)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+
+        self.assertEqual(list(first) + list(second) + list(third), self.newest_first)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.page(second.previous_cursor)), list(first))
+
+    def test_invalid_cursor_shows_first_page(self):
+        page = CursorPaginator(Article.objects.published(), 3).page('не-курсор')
+        self.assertEqual(list(page), self.newest_first[:3])
+
+    @override_settings(NEWS_PAGINATION='cursor')
+    def test_deep_pages_cost_the_same_without_count(self):
+        cache.clear()
+        taxonomy.get_snapshot()
+        url = reverse('news:article_list')
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get(url)
+
+        cursor = response.context['articles'].next_cursor
+        while True:
+            cache.clear()
+            with CaptureQueriesContext(connection) as deep_page:
+                response = self.client.get(url, {'cursor': cursor})
+            if not response.context['articles'].has_next():
+                break
+            cursor = response.context['articles'].next_cursor
+
+        self.assertEqual(len(first_page), len(deep_page))
+        self.assertFalse([q for q in deep_page if 'COUNT(*)' in q['sql'] or 'OFFSET' in q['sql']])
+        self.assertContains(response, self.newest_first[-1].title)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class QueryPlanTests(TestCase):
+    """Основные запросы представлений должны идти по индексам, а не полным сканом таблиц"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.article, = make_articles(1, author, cls.category, [cls.tag])
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, queryset, sorted_by_index=True):
+        plan = self.query_plan(queryset)
+        full_scans = [line for line in plan if re.fullmatch(r'SCAN \S+', line)]
+        self.assertFalse(full_scans, plan)
+        if sorted_by_index:
+            self.assertFalse([line for line in plan if 'TEMP B-TREE' in line], plan)
+
+    def test_article_feeds(self):
+        published = Article.objects.published().with_list_data()
+        self.assertUsesIndexes(published[:3])
+        self.assertUsesIndexes(published.filter(category=self.category)[:3])
+        self.assertUsesIndexes(
+            published.filter(created_at__lt=self.article.created_at).order_by('-created_at', '-id')[:4]
+        )
+
+    def test_tag_feed(self):
+        # Статьи тега находятся по индексу связующей таблицы, сортируется уже малая выборка
+        articles = Article.objects.published().filter(tags=self.tag).order_by('-created_at', '-id')
+        self.assertUsesIndexes(articles[:4], sorted_by_index=False)
+
+    def test_popular_articles(self):
+        popular = Article.objects.published().exclude(id=self.article.id).order_by('-views')[:5]
+        self.assertUsesIndexes(popular)
+
+    def test_comment_thread_and_blocks(self):
+        self.assertUsesIndexes(
+            Comment.objects.approved().filter(article=self.article, parent__isnull=True)
+        )
+        self.assertUsesIndexes(
+            Comment.objects.approved().filter(article=self.article).order_by('created_at', 'id'),
+            sorted_by_index=False,
+        )
+        self.assertUsesIndexes(self.article.blocks.all())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 есть только в SQLite')
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('admin', password='pass', is_staff=True, is_superuser=True)
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.dragon = Article.objects.create(
+            title='Обзор Dragon Quest', slug='dragon', category=cls.category, author=cls.author,
+        )
+        ArticleBlock.objects.create(article=cls.dragon, block_type='text', content='Классическая <b>ролевая</b> игра')
+        cls.racing = Article.objects.create(
+            title='Гонки года', slug='racing', category=cls.category, author=cls.author,
+        )
+        ArticleBlock.objects.create(article=cls.racing, block_type='text', content='Про драконов тут ни слова')
+        cls.draft = Article.objects.create(
+            title='Черновик про ролевые игры', slug='draft', category=cls.category,
+            author=cls.author, is_published=False,
+        )
+
+    def search(self, query):
+        return list(search.ArticleSearch(query)[:10])
+
+    def test_index_follows_blocks_and_titles(self):
+        self.assertEqual(self.search('ролевая'), [self.dragon])
+        block = self.racing.blocks.get()
+        block.content = 'Неожиданно ролевая гонка'
+        block.save()
+        self.assertEqual(set(self.search('ролев')), {self.dragon, self.racing})
+
+        self.dragon.delete()
+        self.assertEqual(self.search('ролевая'), [self.racing])
+
+    def test_title_matches_rank_first_and_are_highlighted(self):
+        ArticleBlock.objects.create(article=self.racing, block_type='text', content='dragon dragon')
+        results = self.search('dragon')
+        self.assertEqual(results[0], self.dragon)
+        self.assertIn('<mark>Dragon</mark>', results[0].search_snippet)
+
+    def test_search_view_escapes_text_and_hides_drafts(self):
+        response = self.client.get(reverse('news:search'), {'q': 'ролевая "игра'})
+        self.assertContains(response, self.dragon.title)
+        self.assertNotContains(response, self.draft.title)
+        self.assertContains(response, '&lt;b&gt;<mark>ролевая</mark>')
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(self.search('гонки'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('гонки'), [self.racing])
+
+    def test_admin_search_uses_block_text(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('admin:news_article_changelist'), {'q': 'ролевые'})
+        self.assertContains(response, self.draft.title)
+        self.assertNotContains(response, self.racing.title)
+
+
+class PopularRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pass')
+        cls.games = Category.objects.create(name='Игры', slug='igry')
+        cls.news = Category.objects.create(name='Новости', slug='novosti')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.old_hit, cls.fresh, cls.current = make_articles(3, author, cls.games)
+        cls.other_category, = make_articles(1, author, cls.news, start=3)
+        cls.fresh.tags.add(cls.tag)
+
+        now = timezone.now()
+        Article.objects.filter(pk=cls.old_hit.pk).update(views=5000, created_at=now - timedelta(days=365))
+        Article.objects.filter(pk=cls.fresh.pk).update(views=300, created_at=now - timedelta(hours=3))
+        Article.objects.filter(pk=cls.other_category.pk).update(views=20)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recent_activity_beats_all_time_views(self):
+        rankings = ranking.compute_rankings(size=3)
+        self.assertEqual(rankings['all'][0], self.fresh.pk)
+        self.assertEqual(rankings[f'category:{self.news.pk}'], [self.other_category.pk])
+        self.assertEqual(rankings[f'tag:{self.tag.pk}'], [self.fresh.pk])
+
+    def test_detail_page_reads_ranking_from_cache(self):
+        use_shared_cache(self)
+        call_command('refresh_popular', stdout=StringIO())
+        with self.assertNumQueries(1):
+            popular = ranking.get_popular_articles(self.current)
+        self.assertEqual(
+            [row['id'] for row in popular],
+            [self.fresh.pk, self.old_hit.pk, self.other_category.pk],
+        )
+
+        response = self.client.get(reverse('news:article_detail', args=[self.current.slug]))
+        self.assertEqual(
+            [row['id'] for row in response.context['popular_articles']],
+            [self.fresh.pk, self.old_hit.pk, self.other_category.pk],
+        )
+
+    def test_unpublished_articles_drop_out_without_refresh(self):
+        ranking.refresh_rankings()
+        Article.objects.filter(pk=self.fresh.pk).update(is_published=False)
+        popular = ranking.get_popular_articles(self.current)
+        self.assertNotIn(self.fresh.pk, [row['id'] for row in popular])
+
+    def test_falls_back_to_views_before_first_refresh(self):
+        popular = ranking.get_popular_articles(self.current)
+        self.assertEqual(popular[0]['id'], self.old_hit.pk)
+
+    def test_server_refreshes_once_per_interval(self):
+        self.assertEqual(ranking.refresh_if_due(60), 4)
+        self.assertIsNone(ranking.refresh_if_due(60))
+        self.assertEqual(ranking.get_ranked_ids('all')[0], self.fresh.pk)
+
+    def test_commands_refuse_process_local_cache(self):
+        for command in ('refresh_popular', 'reconcile_counters', 'compile_articles'):
+            with self.assertRaisesMessage(CommandError, 'CACHES'):
+                call_command(command, stdout=StringIO())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        overrides = override_settings(MEDIA_ROOT=media_root, NEWS_IMAGE_WIDTHS=(320, 640, 1280))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def save_image(self, name, size=(1000, 500)):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', size, '#3498db').save(buffer, 'PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_variants_are_generated_and_deduplicated(self):
+        first = self.save_image('articles/first.png')
+        second = self.save_image('articles/second.png')
+
+        manifest = images.generate_derivatives(first)
+        self.assertEqual([width for width, _ in manifest['webp']], [320, 640])
+        self.assertTrue(all(default_storage.exists(name) for _, name in manifest['jpeg']))
+
+        self.assertEqual(images.generate_derivatives(second), manifest)
+        self.assertEqual(len(default_storage.listdir('derivatives')[0]), 2)  # index + один хэш
+
+    def test_concurrent_writes_replace_one_file(self):
+        name = 'derivatives/ab/abc/320.webp'
+        names = []
+
+        def write(number):
+            names.append(images._write(name, f'{number}'.encode() * 1000))
+
+        threads = [threading.Thread(target=write, args=[number]) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(names), {name})
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), ['320.webp'])
+        self.assertEqual(len(set(images._read(name))), 1)  # файл целиком от одной записи
+
+    def test_failed_replace_leaves_no_temporary_file(self):
+        name = 'derivatives/ab/abc/640.webp'
+        with mock.patch('news.images.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                images._write(name, b'data')
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), [])
+
+    def test_thumbnail_variants_scheduled_only_when_thumbnail_changes(self):
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        with mock.patch('news.images.schedule') as schedule:
+            article = Article.objects.create(
+                title='С картинкой', slug='with-image', category=category, author=author,
+                thumbnail=self.save_image('articles/first.png'),
+            )
+            article.views += 1
+            article.save()
+            article.thumbnail = self.save_image('articles/second.png')
+            article.save()
+        self.assertEqual([call.args[0] for call in schedule.call_args_list], ['articles/first.png', 'articles/second.png'])
+
+    def test_page_cache_is_reset_when_thumbnail_variants_are_ready(self):
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        with mock.patch('news.images.schedule'):
+            article = Article.objects.create(
+                title='С картинкой', slug='with-image', category=category, author=author,
+                thumbnail=self.save_image('articles/thumb.png'),
+            )
+        versions = caching.get_versions('articles', caching.article_scope(article.slug))
+        images._generate_in_background(article.thumbnail.name)
+        new_versions = caching.get_versions('articles', caching.article_scope(article.slug))
+        self.assertTrue(all(new_versions[scope] != version for scope, version in versions.items()))
+
+    def test_small_images_keep_their_width(self):
+        manifest = images.generate_derivatives(self.save_image('articles/small.png', size=(200, 100)))
+        self.assertEqual([width for width, _ in manifest['jpeg']], [200])
+
+    def test_template_tag_falls_back_until_variants_are_ready(self):
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        with mock.patch('news.images.schedule'):
+            article = Article.objects.create(
+                title='С картинкой', slug='with-image', category=category, author=author,
+                thumbnail=self.save_image('articles/thumb.png'),
+            )
+        template = Template('{% load news_images %}{% responsive_image article.thumbnail alt=article.title %}')
+
+        # Пока варианты генерируются в пуле, выводится оригинал
+        cache.set(images.CACHE_PREFIX + article.thumbnail.name, images.FAILED)
+        self.assertNotIn('srcset', template.render(Context({'article': article})))
+
+        cache.clear()
+        images.generate_derivatives(article.thumbnail.name)
+        html = template.render(Context({'article': article}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('640.jpeg 640w', html)
+
+    def test_background_generation_and_command(self):
+        name = self.save_image('articles/bg.png')
+        # Поток пула не видит незакоммиченную транзакцию теста, сброс кэша проверяется отдельно
+        with mock.patch('news.images._variants_ready') as variants_ready:
+            images.schedule(name).result()
+        variants_ready.assert_called_once_with(name)
+        self.assertIsNotNone(images.get_manifest(name))
+
+        out = StringIO()
+        author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        with mock.patch('news.images.schedule'):
+            Article.objects.create(title='Т', slug='t', category=category, author=author, thumbnail=name)
+        call_command('regenerate_images', '--force', stdout=out)
+        self.assertIn('Обработано изображений: 1', out.getvalue())
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_and_benchmark_report(self):
+        created = benchmark.seed_corpus(articles=12, tags=4, users=3, comments_per_article=4, seed=7)
+        self.assertEqual(created['articles'], 12)
+        self.assertEqual(Comment.objects.count(), created['comments'])
+        self.assertTrue(Comment.objects.filter(parent__isnull=False).exists())
+
+        report = benchmark.run_benchmark(iterations=3, warmup=1, sample=3)
+        self.assertEqual(set(report['results']), {
+            'article_list', 'article_list_deep', 'article_detail', 'articles_by_tag', 'comment_post',
+        })
+        for name, metrics in report['results'].items():
+            self.assertEqual(metrics['statuses'], [200], name)
+            self.assertGreater(metrics['bytes_mean'], 0)
+            self.assertEqual(metrics['errors'], 0, metrics['error_samples'])
+        # Комментарии из бенчмарка откатываются
+        self.assertEqual(Comment.objects.count(), created['comments'])
+
+    def test_comment_post_is_not_rate_limited(self):
+        benchmark.seed_corpus(articles=3, tags=2, users=2, comments_per_article=2)
+        for _ in range(2):
+            metrics = benchmark.run_benchmark(iterations=8, warmup=2, scenarios=['comment_post'])['results']['comment_post']
+            self.assertEqual((metrics['statuses'], metrics['errors']), ([200], 0), metrics['error_samples'])
+
+    def test_compare_with_baseline(self):
+        baseline = {'results': {'article_list': {'p95_ms': 10.0, 'queries_max': 4}}}
+        fast = {'results': {'article_list': {'p95_ms': 11.0, 'queries_max': 4}}}
+        slow = {'results': {'article_list': {'p95_ms': 13.0, 'queries_max': 6}}}
+        self.assertEqual(benchmark.compare_with_baseline(fast, baseline), [])
+        self.assertEqual(len(benchmark.compare_with_baseline(slow, baseline)), 2)
+
+
+@override_settings(NEWS_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.staff = User.objects.create_user('editor', password='pass', is_staff=True)
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.article, = make_articles(1, cls.author, cls.category)
+
+    def setUp(self):
+        cache.clear()
+        profiling.stats.reset()
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(
+            profiling.fingerprint('SELECT * FROM t WHERE id IN (%s, %s,  %s)'),
+            profiling.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+        )
+
+    def test_request_is_logged_and_aggregated(self):
+        with self.assertLogs('news.profiling', 'INFO') as logs:
+            self.client.get(reverse('news:article_detail', args=[self.article.slug]))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'news:article_detail')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['render_ms'], 0)
+        self.assertGreater(record['bytes'], 0)
+        summary = profiling.stats.summary()
+        self.assertEqual(summary['news:article_detail']['requests'], 1)
+
+    async def test_async_request_is_profiled(self):
+        self.assertTrue(profiling.ProfilingMiddleware.async_capable)
+        # Соединение теста открыто до загрузки middleware, сигнал connection_created
+        # для него не придет; под ASGI-сервером соединения потоков создаются позже
+        await sync_to_async(profiling._install_query_hook)()
+        with override_settings(ROOT_URLCONF='news.tests'), self.assertLogs('news.profiling', 'INFO') as logs:
+            await self.async_client.get(reverse('news:article_detail', args=[self.article.slug]))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'news:article_detail')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['render_ms'], 0)
+
+    def test_duplicate_queries_are_reported(self):
+        profile = profiling.RequestProfile()
+        with connection.execute_wrapper(profile):
+            for article_id in (1, 2, 3):
+                list(Comment.objects.filter(article_id=article_id))
+        duplicates = profile.duplicates()
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0]['count'], 3)
+
+    def test_stats_endpoint_is_staff_only(self):
+        url = reverse('news:profiling_stats')
+        self.client.get(reverse('news:article_list'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        views = self.client.get(url).json()['views']
+        self.assertIn('p95', views['news:article_list']['duration_ms'])
+        self.assertNotIn('news:profiling_stats', views)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.article, = make_articles(1, cls.author, cls.category, [cls.tag])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for url in (reverse('news:article_list'), reverse('news:articles_by_tag', args=['rpg'])):
+            response = self.client.get(url)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('s-maxage', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b'')
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_if_modified_since(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        response = self.client.get(url)
+        again = self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_new_comment_changes_validators(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(article=self.article, author=self.author, content='Новый')
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified_detail_still_counts_view(self):
+        view_counter._buffer = None
+        self.addCleanup(setattr, view_counter, '_buffer', None)
+        url = reverse('news:article_detail', args=[self.article.slug])
+        etag = self.client.get(url)['ETag']
+        self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(view_counter.get_view_buffer().drain(), {self.article.pk: 2})
+
+    def test_authenticated_pages_are_private(self):
+        url = reverse('news:article_list')
+        anonymous_etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, headers={'If-None-Match': anonymous_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class CompiledBodyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_superuser('admin', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.article, = make_articles(1, cls.author, cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_compile_body(self):
+        ArticleBlock.objects.create(article=self.article, block_type='text', order=1, content='Второй\n\nабзац')
+        self.article.compile_body()
+        self.article.refresh_from_db()
+        self.assertIn('<p>Второй</p>', self.article.body_html)
+        self.assertLess(self.article.body_html.index('Текст 0'), self.article.body_html.index('Второй'))
+        self.assertEqual(self.article.excerpt, 'Текст 0')
+
+    def test_detail_serves_stored_body_without_block_queries(self):
+        url = reverse('news:article_detail', args=[self.article.slug])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, '<p>Текст 0</p>', html=True)
+        self.assertFalse([q for q in queries if 'news_articleblock' in q['sql']])
+
+    def test_block_changes_recompile_on_commit(self):
+        block = self.article.blocks.get()
+        block.content = 'Обновленный текст'
+        with self.captureOnCommitCallbacks(execute=True):
+            block.save()
+        self.article.refresh_from_db()
+        self.assertIn('Обновленный текст', self.article.body_html)
+        self.assertEqual(self.article.excerpt, 'Обновленный текст')
+
+        # Страница статьи ничего не пишет и не сбрасывает кэш списков
+        versions = caching.get_versions('articles')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('news:article_detail', args=[self.article.slug]))
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(caching.get_versions('articles'), versions)
+
+    def test_migration_compiles_existing_articles(self):
+        from django.apps import apps
+
+        Article.objects.filter(pk=self.article.pk).update(body_html='', excerpt='')
+        migration = import_module('news.migrations.0007_compile_article_bodies')
+        migration.compile_bodies(apps, None)
+        self.article.refresh_from_db()
+        self.assertIn('<p>Текст 0</p>', self.article.body_html)
+        self.assertEqual(self.article.excerpt, 'Текст 0')
+
+    def test_admin_inline_save_recompiles(self):
+        self.client.force_login(self.author)
+        block = self.article.blocks.get()
+        url = reverse('admin:news_article_change', args=[self.article.pk])
+        data = {
+            'title': self.article.title, 'slug': self.article.slug, 'category': self.category.pk,
+            'author': self.author.pk, 'is_published': 'on', 'comments_enabled': 'on',
+            'blocks-TOTAL_FORMS': 1, 'blocks-INITIAL_FORMS': 1,
+            'blocks-0-id': block.pk, 'blocks-0-article': self.article.pk,
+            'blocks-0-block_type': 'text', 'blocks-0-content': 'Новый текст из админки',
+            'blocks-0-order': 0,
+            'comments-TOTAL_FORMS': 0, 'comments-INITIAL_FORMS': 0,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.article.refresh_from_db()
+        self.assertIn('Новый текст из админки', self.article.body_html)
+        self.assertEqual(self.article.excerpt, 'Новый текст из админки')
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.article, cls.other = make_articles(2, cls.author, cls.category, [cls.tag])
+
+    def counts(self):
+        self.article.refresh_from_db()
+        self.tag.refresh_from_db()
+        return self.article.approved_comment_count, self.tag.published_article_count
+
+    def test_comment_changes_update_article_counter(self):
+        self.assertEqual(self.counts()[0], 1)
+        comment = Comment.objects.create(article=self.article, author=self.author, content='Еще')
+        self.assertEqual(self.counts()[0], 2)
+        comment.is_approved = False
+        comment.save()
+        comment.save()
+        self.assertEqual(self.counts()[0], 1)
+        Comment.objects.filter(article=self.article, is_approved=True).get().delete()
+        self.assertEqual(self.counts()[0], 0)
+
+    def test_bulk_approval_updates_counters(self):
+        changed = Comment.objects.all().set_approved(True)
+        self.assertEqual(changed, 2)
+        self.assertEqual(self.counts()[0], 2)
+        Comment.objects.filter(article=self.article).set_approved(False)
+        self.assertEqual(self.counts()[0], 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.approved_comment_count, 2)
+
+    def test_tag_counter_follows_tags_and_publication(self):
+        self.assertEqual(self.counts()[1], 2)
+        self.article.tags.remove(self.tag)
+        self.assertEqual(self.counts()[1], 1)
+        self.tag.articles.add(self.article)
+        self.assertEqual(self.counts()[1], 2)
+        self.other.is_published = False
+        self.other.save()
+        self.assertEqual(self.counts()[1], 1)
+        self.article.tags.clear()
+        self.assertEqual(self.counts()[1], 0)
+
+    def test_reconcile_fixes_drift(self):
+        Article.objects.filter(pk=self.article.pk).update(approved_comment_count=7)
+        Tag.objects.update(published_article_count=0)
+        use_shared_cache(self)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('статей: 1, тегов: 1', out.getvalue())
+        self.assertEqual(self.counts(), (1, 2))
+
+
+class TaxonomySnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg', color='#ff0000')
+        Category.objects.create(name='Игры', slug='igry')
+
+    def setUp(self):
+        cache.clear()
+        taxonomy.invalidate()
+
+    def test_context_processor_serves_snapshot_without_queries(self):
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('news:about'))
+        self.assertEqual([tag.slug for tag in response.context['all_tags']], ['rpg'])
+        self.assertEqual(response.context['taxonomy'].get_category('igry').name, 'Игры')
+
+    def test_local_change_is_visible_immediately(self):
+        taxonomy.get_snapshot()
+        Tag.objects.create(name='Инди', slug='indie')
+        self.assertIsNotNone(taxonomy.get_snapshot().get_tag('indie'))
+
+    def test_other_process_change_is_picked_up_after_interval(self):
+        old = taxonomy.get_snapshot()
+        # Другой процесс изменил тег: у нас меняется только версия в общем кэше
+        Tag.objects.filter(pk=self.tag.pk).update(color='#00ff00')
+        caching.bump_versions('taxonomy')
+        with override_settings(NEWS_TAXONOMY_CHECK_INTERVAL=60):
+            self.assertIs(taxonomy.get_snapshot(), old)
+        with override_settings(NEWS_TAXONOMY_CHECK_INTERVAL=0):
+            self.assertEqual(taxonomy.get_snapshot().get_tag('rpg').color, '#00ff00')
+
+    @override_settings(NEWS_TAXONOMY_CHECK_INTERVAL=0)
+    def test_snapshot_expires_without_version_bump(self):
+        old = taxonomy.get_snapshot()
+        # Изменение в процессе с отдельным кэшем: версия здесь не меняется
+        Tag.objects.filter(pk=self.tag.pk).update(color='#00ff00')
+        self.assertIs(taxonomy.get_snapshot(), old)
+        with override_settings(NEWS_TAXONOMY_MAX_AGE=0):
+            self.assertEqual(taxonomy.get_snapshot().get_tag('rpg').color, '#00ff00')
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        other = Category.objects.create(name='Новости', slug='novosti')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.articles = make_articles(3, author, cls.category, [cls.tag])
+        make_articles(1, author, other, start=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        minidom.parseString(content)  # корректный XML
+        return content.decode()
+
+    def test_atom_and_rss_feeds(self):
+        atom = self.content(self.client.get(reverse('news:feed', args=['atom'])))
+        self.assertEqual(atom.count('<entry>'), 4)
+        self.assertIn('<summary>Текст 0</summary>', atom)
+        self.assertIn('http://testserver/article/article-3/', atom)
+
+        rss = self.client.get(reverse('news:category_feed', args=['rss', 'igry']))
+        self.assertEqual(rss['Content-Type'], 'application/rss+xml; charset=utf-8')
+        rss = self.content(rss)
+        self.assertEqual(rss.count('<item>'), 3)
+        self.assertIn('<title>The game post: Игры</title>', rss)
+
+        tag_feed = self.content(self.client.get(reverse('news:tag_feed', args=['atom', 'rpg'])))
+        self.assertEqual(tag_feed.count('<entry>'), 3)
+        self.assertEqual(self.client.get(reverse('news:tag_feed', args=['atom', 'net'])).status_code, 404)
+
+    def test_feed_is_cached_and_supports_conditional_get(self):
+        url = reverse('news:feed', args=['atom'])
+        first = self.client.get(url)
+        body = self.content(first)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content.decode(), body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    @override_settings(NEWS_STREAMING_CACHE_MAX_SIZE=100)
+    def test_large_feed_is_not_cached(self):
+        url = reverse('news:feed', args=['atom'])
+        self.content(self.client.get(url))
+        self.assertTrue(self.client.get(url).streaming)
+
+    async def test_feed_streams_asynchronously_under_asgi(self):
+        url = reverse('news:feed', args=['rss'])
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        content = b''.join([part async for part in response.streaming_content])
+        self.assertEqual(content.decode().count('<item>'), 4)
+
+        cached = await self.async_client.get(url)
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached.content, content)
+
+    @override_settings(NEWS_SITEMAP_CHUNK_SIZE=2)
+    def test_sitemap_is_split_by_id_ranges(self):
+        index = self.content(self.client.get(reverse('news:sitemap')))
+        first, last = min(a.pk for a in self.articles), max(a.pk for a in self.articles) + 1
+        chunks = sorted({(pk - 1) // 2 for pk in range(first, last + 1)})
+        self.assertEqual(index.count('<sitemap>'), len(chunks) + 1)
+        self.assertIn('sitemap-sections.xml', index)
+
+        urls = ''.join(
+            self.content(self.client.get(reverse('news:sitemap_chunk', args=[chunk]))) for chunk in chunks
+        )
+        self.assertEqual(urls.count('<url>'), 4)
+        self.assertIn('<loc>http://testserver/article/article-0/</loc>', urls)
+        self.assertEqual(self.client.get(reverse('news:sitemap_chunk', args=[999])).status_code, 404)
+
+        sections = self.content(self.client.get(reverse('news:sitemap_sections')))
+        self.assertIn('<loc>http://testserver/tag/rpg/</loc>', sections)
+
+
+class TransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg', color='#ff0000')
+        cls.articles = make_articles(3, cls.author, cls.category, [cls.tag])
+
+    def setUp(self):
+        use_shared_cache(self)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_articles', '-', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_round_trip(self):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), '#3498db').save(buffer, 'PNG')
+        name = default_storage.save('articles/cover.png', ContentFile(buffer.getvalue()))
+        Article.objects.filter(pk=self.articles[0].pk).update(thumbnail=name)
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        data = self.export('--media-dir', export_dir)
+        self.assertEqual(len(data.splitlines()), 3)
+
+        Article.objects.all().delete()
+        Tag.objects.all().delete()
+        default_storage.delete(name)
+        path = os.path.join(export_dir, 'articles.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        out = StringIO()
+        call_command('import_articles', path, '--media-dir', export_dir, '--batch-size', '2', stdout=out)
+        self.assertIn('articles: 3', out.getvalue())
+        self.assertIn('media: 1', out.getvalue())
+
+        article = Article.objects.get(slug='article-0')
+        self.assertEqual(article.created_at, self.articles[0].created_at)
+        self.assertIn('Текст 0', article.body_html)
+        self.assertEqual(article.excerpt, 'Текст 0')
+        self.assertEqual(article.thumbnail.name, name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(Tag.objects.get(slug='rpg').published_article_count, 3)
+        self.assertEqual(list(Article.objects.filter(tags__slug='rpg').order_by('slug').values_list('slug', flat=True)),
+                         ['article-0', 'article-1', 'article-2'])
+        # Повторный импорт ничего не дублирует
+        call_command('import_articles', path, stdout=out)
+        self.assertEqual(Article.objects.count(), 3)
+
+    def test_unknown_author_and_bad_json(self):
+        path = os.path.join(tempfile.mkdtemp(), 'articles.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        record = json.loads(self.export().splitlines()[0])
+        record.update(slug='new-article', author='nobody')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        with self.assertRaisesMessage(CommandError, 'nobody'):
+            call_command('import_articles', path, stdout=StringIO())
+        call_command('import_articles', path, '--default-author', 'author', stdout=StringIO())
+        self.assertEqual(Article.objects.get(slug='new-article').author, self.author)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"slug": \n')
+        with self.assertRaisesMessage(CommandError, 'Строка 1'):
+            call_command('import_articles', path, stdout=StringIO())
+
+    def test_media_paths_outside_media_root_are_rejected(self):
+        path = os.path.join(tempfile.mkdtemp(), 'articles.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        for name in ('../../etc/passwd', '/etc/passwd'):
+            record = json.loads(self.export().splitlines()[0])
+            record.update(slug='escaped', thumbnail=name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+            with self.assertRaisesMessage(CommandError, 'Статья escaped: недопустимый путь'):
+                call_command('import_articles', path, '--media-dir', os.path.dirname(path), stdout=StringIO())
+        self.assertFalse(Article.objects.filter(slug='escaped').exists())
+
+
+class AdminChangeListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        tags = [Tag.objects.create(name='RPG', slug='rpg'), Tag.objects.create(name='Инди', slug='indie')]
+        cls.articles = make_articles(3, cls.admin, category, tags)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_replies(self, count):
+        parent = Comment.objects.first()
+        Comment.objects.bulk_create([
+            Comment(article=parent.article, author=self.admin, parent=parent, content=f'Ответ {i}')
+            for i in range(count)
+        ])
+
+    def test_changelist_query_count_does_not_depend_on_rows(self):
+        for name in ('news_comment', 'news_article'):
+            url = reverse(f'admin:{name}_changelist')
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(url)
+            self.add_replies(30)
+            with CaptureQueriesContext(connection) as large:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(small), len(large), name)
+
+    def test_autocomplete_filter(self):
+        article = self.articles[0]
+        url = reverse('admin:news_comment_changelist')
+        response = self.client.get(url, {'article__id__exact': article.pk})
+        self.assertContains(response, 'news-autocomplete-filter')
+        self.assertContains(response, f'<option value="{article.pk}" selected>{article.title}</option>', html=True)
+        self.assertEqual(
+            {c.article_id for c in response.context['cl'].result_list}, {article.pk},
+        )
+        # Списка всех статей в фильтре нет, варианты приходят из autocomplete админки
+        self.assertNotContains(response, f'<option value="{self.articles[1].pk}"')
+        results = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'news', 'model_name': 'comment', 'field_name': 'author', 'term': 'adm',
+        }).json()['results']
+        self.assertEqual(results, [{'id': str(self.admin.pk), 'text': 'admin'}])
+
+    @override_settings(NEWS_ADMIN_COUNT_LIMIT=10)
+    def test_estimated_count_skips_count_on_large_tables(self):
+        self.add_replies(30)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:news_comment_changelist'))
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT COUNT(*)')])
+        self.assertEqual(response.context['cl'].result_count, Comment.objects.aggregate(m=Max('pk'))['m'])
+
+        # С фильтром - счет с ограничением сверху
+        response = self.client.get(reverse('admin:news_comment_changelist'), {'is_approved__exact': '0'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    @override_settings(NEWS_ADMIN_INLINE_COMMENTS=5)
+    def test_comment_inline_shows_latest_comments(self):
+        self.add_replies(30)
+        article = Comment.objects.first().article
+        url = reverse('admin:news_article_change', args=[article.pk])
+        response = self.client.get(url)
+        formset = [f for f in response.context['inline_admin_formsets'] if f.formset.prefix == 'comments'][0]
+        self.assertEqual(len(formset.formset.forms), 5)
+        self.assertContains(response, f'?article__id__exact={article.pk}')
+
+
+class CommentIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.staff = User.objects.create_user('editor', password='pass', is_staff=True)
+        category = Category.objects.create(name='Игры', slug='igry')
+        cls.article, = make_articles(1, cls.author, category)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+        self.url = reverse('news:add_comment', args=[self.article.slug])
+
+    def post(self, content, **data):
+        return self.client.post(
+            self.url, {'content': content, **data}, headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def test_ajax_response_contains_rendered_comment(self):
+        parent = self.article.comments.get(is_approved=True)
+        data = self.post('Ответ через AJAX', parent=parent.pk).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['parent_id'], parent.pk)
+        self.assertIn(f'id="comment-{data["comment_id"]}"', data['html'])
+        self.assertIn('Ответ через AJAX', data['html'])
+        self.assertIn('ответ для author', data['html'])
+
+    def test_duplicate_submission_is_not_saved_twice(self):
+        first = self.post('Двойной клик').json()
+        second = self.post('  двойной   клик ').json()
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(second['comment_id'], first['comment_id'])
+        self.assertEqual(Comment.objects.filter(content='Двойной клик').count(), 1)
+
+        # Без AJAX повтор перенаправляет к уже добавленному комментарию
+        response = self.client.post(self.url, {'content': 'Двойной клик'})
+        self.assertTrue(response['Location'].endswith(f'#comment-{first["comment_id"]}'))
+
+    @override_settings(NEWS_COMMENT_RATE_LIMITS={'user': (2, 60)})
+    def test_rate_limit(self):
+        self.assertTrue(self.post('Раз').json()['success'])
+        self.assertTrue(self.post('Два').json()['success'])
+        response = self.post('Три')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertFalse(Comment.objects.filter(content='Три').exists())
+
+    @override_settings(NEWS_COMMENT_RATE_LIMITS={'user': (1, 60)})
+    def test_invalid_form_does_not_use_rate_limit(self):
+        self.assertFalse(self.post('').json()['success'])
+        self.assertTrue(self.post('Все-таки текст').json()['success'])
+
+    @override_settings(NEWS_TRUSTED_PROXIES=1)
+    def test_client_ip_behind_proxy(self):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8')
+        self.assertEqual(comments.client_ip(request), '5.6.7.8')
+        with override_settings(NEWS_TRUSTED_PROXIES=0):
+            self.assertEqual(comments.client_ip(request), '10.0.0.1')
+        self.assertEqual(comments.client_ip(RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+
+    def test_bulk_moderation(self):
+        hidden = list(Comment.objects.filter(is_approved=False).values_list('pk', flat=True))
+        url = reverse('news:moderate_comments')
+        self.assertEqual(self.client.post(url, {'action': 'approve', 'ids': hidden}).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(url, {'action': 'approve', 'ids': hidden})
+        self.assertEqual(response.json(), {'success': True, 'changed': len(hidden)})
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.approved_comment_count, 2)
+
+        response = self.client.post(url, {'action': 'delete', 'ids': hidden})
+        self.assertEqual(response.json()['changed'], len(hidden))
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.approved_comment_count, 1)
+        self.assertEqual(self.client.post(url, {'action': 'spam', 'ids': hidden}).status_code, 400)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        category = Category.objects.create(name='Игры', slug='igry')
+        other = Category.objects.create(name='Кино', slug='kino')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.articles = make_articles(5, cls.author, category, [cls.tag])
+        make_articles(2, cls.author, other, start=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(f'news:{name}', args=args), params)
+
+    def test_list_pages_with_cursor(self):
+        with self.assertNumQueries(2):
+            data = self.get('api_articles', category='igry', limit=3).json()
+        self.assertEqual([a['slug'] for a in data['results']], ['article-4', 'article-3', 'article-2'])
+        first = data['results'][0]
+        self.assertEqual(first['tags'], ['rpg'])
+        self.assertEqual(first['comment_count'], 1)
+        self.assertEqual(first['url'], 'http://testserver' + self.articles[4].get_absolute_url())
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([a['slug'] for a in data['results']], ['article-1', 'article-0'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(len(self.get('api_articles', tag='rpg', limit=10).json()['results']), 5)
+
+    def test_sparse_fieldsets(self):
+        with self.assertNumQueries(1):
+            data = self.get('api_articles', fields='title,created_at', limit=1).json()
+        self.assertEqual(list(data['results'][0]), ['title', 'created_at'])
+
+        response = self.get('api_articles', fields='title,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+        self.assertEqual(self.get('api_articles', limit=1000).status_code, 400)
+
+    def test_detail(self):
+        data = self.get('api_article', 'article-0').json()
+        self.assertEqual(data['blocks'], [
+            {'block_type': 'text', 'content': 'Текст 0', 'image': None, 'image_caption': ''},
+        ])
+        self.assertIn('Текст 0', data['body_html'])
+        self.assertEqual(self.get('api_article', 'article-0', fields='slug,views').json(), {'slug': 'article-0', 'views': 0})
+
+        response = self.get('api_article', 'missing')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_comment_thread(self):
+        article = self.articles[0]
+        root = article.comments.get(is_approved=True)
+        hidden = article.comments.get(is_approved=False)
+        reply = Comment.objects.create(article=article, author=self.author, parent=root, content='Ответ')
+        Comment.objects.create(article=article, author=self.author, parent=hidden, content='Под скрытым')
+
+        data = self.get('api_comments', article.slug, fields='id,content').json()
+        self.assertEqual(data['results'], [
+            {'id': root.pk, 'content': 'Первый!', 'replies': [{'id': reply.pk, 'content': 'Ответ', 'replies': []}]},
+        ])
+
+    def test_tags_without_queries(self):
+        taxonomy.get_snapshot()
+        with self.assertNumQueries(0):
+            data = self.get('api_tags', fields='slug,article_count').json()
+        self.assertEqual(data['results'], [{'slug': 'rpg', 'article_count': 5}])
+
+    def test_etag_and_encoder_fallback(self):
+        url = reverse('news:api_article', args=['article-1'])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+        cache.clear()
+        with mock.patch.object(api, 'orjson', None):
+            fallback = self.client.get(url)
+        self.assertEqual(json.loads(fallback.content), json.loads(response.content))
+
+
+class SessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        taxonomy.get_snapshot()
+
+    def test_logged_in_request_skips_session_and_user_queries(self):
+        self.client.force_login(self.user)
+        url = reverse('news:about')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_password_change_ends_cached_sessions(self):
+        self.client.force_login(self.user)
+        url = reverse('news:about')
+        self.assertTrue(self.client.get(url).context['user'].is_authenticated)
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertFalse(self.client.get(url).context['user'].is_authenticated)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('news:about'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('news:about'))
+        self.assertEqual(response.context['user'], self.user)
+
+        out = StringIO()
+        call_command('expire_sessions', stdout=out)
+        self.assertIn('удалять нечего', out.getvalue())
+
+    def test_expire_sessions_in_batches(self):
+        model = sessions.session_model()
+        now = timezone.now()
+        for i in range(5):
+            model.objects.create(session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1))
+        model.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('expire_sessions', batch_size=2, stdout=out)
+        self.assertIn('Удалено истекших сессий: 5', out.getvalue())
+        self.assertEqual(list(model.objects.values_list('pk', flat=True)), ['live'])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE')]), 3)
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        overrides = override_settings(
+            STATIC_ROOT=static_root,
+            NEWS_SERVE_STATIC=True,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'news.assets.CompressedManifestStaticFilesStorage',
+            }},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.static_root = static_root
+        self.css = assets.staticfiles_storage.stored_name('news/css/styles.css')
+
+    def wsgi(self, path, **environ):
+        calls = []
+
+        def start_response(status, headers):
+            calls.append((status, dict(headers)))
+
+        app = assets.StaticFilesWSGI(lambda environ, start_response: [b'django'])
+        body = b''.join(app({'PATH_INFO': path, 'REQUEST_METHOD': 'GET', **environ}, start_response))
+        return (calls[0] if calls else (None, {})) + (body,)
+
+    def test_collectstatic_minifies_and_compresses(self):
+        self.assertRegex(self.css, r'^news/css/styles\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.static_root, self.css)
+        with open(path, 'rb') as file:
+            content = file.read()
+        self.assertLess(len(content), os.path.getsize(finders.find('news/css/styles.css')))
+        self.assertNotIn(b'/*', content)
+        with open(path + '.gz', 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), content)
+
+    def test_minify_css_keeps_selector_spaces(self):
+        css = '.a :hover { color : red; }\n@media (max-width: 600px) { .b :first-child { margin: 0 auto; } }'
+        self.assertEqual(
+            assets.minify_css(css),
+            '.a :hover{color:red}@media (max-width: 600px){.b :first-child{margin:0 auto}}\n',
+        )
+
+    def test_wsgi_layer(self):
+        status, headers, body = self.wsgi(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+
+        status, _, _ = self.wsgi(f'/static/{self.css}', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertNotEqual(status, '304 Not Modified')
+        status, _, body = self.wsgi(
+            f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=headers['ETag'],
+        )
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+
+        _, headers, _ = self.wsgi('/static/news/css/styles.css')
+        self.assertEqual(headers['Cache-Control'], 'public, no-cache')
+        self.assertEqual(self.wsgi('/static/missing.css'), (None, {}, b'django'))
+
+    def test_asgi_layer(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def django_app(scope, receive, send):
+            messages.append('django')
+
+        app = assets.StaticFilesASGI(django_app)
+        scope = {'type': 'http', 'method': 'GET', 'path': f'/static/{self.css}', 'headers': []}
+        asyncio.run(app(scope, None, send))
+        start, *body = messages
+        self.assertEqual(start['status'], 200)
+        with open(os.path.join(self.static_root, self.css), 'rb') as file:
+            self.assertEqual(b''.join(part['body'] for part in body), file.read())
+
+        messages.clear()
+        asyncio.run(app({**scope, 'path': '/about/'}, None, send))
+        self.assertEqual(messages, ['django'])
+
+    def test_pages_load_scripts_from_static_files(self):
+        response = self.client.get(reverse('news:about'))
+        self.assertNotContains(response, '<script>')
+        self.assertContains(response, assets.staticfiles_storage.url('news/js/base.js'))
+
+
+class DatabaseSettingsTests(TestCase):
+    def test_sqlite_pragmas_are_applied(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], connection.settings_dict['OPTIONS']['timeout'] * 1000)
+
+    @override_settings(NEWS_SQLITE_PRAGMAS={'cache_size': -1000})
+    def test_settings_override_single_pragmas(self):
+        pragmas = database.sqlite_pragmas()
+        self.assertEqual(pragmas['cache_size'], -1000)
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+
+    @override_settings(NEWS_SQLITE_PRAGMAS={'journal_mode; DROP TABLE x': 'WAL'})
+    def test_invalid_pragma_is_rejected(self):
+        with self.assertRaises(ValueError):
+            database.sqlite_pragmas()
+
+
+@override_settings(NEWS_READ_DATABASES=['replica_1'])
+class ReplicaRouterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.article, = make_articles(1, cls.author, cls.category)
+
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+
+    def read_db(self, model):
+        return self.router.db_for_read(model)
+
+    def test_public_view_reads_go_to_replica(self):
+        seen = {}
+
+        @routers.read_from_replicas
+        def view(request):
+            seen.update(article=self.read_db(Article), comment=self.read_db(Comment), user=self.read_db(User))
+            self.router.db_for_write(Comment)
+            seen['after_write'] = self.read_db(Article)
+
+        view(RequestFactory().get('/'))
+        self.assertEqual(seen['article'], 'replica_1')
+        self.assertIsNone(seen['comment'])
+        self.assertIsNone(seen['user'])
+        self.assertEqual(seen['after_write'], 'default')
+
+    def test_reads_outside_public_views_use_primary(self):
+        self.assertEqual(self.read_db(Article), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('news:add_comment', args=[self.article.slug]), {'content': 'Свой комментарий'},
+        )
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        @routers.read_from_replicas
+        def view(request):
+            return self.read_db(Article)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[routers.PIN_COOKIE] = response.cookies[routers.PIN_COOKIE].value
+        self.assertEqual(view(request), 'default')
+        self.assertEqual(view(RequestFactory().get('/')), 'replica_1')
+
+    def test_page_filled_right_after_change_reads_primary(self):
+        seen = []
+
+        @routers.read_from_replicas
+        def view(request):
+            self.assertIsNone(caching.cached_page(request, 'test', caching.get_versions('articles')))
+            seen.append(self.read_db(Article))
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        caching.bump_versions('articles')
+        view(request)
+        cache.set(caching.MODIFIED_PREFIX + 'articles', int(time.time()) - 60, timeout=None)
+        view(request)
+        self.assertEqual(seen, ['default', 'replica_1'])
+
+    def test_taxonomy_snapshot_reads_primary(self):
+        Tag.objects.create(name='RPG', slug='rpg')
+        taxonomy.invalidate()
+        self.addCleanup(taxonomy.invalidate)
+
+        @routers.read_from_replicas
+        def view(request):
+            return taxonomy.get_snapshot()
+
+        snapshot = view(RequestFactory().get('/'))
+        self.assertEqual({tag._state.db for tag in snapshot.tags}, {'default'})
+
+
+def _async_urlpatterns():
+    """URL сайта, где страницы статей обслуживают асинхронные представления"""
+    from django.contrib import admin
+    from django.urls import include, path
+
+    from . import urls as news_urls
+
+    replaced = {
+        'article_list': async_views.article_list,
+        'articles_by_category': async_views.article_list,
+        'article_detail': async_views.article_detail,
+        'articles_by_tag': async_views.articles_by_tag,
+        'add_comment': async_views.add_comment,
+    }
+    patterns = [
+        path(str(pattern.pattern), replaced.get(pattern.name, pattern.callback), name=pattern.name)
+        for pattern in news_urls.urlpatterns
+    ]
+    return [path('admin/', admin.site.urls), path('', include((patterns, 'news')))]
+
+
+urlpatterns = _async_urlpatterns()
+
+
+@override_settings(ROOT_URLCONF='news.tests')
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.category = Category.objects.create(name='Игры', slug='igry')
+        cls.tag = Tag.objects.create(name='RPG', slug='rpg')
+        cls.articles = make_articles(4, cls.author, cls.category, [cls.tag])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_render(self):
+        article = self.articles[0]
+        response = self.client.get(reverse('news:article_list'), {'page': 2})
+        self.assertContains(response, 'Страница 2 из 2')
+        self.assertContains(response, article.title)
+        self.assertContains(self.client.get(reverse('news:articles_by_category', args=['igry'])), 'Статья 3')
+        self.assertContains(self.client.get(reverse('news:articles_by_tag', args=['rpg'])), 'Текст 3')
+
+        response = self.client.get(reverse('news:article_detail', args=[article.slug]))
+        self.assertContains(response, '<p>Текст 0</p>', html=True)
+        self.assertContains(response, 'Первый!')
+        self.assertContains(response, 'Комментарии (1)')
+        self.assertEqual(self.client.get(reverse('news:article_detail', args=['missing'])).status_code, 404)
+
+    async def test_detail_reads_use_async_orm(self):
+        article = self.articles[0]
+        popular = await ranking.aget_popular_articles(article)
+        self.assertEqual(popular, await sync_to_async(ranking.get_popular_articles)(article))
+        thread = await Comment.objects.athread_for(article)
+        self.assertEqual([comment.content for comment in thread], ['Первый!'])
+        self.assertEqual(thread[0].depth, 0)
+
+    def test_cold_taxonomy_snapshot(self):
+        for url in (reverse('news:articles_by_category', args=['igry']), reverse('news:articles_by_tag', args=['rpg'])):
+            taxonomy.invalidate()
+            cache.clear()
+            self.assertContains(self.client.get(url), 'Статья 3')
+
+    def test_conditional_get_and_page_cache(self):
+        url = reverse('news:article_detail', args=[self.articles[1].slug])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_add_comment(self):
+        article = self.articles[2]
+        parent = article.comments.filter(is_approved=True).get()
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('news:add_comment', args=[article.slug]),
+            {'content': 'Асинхронный ответ', 'parent': parent.pk},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        self.assertTrue(response.json()['success'])
+        comment = Comment.objects.get(pk=response.json()['comment_id'])
+        self.assertEqual((comment.parent, comment.author), (parent, self.author))
+
+        response = self.client.post(reverse('news:add_comment', args=[article.slug]), {'content': ''})
+        self.assertRedirects(response, reverse('news:article_detail', args=[article.slug]), fetch_redirect_response=False)
+
+    def test_add_comment_requires_login(self):
+        response = self.client.post(reverse('news:add_comment', args=[self.articles[0].slug]), {'content': 'x'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comment.objects.filter(content='x').exists())
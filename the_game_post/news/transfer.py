@@ -0,0 +1,314 @@
+"""
+Пакетный импорт и экспорт статей в формате JSONL (одна статья на строку).
+
+Запись статьи:
+    {"slug": ..., "title": ..., "category": {"slug": ..., "name": ...},
+     "author": "username", "created_at": "ISO 8601", "updated_at": "ISO 8601",
+     "is_published": true, "comments_enabled": true, "views": 0,
+     "thumbnail": "путь в MEDIA_ROOT" | null,
+     "tags": [{"slug": ..., "name": ..., "color": ...}],
+     "blocks": [{"block_type": ..., "content": ..., "image": ..., "image_caption": ..., "order": 0}]}
+
+Файл читается и пишется потоком, пачками по batch_size статей, поэтому
+память не зависит от размера файла. Статьи, блоки и связи с тегами каждой
+пачки вставляются через bulk_create в одной транзакции; категории, теги и
+авторы ищутся по словарям slug -> id, которые заполняются по ходу импорта.
+Файлы изображений копируются в пуле потоков. bulk_create не вызывает
+сигналы, поэтому HTML статей, поисковый индекс, счетчики тегов и версии
+кэша обновляются здесь же. Статьи с уже существующим slug пропускаются.
+"""
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.utils import validate_file_name
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, images, search, taxonomy
+from .caching import bump_versions
+from .models import Article, ArticleBlock, Category, Tag
+
+BATCH_SIZE = 500
+MEDIA_WORKERS = 8
+
+
+def _batched(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _datetime(value):
+    return parse_datetime(value) if value else None
+
+
+def article_record(article):
+    """Словарь статьи для JSONL (теги и блоки берутся из prefetch)"""
+    return {
+        'slug': article.slug,
+        'title': article.title,
+        'category': {'slug': article.category.slug, 'name': article.category.name},
+        'author': article.author.username,
+        'created_at': article.created_at.isoformat(),
+        'updated_at': article.updated_at.isoformat(),
+        'is_published': article.is_published,
+        'comments_enabled': article.comments_enabled,
+        'views': article.views,
+        'thumbnail': article.thumbnail.name or None,
+        'tags': [{'slug': tag.slug, 'name': tag.name, 'color': tag.color} for tag in article.tags.all()],
+        'blocks': [
+            {
+                'block_type': block.block_type,
+                'content': block.content,
+                'image': block.image.name or None,
+                'image_caption': block.image_caption,
+                'order': block.order,
+            }
+            for block in article.blocks.all()
+        ],
+    }
+
+
+def _record_media(record):
+    names = [record.get('thumbnail')]
+    names += [block.get('image') for block in record.get('blocks', ())]
+    return [name for name in names if name]
+
+
+def _export_file(name, media_dir):
+    target = os.path.join(media_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with default_storage.open(name, 'rb') as source, open(target, 'wb') as destination:
+        shutil.copyfileobj(source, destination)
+
+
+def _wait(futures):
+    """Дожидается копирования (ошибки пробрасываются), возвращает число файлов"""
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+def export_articles(output, media_dir=None, batch_size=BATCH_SIZE, workers=MEDIA_WORKERS):
+    """
+    Пишет все статьи в output (текстовый файл) построчно. Если указан
+    media_dir, файлы изображений копируются туда с теми же относительными путями.
+    Возвращает {'articles': n, 'media': n}.
+    """
+    articles = Article.objects.select_related('category', 'author').prefetch_related(
+        'tags', Prefetch('blocks', queryset=ArticleBlock.objects.order_by('order', 'id')),
+    ).order_by('pk')
+
+    exported = copied = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='news-export') as pool:
+        futures = []
+        for article in articles.iterator(chunk_size=batch_size):
+            record = article_record(article)
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            exported += 1
+            if media_dir:
+                futures.extend(pool.submit(_export_file, name, media_dir) for name in _record_media(record))
+            if len(futures) >= batch_size:
+                copied += _wait(futures)
+                futures = []
+        copied += _wait(futures)
+    return {'articles': exported, 'media': copied}
+
+
+class ArticleImporter:
+    """Импорт JSONL; словари slug -> id живут все время импорта"""
+
+    def __init__(self, media_dir=None, default_author=None, batch_size=BATCH_SIZE, workers=MEDIA_WORKERS):
+        self.media_dir = media_dir
+        self.default_author = default_author
+        self.batch_size = batch_size
+        self.workers = workers
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.authors = {}
+        self.touched_tags = set()
+        self.taxonomy_changed = False
+        self.stats = {'articles': 0, 'blocks': 0, 'tag_links': 0, 'media': 0, 'skipped': 0}
+
+    def run(self, lines):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='news-import') as pool:
+            self.pool = pool
+            line_number = 0
+            for batch in _batched(lines, self.batch_size):
+                records = []
+                for line in batch:
+                    line_number += 1
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as error:
+                        raise ValueError(f'Строка {line_number}: некорректный JSON ({error})') from error
+                self._import_batch(records)
+
+        counters.refresh_tag_counts(self.touched_tags)
+        bump_versions('articles')
+        if self.taxonomy_changed:
+            taxonomy.changed()
+        return self.stats
+
+    def _new_records(self, records):
+        slugs = [record['slug'] for record in records]
+        existing = set(Article.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        fresh = []
+        for record in records:
+            if record['slug'] in existing:
+                self.stats['skipped'] += 1
+                continue
+            existing.add(record['slug'])
+            fresh.append(record)
+        return fresh
+
+    def _resolve_categories(self, records):
+        missing = {
+            record['category']['slug']: record['category'] for record in records
+            if record['category']['slug'] not in self.categories
+        }
+        if missing:
+            Category.objects.bulk_create(
+                [Category(slug=slug, name=data.get('name') or slug) for slug, data in missing.items()],
+                ignore_conflicts=True,
+            )
+            self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+            self.taxonomy_changed = True
+
+    def _resolve_tags(self, records):
+        missing = {
+            tag['slug']: tag for record in records for tag in record.get('tags', ())
+            if tag['slug'] not in self.tags
+        }
+        if missing:
+            Tag.objects.bulk_create(
+                [
+                    Tag(slug=slug, name=data.get('name') or slug, color=data.get('color') or '#3498db')
+                    for slug, data in missing.items()
+                ],
+                ignore_conflicts=True,
+            )
+            self.tags.update(Tag.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+            self.taxonomy_changed = True
+            conflicts = set(missing) - set(self.tags)
+            if conflicts:
+                # Тег с таким названием уже есть под другим slug
+                raise ValueError(f'Не удалось создать теги: {", ".join(sorted(conflicts))}')
+
+    def _resolve_authors(self, records):
+        missing = {record.get('author') for record in records} - set(self.authors)
+        if missing:
+            self.authors.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+        for username in missing - set(self.authors):
+            if self.default_author is None:
+                raise ValueError(f'Автор {username!r} не найден, укажите автора по умолчанию')
+            self.authors[username] = self.default_author.pk
+
+    def _check_media(self, records):
+        """Пути к файлам из записи не должны выходить за MEDIA_ROOT"""
+        for record in records:
+            for name in _record_media(record):
+                try:
+                    validate_file_name(name, allow_relative_path=True)
+                except SuspiciousFileOperation as error:
+                    raise ValueError(f'Статья {record["slug"]}: недопустимый путь к файлу {name!r}') from error
+
+    def _import_file(self, name):
+        """Копирует файл из media_dir в хранилище и готовит варианты изображения"""
+        if not default_storage.exists(name):
+            with open(os.path.join(self.media_dir, name), 'rb') as source:
+                saved = default_storage.save(name, File(source))
+            if saved != name:
+                raise ValueError(f'Файл {name} сохранен под другим именем: {saved}')
+        images.ensure_derivatives(name)
+
+    def _copy_media(self, records):
+        if not self.media_dir:
+            return
+        names = {name for record in records for name in _record_media(record)}
+        self.stats['media'] += _wait([self.pool.submit(self._import_file, name) for name in names])
+
+    def _import_batch(self, records):
+        records = self._new_records(records)
+        if not records:
+            return
+        self._check_media(records)
+        self._resolve_categories(records)
+        self._resolve_tags(records)
+        self._resolve_authors(records)
+        # Файлы копируются до записи в базу: HTML статей ссылается на варианты изображений
+        self._copy_media(records)
+
+        now = timezone.now()
+        with transaction.atomic():
+            articles = [
+                Article(
+                    slug=record['slug'],
+                    title=record['title'],
+                    category_id=self.categories[record['category']['slug']],
+                    author_id=self.authors[record.get('author')],
+                    is_published=record.get('is_published', True),
+                    comments_enabled=record.get('comments_enabled', True),
+                    views=record.get('views', 0),
+                    thumbnail=record.get('thumbnail') or None,
+                )
+                for record in records
+            ]
+            Article.objects.bulk_create(articles)
+
+            blocks, links = [], []
+            for article, record in zip(articles, records):
+                # auto_now_add/auto_now при вставке ставят текущее время, даты из файла - через bulk_update
+                article.created_at = _datetime(record.get('created_at')) or now
+                article.updated_at = _datetime(record.get('updated_at')) or article.created_at
+                article_blocks = [
+                    ArticleBlock(
+                        article_id=article.pk,
+                        block_type=block['block_type'],
+                        content=block.get('content', ''),
+                        image=block.get('image') or None,
+                        image_caption=block.get('image_caption', ''),
+                        order=block.get('order', 0),
+                    )
+                    for block in record.get('blocks', ())
+                ]
+                article_blocks.sort(key=lambda block: block.order)
+                article.body_html, article.excerpt = Article.render_body(article_blocks)
+                blocks.extend(article_blocks)
+                for tag in record.get('tags', ()):
+                    tag_id = self.tags[tag['slug']]
+                    links.append(Article.tags.through(article_id=article.pk, tag_id=tag_id))
+                    self.touched_tags.add(tag_id)
+
+            Article.objects.bulk_update(articles, ['created_at', 'updated_at', 'body_html', 'excerpt'])
+            ArticleBlock.objects.bulk_create(blocks, batch_size=self.batch_size)
+            Article.tags.through.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+
+        search.index_articles([article.pk for article in articles])
+        self.stats['articles'] += len(articles)
+        self.stats['blocks'] += len(blocks)
+        self.stats['tag_links'] += len(links)
+
+
+def import_articles(lines, media_dir=None, default_author=None, batch_size=BATCH_SIZE, workers=MEDIA_WORKERS):
+    """
+    Импортирует статьи из итерируемого набора строк JSONL. Возвращает
+    {'articles', 'blocks', 'tag_links', 'media', 'skipped'}.
+    """
+    importer = ArticleImporter(media_dir, default_author, batch_size, workers)
+    return importer.run(lines)
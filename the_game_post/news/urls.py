@@ -1,6 +1,13 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from django.contrib.auth import views as auth_views
 from .views import *
+from .feeds import article_feed, sitemap_chunk, sitemap_index, sitemap_sections
+from . import api
+
+if getattr(settings, 'NEWS_ASYNC_VIEWS', False):
+    # Асинхронные версии страниц для запуска под ASGI (news/async_views.py)
+    from .async_views import add_comment, article_detail, article_list, articles_by_tag
 
 app_name = 'news'
 
@@ -11,7 +18,24 @@ urlpatterns = [
     path('tag/<slug:tag_slug>/', articles_by_tag, name='articles_by_tag'),
     path('article/<slug:slug>/comment/', add_comment, name='add_comment'),
     path('comment/<int:comment_id>/delete/', delete_comment, name='delete_comment'),
+    path('comments/moderate/', moderate_comments, name='moderate_comments'),
+    path('search/', search_articles, name='search'),
     path('about/', about, name='about'),
+    path('profiling/', profiling_stats, name='profiling_stats'),
+
+    # Ленты и карта сайта (news/feeds.py)
+    re_path(r'^feeds/(?P<fmt>rss|atom)/$', article_feed, name='feed'),
+    re_path(r'^feeds/(?P<fmt>rss|atom)/category/(?P<category_slug>[-\w]+)/$', article_feed, name='category_feed'),
+    re_path(r'^feeds/(?P<fmt>rss|atom)/tag/(?P<tag_slug>[-\w]+)/$', article_feed, name='tag_feed'),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-sections.xml', sitemap_sections, name='sitemap_sections'),
+    path('sitemap-<int:chunk>.xml', sitemap_chunk, name='sitemap_chunk'),
+
+    # JSON API (news/api.py)
+    path('api/v1/articles/', api.article_list, name='api_articles'),
+    path('api/v1/articles/<slug:slug>/', api.article_detail, name='api_article'),
+    path('api/v1/articles/<slug:slug>/comments/', api.article_comments, name='api_comments'),
+    path('api/v1/tags/', api.tag_list, name='api_tags'),
 
     # Авторизация
     path('register/', register, name='register'),
@@ -0,0 +1,221 @@
+"""
+Буферизованный счетчик просмотров статей.
+
+Просмотры не пишутся в базу на каждый запрос: они копятся в буфере
+(в памяти процесса или в общем кэше) и периодически сбрасываются в базу
+пакетными UPDATE вида ``views = views + n``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class LocalViewBuffer:
+    """Буфер просмотров в памяти текущего процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+
+    def add(self, article_id, count=1):
+        with self._lock:
+            self._hits[article_id] += count
+            return self._hits[article_id]
+
+    def pending(self, article_id):
+        return self._hits.get(article_id, 0)
+
+    def drain(self):
+        """Забирает накопленные просмотры и очищает буфер"""
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+        return hits
+
+    def restore(self, hits):
+        """Возвращает просмотры в буфер, если сброс не удался"""
+        with self._lock:
+            self._hits.update(hits)
+
+
+class CacheViewBuffer:
+    """
+    Буфер просмотров в общем кэше, виден всем процессам.
+
+    Статья, у которой счетчик становится ненулевым, записывается в журнал
+    измененных: ключ dirty:<n>, где n выдает атомарный incr. Сброс читает
+    только записи журнала после последней обработанной, поэтому его
+    стоимость зависит от числа просмотренных статей, а не от размера таблицы.
+    """
+
+    key_prefix = 'news:views:'
+    dirty_prefix = 'news:views:dirty:'
+    sequence_key = 'news:views:dirty-seq'
+    position_key = 'news:views:dirty-drained'
+    lock_key = 'news:views:drain-lock'
+    lock_timeout = 60
+
+    def _key(self, article_id):
+        return f'{self.key_prefix}{article_id}'
+
+    def add(self, article_id, count=1):
+        key = self._key(article_id)
+        try:
+            total = cache.incr(key, count)
+        except ValueError:
+            if cache.add(key, count, timeout=None):
+                total = count
+            else:
+                total = cache.incr(key, count)
+        if total == count:
+            # Счетчик был пустым: статьи еще нет в журнале
+            self._mark_dirty(article_id)
+        return total
+
+    def _mark_dirty(self, article_id):
+        try:
+            number = cache.incr(self.sequence_key)
+        except ValueError:
+            cache.add(self.sequence_key, 0, timeout=None)
+            number = cache.incr(self.sequence_key)
+        cache.set(f'{self.dirty_prefix}{number}', article_id, timeout=None)
+
+    def pending(self, article_id):
+        return cache.get(self._key(article_id), 0)
+
+    def drain(self):
+        """
+        Забирает накопленные просмотры. Счетчики в кэше уменьшаются
+        атомарным decr на прочитанное значение, поэтому просмотры,
+        пришедшие во время сброса, не теряются. Одновременно сбрасывает
+        только один процесс, остальные получают пустой результат.
+        """
+        if not cache.add(self.lock_key, 1, timeout=self.lock_timeout):
+            return Counter()
+        try:
+            return self._drain_dirty()
+        finally:
+            cache.delete(self.lock_key)
+
+    def _drain_dirty(self):
+        last = cache.get(self.sequence_key, 0)
+        position, retry = cache.get(self.position_key, (0, ()))
+        numbers = [*retry, *range(position + 1, last + 1)]
+        hits = Counter()
+        missing = []
+        for start in range(0, len(numbers), FLUSH_BATCH_SIZE):
+            keys = {f'{self.dirty_prefix}{n}': n for n in numbers[start:start + FLUSH_BATCH_SIZE]}
+            found = cache.get_many(keys)
+            # Номер уже выдан, а id еще не записан: повторяем один раз на следующем сбросе
+            missing += [n for key, n in keys.items() if key not in found and n > position]
+            hits.update(self._drain_batch(set(found.values())))
+            cache.delete_many(list(found))
+        cache.set(self.position_key, (last, tuple(missing)), timeout=None)
+        return hits
+
+    def _drain_batch(self, article_ids):
+        keys = {self._key(article_id): article_id for article_id in article_ids}
+        drained = {}
+        for key, count in cache.get_many(keys).items():
+            if count:
+                # Просмотр между get и decr не попал в журнал: возвращаем статью туда
+                if cache.decr(key, count):
+                    self._mark_dirty(keys[key])
+                drained[keys[key]] = count
+        return drained
+
+    def restore(self, hits):
+        for article_id, count in hits.items():
+            self.add(article_id, count)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_flusher = None
+
+
+def get_view_buffer():
+    """Возвращает буфер, выбранный настройкой NEWS_VIEW_BUFFER ('local' или 'cache')"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backend = getattr(settings, 'NEWS_VIEW_BUFFER', 'local')
+                _buffer = CacheViewBuffer() if backend == 'cache' else LocalViewBuffer()
+    return _buffer
+
+
+def record_view(article_id):
+    """
+    Учитывает один просмотр статьи без обращения к базе.
+    Возвращает число еще не сброшенных просмотров этой статьи.
+    """
+    return get_view_buffer().add(article_id)
+
+
+def flush_views(buffer=None):
+    """Сбрасывает накопленные просмотры в базу, возвращает их количество"""
+    from .models import Article
+
+    buffer = buffer or get_view_buffer()
+    hits = buffer.drain()
+    if not hits:
+        return 0
+
+    # Статьи с одинаковым приростом обновляются одним запросом
+    by_increment = defaultdict(list)
+    for article_id, count in hits.items():
+        by_increment[count].append(article_id)
+
+    try:
+        with transaction.atomic():
+            for count, article_ids in by_increment.items():
+                for start in range(0, len(article_ids), FLUSH_BATCH_SIZE):
+                    Article.objects.filter(
+                        pk__in=article_ids[start:start + FLUSH_BATCH_SIZE]
+                    ).update(views=F('views') + count)
+    except Exception:
+        buffer.restore(hits)
+        raise
+    return sum(hits.values())
+
+
+class _Flusher(threading.Thread):
+    """Фоновый поток, периодически сбрасывающий буфер просмотров"""
+
+    def __init__(self, interval):
+        super().__init__(name='news-view-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                flush_views()
+            except Exception:
+                logger.exception('Не удалось сбросить просмотры в базу')
+            finally:
+                close_old_connections()
+
+
+def start_view_flusher():
+    """
+    Запускает периодический сброс просмотров в фоне.
+    Вызывается из точек входа WSGI/ASGI; интервал задается NEWS_VIEW_FLUSH_INTERVAL.
+    """
+    global _flusher
+    interval = getattr(settings, 'NEWS_VIEW_FLUSH_INTERVAL', 10)
+    if _flusher is not None or not interval:
+        return
+    _flusher = _Flusher(interval)
+    _flusher.start()
+    atexit.register(flush_views)
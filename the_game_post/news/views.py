@@ -1,11 +1,22 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponseForbidden
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .models import Article, Tag, Comment, Category
 from .forms import CommentForm, RegisterForm
+from .pagination import CursorPaginator, use_cursor_pagination
+from .ranking import get_popular_articles
+from .routers import read_from_replicas, read_primary_if_changed
+from .search import ArticleSearch
+from .view_counter import record_view
+from . import caching, comments, profiling, taxonomy
+
+ARTICLES_PER_PAGE = 3
+SEARCH_RESULTS_PER_PAGE = 10
 
 
 def register(request):
@@ -44,19 +55,49 @@ def custom_logout(request):
     return redirect('news:article_list')
 
 
-def get_common_context():
-    """Возвращает общий контекст для нескольких представлений"""
-    return {
-        'all_tags': Tag.objects.all()
-    }
+def get_category_or_404(slug):
+    """Категория из снимка процесса; новая, еще не попавшая в снимок, - из базы"""
+    return taxonomy.get_snapshot().get_category(slug) or get_object_or_404(Category, slug=slug)
+
 
+def get_tag_or_404(slug):
+    return taxonomy.get_snapshot().get_tag(slug) or get_object_or_404(Tag, slug=slug)
 
+
+def _cached_article_page(request, slug, versions):
+    """Как caching.cached_page для страницы статьи, но с учетом просмотра"""
+    cache_key = caching.page_cache_key(request, 'article_detail', versions)
+    not_modified = caching.not_modified_response(request, 'article_detail', versions)
+    if not_modified:
+        # Повторный визит тоже просмотр; id статьи берем из кэша страницы, если он есть
+        cached = caching.get_cached_page(cache_key)
+        if cached:
+            article_id = cached['article_id']
+        else:
+            article_id = Article.objects.published().filter(slug=slug).values_list('pk', flat=True).first()
+        if article_id:
+            record_view(article_id)
+        return not_modified
+    cached = caching.get_cached_page(cache_key)
+    if cached:
+        record_view(cached['article_id'])
+        return caching.patch_validators(request, caching.response_from_cache(cached), 'article_detail', versions)
+    read_primary_if_changed(versions.last_modified)
+    return None
+
+
+@read_from_replicas
 def article_list(request, category_slug=None):
-    articles_list = Article.objects.filter(is_published=True)
+    versions = caching.get_versions('articles', 'comments', 'taxonomy')
+    cached = caching.cached_page(request, 'article_list', versions)
+    if cached:
+        return cached
+
+    articles_list = Article.objects.published().with_list_data().defer('body_html')
     
     # Фильтрация по категории
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
+        category = get_category_or_404(category_slug)
         articles_list = articles_list.filter(category=category)
         current_category = category
     else:
@@ -67,148 +108,174 @@ def article_list(request, category_slug=None):
     if tag_slug:
         articles_list = articles_list.filter(tags__slug=tag_slug)
     
-    # Пагинация - 10 статей на страницу
-    paginator = Paginator(articles_list, 3)
-    page = request.GET.get('page')
+    # Курсорная пагинация: без COUNT(*) и OFFSET, глубокие страницы не дороже первой
+    cursor_mode = use_cursor_pagination(request)
+    if cursor_mode:
+        articles = CursorPaginator(articles_list, ARTICLES_PER_PAGE).page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(articles_list, ARTICLES_PER_PAGE)
+        page = request.GET.get('page')
+        
+        try:
+            articles = paginator.page(page)
+        except PageNotAnInteger:
+            # Если page не число, показываем первую страницу
+            articles = paginator.page(1)
+        except EmptyPage:
+            # Если page вне диапазона, показываем последнюю страницу
+            articles = paginator.page(paginator.num_pages)
     
-    try:
-        articles = paginator.page(page)
-    except PageNotAnInteger:
-        # Если page не число, показываем первую страницу
-        articles = paginator.page(1)
-    except EmptyPage:
-        # Если page вне диапазона, показываем последнюю страницу
-        articles = paginator.page(paginator.num_pages)
-    
-    all_tags = Tag.objects.all()
-    categories = Category.objects.all()
-    
-    return render(request, 'news/article_list.html', {
+    # Теги и категории добавляет контекстный процессор taxonomy_snapshot
+    context = caching.cache_context(versions)
+    context.update({
         'articles': articles,
-        'categories': categories,
+        'cursor_mode': cursor_mode,
         'current_category': current_category,
         'current_tag': tag_slug,
-        'all_tags': all_tags
     })
+    response = render(request, 'news/article_list.html', context)
+    return caching.finish_page(request, response, 'article_list', versions)
 
 
+@read_from_replicas
 def article_detail(request, slug):
     """Детальная страница статьи с комментариями"""
-    article = get_object_or_404(Article, slug=slug, is_published=True)
+    versions = caching.get_versions('articles', 'taxonomy', caching.article_scope(slug))
+    cached = _cached_article_page(request, slug, versions)
+    if cached:
+        return cached
+
+    article = get_object_or_404(Article.objects.published().with_list_data(), slug=slug)
+
+    # Отправка комментария формой: страница после нее не рендерится
+    if request.method == 'POST' and article.comments_enabled:
+        return handle_comment_submission(request, article)
     
     # Увеличиваем счетчик просмотров
     article.increment_views()
     
-    # Получаем популярные статьи (исключая текущую)
-    popular_articles = Article.objects.filter(
-        is_published=True
-    ).exclude(id=article.id).order_by('-views')[:5]
-    
-    # Получаем комментарии к статье (только одобренные и корневые)
-    comments = article.comments.filter(is_approved=True, parent__isnull=True)
+    # Популярные статьи (исключая текущую) из заранее посчитанного рейтинга
+    popular_articles = get_popular_articles(article)
     
-    # Обработка комментариев
-    comment_form = CommentForm()
-    if request.method == 'POST' and article.comments_enabled:
-        return _handle_comment_submission(request, article)
+    # Дерево одобренных комментариев собирается в памяти из одного запроса
+    thread = Comment.objects.thread_for(article)
     
-    context = get_common_context()
+    context = caching.cache_context(versions)
     context.update({
         'article': article,
         'popular_articles': popular_articles,
-        'comments': comments,
-        'comment_form': comment_form,
+        'comments': thread,
+        'comment_form': CommentForm(),
     })
     
-    return render(request, 'news/article_detail.html', context)
+    response = render(request, 'news/article_detail.html', context)
+    return caching.finish_page(request, response, 'article_detail', versions, article_id=article.pk)
 
 
+@read_from_replicas
 def articles_by_tag(request, tag_slug):
     """Показывает статьи по определенному тегу"""
-    tag = get_object_or_404(Tag, slug=tag_slug)
-    articles = Article.objects.filter(tags=tag, is_published=True)
+    versions = caching.get_versions('articles', 'comments', 'taxonomy')
+    cached = caching.cached_page(request, 'articles_by_tag', versions)
+    if cached:
+        return cached
+
+    tag = get_tag_or_404(tag_slug)
+    articles_list = Article.objects.published().filter(tags=tag).with_list_data().defer('body_html')
+    articles = CursorPaginator(articles_list, ARTICLES_PER_PAGE).page(request.GET.get('cursor'))
     
-    context = get_common_context()
+    context = caching.cache_context(versions)
     context.update({
         'articles': articles,
         'tag': tag,
     })
     
-    return render(request, 'news/articles_by_tag.html', context)
+    response = render(request, 'news/articles_by_tag.html', context)
+    return caching.finish_page(request, response, 'articles_by_tag', versions)
+
+
+def _comment_html(request, comment):
+    comments.prepare_for_display(comment)
+    return render_to_string('news/comment.html', {'comment': comment}, request=request)
+
+
+def _comment_json(request, comment, message='Комментарий добавлен!'):
+    return JsonResponse({
+        'success': True,
+        'comment_id': comment.id,
+        'parent_id': comment.parent_id,
+        'message': message,
+        'html': _comment_html(request, comment),
+    })
+
+
+def _rejected_json(error):
+    if isinstance(error, comments.DuplicateComment):
+        # Повторная отправка (двойной клик): комментарий уже на странице
+        return JsonResponse({'success': True, 'duplicate': True, 'comment_id': error.comment_id,
+                             'message': error.message})
+    response = JsonResponse({'success': False, 'message': error.message, 'errors': error.errors},
+                            status=error.status if error.status == 429 else 200)
+    if isinstance(error, comments.RateLimited):
+        response['Retry-After'] = str(error.retry_after)
+    return response
 
 
-def _handle_comment_submission(request, article):
-    """Обработка отправки комментария (вспомогательная функция)"""
+def _comment_redirect(article, comment_id=None):
+    response = redirect('news:article_detail', slug=article.slug)
+    if comment_id:
+        response['Location'] += f'#comment-{comment_id}'
+    return response
+
+
+def handle_comment_submission(request, article):
+    """Обработка отправки комментария формой на странице статьи"""
     if not request.user.is_authenticated:
         messages.error(request, 'Для добавления комментария необходимо авторизоваться!')
         return redirect('news:article_detail', slug=article.slug)
-    
-    form = CommentForm(request.POST)
-    if not form.is_valid():
-        messages.error(request, 'Ошибка при добавлении комментария. Проверьте форму.')
+
+    try:
+        comment = comments.submit_comment(article, request.user, request.POST, comments.client_ip(request))
+    except comments.DuplicateComment as error:
+        return _comment_redirect(article, error.comment_id)
+    except comments.CommentRejected as error:
+        messages.error(request, error.message)
         return redirect('news:article_detail', slug=article.slug)
-    
-    comment = form.save(commit=False)
-    comment.article = article
-    comment.author = request.user
-    
-    # Обработка родительского комментария
-    parent_id = request.POST.get('parent')
-    if parent_id:
-        try:
-            parent_comment = Comment.objects.get(id=parent_id, article=article)
-            comment.parent = parent_comment
-        except Comment.DoesNotExist:
-            pass
-    
-    comment.save()
+
     messages.success(request, 'Ваш комментарий добавлен!')
-    return redirect('news:article_detail', slug=article.slug)
+    return _comment_redirect(article, comment.pk)
 
 
 @login_required
 def add_comment(request, slug):
-    """Отдельный обработчик для AJAX добавления комментариев"""
+    """
+    Добавление комментария. AJAX-запрос получает JSON с готовым HTML
+    комментария, чтобы не перезагружать страницу статьи.
+    """
     article = get_object_or_404(Article, slug=slug, is_published=True)
-    
-    if request.method == 'POST' and article.comments_enabled:
-        form = CommentForm(request.POST)
-        if form.is_valid():
-            comment = form.save(commit=False)
-            comment.article = article
-            comment.author = request.user
-            
-            # Обработка родительского комментария
-            parent_id = request.POST.get('parent')
-            if parent_id:
-                try:
-                    parent_comment = Comment.objects.get(id=parent_id, article=article)
-                    comment.parent = parent_comment
-                except Comment.DoesNotExist:
-                    pass
-            
-            comment.save()
-            
-            # Обработка AJAX запроса
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return JsonResponse({
-                    'success': True,
-                    'comment_id': comment.id,
-                    'message': 'Комментарий добавлен!'
-                })
-            else:
-                messages.success(request, 'Комментарий добавлен!')
-        else:
-            # Обработка ошибок AJAX
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return JsonResponse({
-                    'success': False,
-                    'errors': form.errors
-                })
-            else:
-                messages.error(request, 'Ошибка при добавлении комментария!')
-    
-    return redirect('news:article_detail', slug=article.slug)
+    return add_comment_response(request, article)
+
+
+def add_comment_response(request, article):
+    """Общая часть синхронного и асинхронного add_comment"""
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    if request.method != 'POST':
+        return redirect('news:article_detail', slug=article.slug)
+
+    try:
+        comment = comments.submit_comment(article, request.user, request.POST, comments.client_ip(request))
+    except comments.CommentRejected as error:
+        if is_ajax:
+            return _rejected_json(error)
+        if isinstance(error, comments.DuplicateComment):
+            return _comment_redirect(article, error.comment_id)
+        messages.error(request, error.message)
+        return redirect('news:article_detail', slug=article.slug)
+
+    if is_ajax:
+        return _comment_json(request, comment)
+    messages.success(request, 'Комментарий добавлен!')
+    return _comment_redirect(article, comment.pk)
 
 
 @login_required
@@ -230,6 +297,41 @@ def delete_comment(request, comment_id):
     
     return redirect('news:article_detail', slug=article_slug)
 
+@read_from_replicas
+def search_articles(request):
+    """Полнотекстовый поиск по статьям с подсветкой совпадений"""
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(ArticleSearch(query), SEARCH_RESULTS_PER_PAGE)
+    results = paginator.get_page(request.GET.get('page'))
+
+    return render(request, 'news/search.html', {
+        'query': query,
+        'results': results,
+    })
+
+
+@staff_member_required
+def profiling_stats(request):
+    """Перцентили времени, числа запросов и размера ответа по именам URL"""
+    return JsonResponse(
+        {'views': profiling.stats.summary()},
+        json_dumps_params={'ensure_ascii': False, 'indent': 2},
+    )
+
+
+@staff_member_required
+def moderate_comments(request):
+    """Пакетная модерация: POST с action (approve, disapprove, delete) и списком ids"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Неверный метод запроса'}, status=405)
+    action = request.POST.get('action')
+    ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+    if action not in comments.MODERATION_ACTIONS or not ids:
+        return JsonResponse({'success': False, 'message': 'Укажите действие и комментарии'}, status=400)
+    changed = comments.moderate(Comment.objects.filter(pk__in=ids), action)
+    return JsonResponse({'success': True, 'changed': changed})
+
+
 def about(request):
     """Страница информации о сайте"""
     return render(request, 'news/about.html')
\ No newline at end of file
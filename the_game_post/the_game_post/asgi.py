@@ -12,5 +12,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'the_game_post.settings')
+# Под ASGI страницы статей обслуживают асинхронные представления
+os.environ.setdefault('NEWS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+from news.assets import StaticFilesASGI  # noqa: E402
+from news.ranking import start_ranking_refresher  # noqa: E402
+from news.view_counter import start_view_flusher  # noqa: E402
+
+# Собранная статика (collectstatic) отдается до Django, см. NEWS_SERVE_STATIC
+application = StaticFilesASGI(application)
+start_view_flusher()
+start_ranking_refresher()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'news.profiling.ProfilingMiddleware',
+    'news.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'news.context_processors.taxonomy_snapshot',
             ],
         },
     },
@@ -73,13 +77,91 @@ WSGI_APPLICATION = 'the_game_post.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# По умолчанию SQLite в режиме WAL (PRAGMA задаются в news/database.py,
+# отличия от них - в NEWS_SQLITE_PRAGMAS). DATABASE_BACKEND=postgresql в
+# окружении переключает на PostgreSQL с пулом соединений (нужен пакет psycopg[pool]).
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'sqlite')
+
+if DATABASE_BACKEND == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'the_game_post'),
+            'USER': os.environ.get('POSTGRES_USER', 'the_game_post'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # С пулом соединения переиспользует пул, CONN_MAX_AGE должен быть 0
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Постоянные соединения: PRAGMA и открытие файла не на каждый запрос
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Ожидание блокировки вместо мгновенной ошибки "database is locked"
+                'timeout': 20,
+                # Транзакция сразу берет блокировку на запись: иначе попытка
+                # повысить блокировку в середине транзакции падает без ожидания
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Реплики для чтения: DATABASE_REPLICAS=<число> в окружении добавляет алиасы
+# replica_1..N. Для SQLite это копии db_replica_<n>.sqlite3, которые
+# обновляются командой sync_replicas; для PostgreSQL адрес реплики задается
+# в POSTGRES_REPLICA_<n>_HOST. Маршрутизация - news/routers.py
+DATABASE_REPLICAS = int(os.environ.get('DATABASE_REPLICAS', 0))
+for number in range(1, DATABASE_REPLICAS + 1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DATABASE_BACKEND == 'postgresql':
+        replica['HOST'] = os.environ.get(f'POSTGRES_REPLICA_{number}_HOST', replica['HOST'])
+    else:
+        replica['NAME'] = BASE_DIR / f'db_replica_{number}.sqlite3'
+    DATABASES[f'replica_{number}'] = replica
+
+DATABASE_ROUTERS = ['news.routers.ReplicaRouter']
+NEWS_READ_DATABASES = [alias for alias in DATABASES if alias.startswith('replica_')]
+# Сколько секунд после записи клиент читает только из основной базы
+NEWS_REPLICA_PIN_SECONDS = 15
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Для нескольких процессов на одной машине подойдет
+# 'django.core.cache.backends.filebased.FileBasedCache' с LOCATION = BASE_DIR / 'cache'.
+# Команды, которые сбрасывают кэш сервера (import_articles, compile_articles,
+# reconcile_counters, refresh_popular), с locmem не запускаются
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'the-game-post',
     }
 }
 
+# Кэш страниц и фрагментов (см. news/caching.py)
+NEWS_CACHE_ALIAS = 'default'
+NEWS_PAGE_CACHE_TIMEOUT = 300
+NEWS_FRAGMENT_CACHE_TIMEOUT = 3600
+# Cache-Control анонимных страниц: max-age для браузера (0 - всегда перепроверять
+# по ETag/Last-Modified) и s-maxage для обратного прокси
+NEWS_BROWSER_CACHE_TIMEOUT = 0
+NEWS_PROXY_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,4 +213,104 @@ LOGOUT_REDIRECT_URL = '/'
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',  # для глобальных статических файлов
-]
\ No newline at end of file
+]
+
+# Сборка статики (news/assets.py): collectstatic кладет файлы в STATIC_ROOT с
+# хэшем содержимого в имени, сжимает CSS/JS приложения и готовит .gz/.br копии
+# (.br - при установленном пакете brotli). Без DEBUG их отдает слой из
+# wsgi.py/asgi.py с Cache-Control на NEWS_STATIC_MAX_AGE секунд
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'news.assets.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+NEWS_SERVE_STATIC = not DEBUG
+NEWS_STATIC_MAX_AGE = 365 * 24 * 3600
+
+# Счетчик просмотров: 'local' - буфер в памяти процесса,
+# 'cache' - общий буфер в кэше (для нескольких процессов, сбрасывается командой flush_views)
+NEWS_VIEW_BUFFER = 'local'
+# Интервал фонового сброса просмотров в базу, секунды (0 - не запускать поток)
+NEWS_VIEW_FLUSH_INTERVAL = 10
+
+# Максимальная глубина ветки комментариев (корневой комментарий - уровень 0)
+NEWS_COMMENT_MAX_DEPTH = 5
+
+# Пагинация лент статей: 'page' - номера страниц, 'cursor' - курсорная (без COUNT/OFFSET)
+NEWS_PAGINATION = 'page'
+
+# Длина списков популярных статей (общего, по категориям и тегам), см. news/ranking.py.
+# Рейтинг пересчитывает фоновый поток сервера раз в NEWS_POPULAR_REFRESH_INTERVAL
+# секунд (0 - не запускать поток; тогда нужна команда refresh_popular из cron)
+NEWS_POPULAR_SIZE = 10
+NEWS_POPULAR_REFRESH_INTERVAL = 300
+
+# Уменьшенные копии изображений для srcset (news/images.py)
+NEWS_IMAGE_WIDTHS = (320, 640, 1280)
+NEWS_IMAGE_WORKERS = 2
+
+# Профилирование запросов (news/profiling.py): запись в лог 'news.profiling'
+# и статистика по URL на /profiling/ (для персонала). Размер окна - на каждый URL
+NEWS_PROFILING = False
+NEWS_PROFILING_WINDOW = 500
+
+# PRAGMA для каждого нового соединения SQLite: значения по умолчанию - в
+# news/database.py, здесь только отличия от них. Ожидание блокировки задается
+# 'timeout' в OPTIONS базы выше
+NEWS_SQLITE_PRAGMAS = {}
+
+# Асинхронные представления страниц статей (news/async_views.py). Включаются
+# при запуске под ASGI (asgi.py выставляет NEWS_ASYNC_VIEWS=1), например:
+#   uvicorn the_game_post.asgi:application --workers 4
+# (uvicorn не входит в обязательные зависимости, см. requirements.txt)
+NEWS_ASYNC_VIEWS = os.environ.get('NEWS_ASYNC_VIEWS', '0') == '1'
+
+# Как часто (в секундах) процесс сверяет свой снимок тегов и категорий с версией
+# в общем кэше (news/taxonomy.py): это и есть наибольшая задержка для других процессов
+NEWS_TAXONOMY_CHECK_INTERVAL = 5
+# Наибольший возраст снимка в секундах: с кэшем в памяти процесса (locmem) версии
+# других процессов не видны, и снимок перезагружается хотя бы так часто
+NEWS_TAXONOMY_MAX_AGE = 300
+
+# Ленты RSS/Atom и карта сайта (news/feeds.py): статей в ленте и статей в одной
+# части карты сайта (протокол sitemaps допускает до 50 000 адресов в файле)
+NEWS_FEED_SIZE = 50
+NEWS_SITEMAP_CHUNK_SIZE = 10000
+# Ленты и части карты сайта больше этого размера (в байтах) не кэшируются
+NEWS_STREAMING_CACHE_MAX_SIZE = 1024 * 1024
+
+# Админка (news/admin.py): сколько строк списка считать точно (дальше - оценка
+# без COUNT(*)) и сколько последних комментариев показывать на странице статьи
+NEWS_ADMIN_COUNT_LIMIT = 10000
+NEWS_ADMIN_INLINE_COMMENTS = 20
+
+# Прием комментариев (news/comments.py): корзины токенов для пользователя и IP
+# задаются в comments.DEFAULT_RATE_LIMITS, NEWS_COMMENT_RATE_LIMITS их заменяет
+# ({} - без ограничений). NEWS_COMMENT_DUPLICATE_WINDOW - окно (в секундах), в
+# котором повторная отправка того же текста считается дублем.
+# NEWS_TRUSTED_PROXIES - сколько обратных прокси перед сервером добавляют адрес в
+# X-Forwarded-For; 0 - адрес клиента берется из REMOTE_ADDR
+NEWS_TRUSTED_PROXIES = int(os.environ.get('NEWS_TRUSTED_PROXIES', 0))
+NEWS_COMMENT_DUPLICATE_WINDOW = 600
+
+# JSON API (news/api.py): статей на странице по умолчанию и наибольший ?limit=
+NEWS_API_PAGE_SIZE = 20
+NEWS_API_MAX_PAGE_SIZE = 100
+
+# Сессии (news/sessions.py). NEWS_SESSION_ENGINE в окружении: cached_db (по
+# умолчанию - сессия читается из кэша, база только при промахе), db, cache или
+# signed_cookies (сессия в подписанной cookie, без базы и кэша). Для cached_db и
+# cache при нескольких процессах нужен общий кэш (см. CACHES)
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('NEWS_SESSION_ENGINE', 'cached_db')
+SESSION_CACHE_ALIAS = NEWS_CACHE_ALIAS
+
+# Пользователь сессии берется из кэша; запись сбрасывается при изменении пользователя
+AUTHENTICATION_BACKENDS = ['news.sessions.CachedModelBackend']
+NEWS_USER_CACHE_TIMEOUT = 300
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'the_game_post.settings')
 
 application = get_wsgi_application()
+
+from news.assets import StaticFilesWSGI  # noqa: E402
+from news.ranking import start_ranking_refresher  # noqa: E402
+from news.view_counter import start_view_flusher  # noqa: E402
+
+# Собранная статика (collectstatic) отдается до Django, см. NEWS_SERVE_STATIC
+application = StaticFilesWSGI(application)
+start_view_flusher()
+start_ranking_refresher()